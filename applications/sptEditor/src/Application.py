@@ -15,10 +15,13 @@ import yaml
 import os.path
 import sys
 import optparse
+import multiprocessing
 
 import model.tracks
 import model.groups
 import model.scenery
+import db.rtxfile
+import db.sptfile
 import ui.editor
 import ui.dialog
 import ui.palette
@@ -38,6 +41,9 @@ ID_MAIN_FRAME = wx.ID_HIGHEST         + 5
 ID_MODE_TRACK_NORMAL = wx.ID_HIGHEST  + 6
 ID_MODE_TRACK_CLOSURE = wx.ID_HIGHEST + 7
 
+SCENERY_WILDCARD = "Textual format (*.*)|*.*|Binary format (*%s)|*%s" \
+    % (db.sptfile.SCENERY_FILE_EXTENSION, db.sptfile.SCENERY_FILE_EXTENSION)
+
 NAME_TRACK_PALETTE = "Track palette"
 NAME_TRACTION_PALETTE = "Traction palette"
 NAME_MAIN_EDITOR_TOP_VIEW = "Main Window"
@@ -118,6 +124,8 @@ class MainWindow(wx.Frame):
         self.workingDirectory = config.Read("/EIAPP/workingDirectory", \
             wx.GetHomeDir())
         self.exportDirectory = config.Read("/EIApp/exportDirectory")
+        self.spatialIndexCache = config.ReadInt("/EIApp/spatialIndexCache", 1)
+        self.pagingThreshold = config.ReadInt("/EIApp/pagingThreshold", 50000)
 
         self.Move((posX, posY))
         self.SetSize((width, height))
@@ -318,6 +326,8 @@ class MainWindow(wx.Frame):
                 config.WriteInt("/EIFrame/height", size.height)
             config.Write("/EIApp/workingDirectory", self.workingDirectory)
             config.Write("/EIApp/exportDirectory", self.exportDirectory)
+            config.WriteInt("/EIApp/spatialIndexCache", self.spatialIndexCache)
+            config.WriteInt("/EIApp/pagingThreshold", self.pagingThreshold)
 #            config.WriteInt("/EIFrame/framesPalette", self.trackPaletteMenuEntry.IsChecked())
         finally:
             self.Destroy()
@@ -349,7 +359,7 @@ class MainWindow(wx.Frame):
         """
         
         openDialog = wx.FileDialog(self, "Choose scenery file", \
-            "", "", "Textual format (*.*)|*.*")
+            "", "", SCENERY_WILDCARD)
         openDialog.CentreOnParent()
         openDialog.SetDirectory(self.workingDirectory)
         
@@ -358,11 +368,33 @@ class MainWindow(wx.Frame):
 
             try:
                 wx.BeginBusyCursor()
-                sceneryFile = file(path, "r")
+                native = db.sptfile.isNativeFile(path)
+                sceneryFile = file(path, "rb" if native else "r")
                 try:                    
-                    scenery = yaml.load(sceneryFile, sptyaml.SptLoader)
+                    data = sceneryFile.read()
+                    snapshot = None
+                    if self.spatialIndexCache:
+                        snapshot = db.rtxfile.IndexSnapshot(path, \
+                            db.rtxfile.sceneryDigest(data))
+
+                    if native:
+                        scenery = db.sptfile.readScenery(data, snapshot)
+                    else:
+                        def progress(position):
+                            self.SetStatusText("Loading... %d%%" \
+                                % (position * 100 / max(len(data), 1)))
+                            self.GetStatusBar().Update()
+
+                        try:
+                            scenery = sptyaml.loadScenery(data, progress, snapshot)
+                        finally:
+                            self.SetStatusText("Ready.")
                     if not isinstance(scenery, model.scenery.Scenery):
                         raise Exception("Input file is not scenery")
+                    if snapshot is not None and not snapshot.restored:
+                        self.StoreSpatialIndex(snapshot.store, scenery)
+                    if len(scenery.tracks.children) > self.pagingThreshold:
+                        scenery.EnablePaging()
                     self.editor.SetScenery(scenery)
                     self.modified = False
                     self.path = path
@@ -409,9 +441,24 @@ class MainWindow(wx.Frame):
         """
         try:
             wx.BeginBusyCursor()
-            scenery_file = open(path, "w")            
+            native = db.sptfile.isNativeFile(path)
+            # whole scenery is saved in paging mode too
+            self.editor.scenery.LoadAll()
+            scenery_file = open(path, "wb" if native else "w")            
             try:
-                scenery_file.write(yaml.dump(self.editor.scenery))
+                if native:
+                    # writer closes the file, the digest is taken from it
+                    db.sptfile.writeScenery(scenery_file, self.editor.scenery)
+                    if self.spatialIndexCache:
+                        data = file(path, "rb").read()
+                else:
+                    data = yaml.dump(self.editor.scenery, Dumper=sptyaml.SptCDumper)
+                    scenery_file.write(data)
+                if self.spatialIndexCache:
+                    # children are dumped in order of tree leaves
+                    self.StoreSpatialIndex(lambda tree: db.rtxfile.writeIndex( \
+                        path, db.rtxfile.sceneryDigest(data), tree, tree), \
+                        self.editor.scenery)
                 self.path = path
                 self.modified = False
                 self.UpdateTitle()
@@ -429,6 +476,18 @@ class MainWindow(wx.Frame):
             return False
 
 
+    def StoreSpatialIndex(self, store, scenery):
+        """
+        Stores the index of scenery tracks by store(tree). The sidecar
+        file is optional, so failures are only logged.
+        """
+        try:
+            store(scenery.tracks.children)
+        except EnvironmentError:
+            logging.warning("Error while writing spatial index file:", \
+                exc_info=True)
+
+
     def OnExport(self, event):
         """
         Exports scenery to binary format
@@ -480,7 +539,7 @@ class MainWindow(wx.Frame):
 
         saveDialog = wx.FileDialog(self, "Choose scenery file", \
             self.workingDirectory, "", \
-            "Textual format (*.*)|*.*", wx.FD_SAVE)
+            SCENERY_WILDCARD, wx.FD_SAVE)
         saveDialog.CentreOnParent()
         if self.path != None:
             saveDialog.SetPath(self.path)
@@ -635,6 +694,9 @@ class MainWindow(wx.Frame):
 
 
 if __name__ == "__main__":
+    # scenery export runs worker processes
+    multiprocessing.freeze_support()
+
     usage = "Usage: %prog [options]"
     parser = optparse.OptionParser(usage=usage)
     parser.add_option("-l", "--logging", action="store", type="string", \
@@ -0,0 +1,64 @@
+from struct import Struct
+
+class BinaryReader(object):
+    """
+    Reads data written by BinaryWriter from a buffer like string
+    or mmap without copying it. Chunks are read by nested readers
+    limited to the chunk data.
+    """
+    uIntFormat = Struct("<I")
+    uShortFormat = Struct("<H")
+    versionFormat = Struct("<BB")
+
+    def __init__(self, data, offset = 0, end = None):
+        self.__data = data
+        self.__offset = offset
+        self.__end = len(data) if end is None else end
+
+    def __skip(self, size):
+        offset = self.__offset
+        if offset + size > self.__end:
+            raise ValueError("Unexpected end of data")
+        self.__offset += size
+        return offset
+
+    def eof(self):
+        return self.__offset >= self.__end
+
+    def readChunk(self, name):
+        """
+        Returns reader of the next chunk data.
+        """
+        if self.read(4) != name:
+            raise ValueError("Expected chunk %s" % name)
+        size = self.readUInt()
+        offset = self.__skip(size)
+        return BinaryReader(self.__data, offset, offset + size)
+
+    def readArray(self, fmt, count):
+        """
+        Yields count values unpacked with fmt.
+        """
+        offset = self.__skip(fmt.size * count)
+        for i in xrange(count):
+            yield fmt.unpack_from(self.__data, offset)
+            offset += fmt.size
+
+    def readFmt(self, fmt):
+        return fmt.unpack_from(self.__data, self.__skip(fmt.size))
+
+    def read(self, size):
+        offset = self.__skip(size)
+        return self.__data[offset:offset + size]
+
+    def readString(self):
+        return self.read(self.readUInt())
+
+    def readUInt(self):
+        return self.readFmt(BinaryReader.uIntFormat)[0]
+
+    def readUShort(self):
+        return self.readFmt(BinaryReader.uShortFormat)[0]
+
+    def readVersion(self):
+        return "%d.%d" % self.readFmt(BinaryReader.versionFormat)
@@ -1,11 +1,25 @@
 from struct import Struct
 
-class Chunk(object):
-    def __init__(self, name, size = 0):
-        self.name = name
-        self.data = bytearray(size)
-
 class BinaryWriter(object):
+    """
+    Writes binary data in chunks. Chunk is its name, size of payload
+    and the payload, which can contain nested chunks.
+
+    Payload is written straight to the file and size of the chunk
+    is patched when it ends, so the file has to support seek and tell.
+
+    >>> import io
+    >>> fout = io.BytesIO()
+    >>> writer = BinaryWriter(fout)
+    >>> writer.beginChunk("OUTR")
+    >>> writer.beginChunk("INNR")
+    >>> writer.writeUShort(1)
+    >>> writer.endChunk("INNR")
+    >>> writer.endChunk("OUTR")
+    >>> fout.getvalue()
+    'OUTR\\n\\x00\\x00\\x00INNR\\x02\\x00\\x00\\x00\\x01\\x00'
+    """
+
     uIntFormat = Struct("<I")
     uShortFormat = Struct("<H")
     vec3fFormat = Struct("<fff")
@@ -13,39 +27,31 @@ class BinaryWriter(object):
     versionFormat = Struct("<BB")
 
     def __init__(self, ifile):
-        self.__input = ifile
+        self.__output = ifile
+        # names of open chunks and offsets of their size fields
         self.__chunks = list()
-        self.__currentChunk = None
-
-    def __writeChunkToFile(self):
-        print "write chunk %s %d" % (self.__currentChunk.name, len(self.__currentChunk.data))
-        self.__input.write(self.__currentChunk.name)
-        self.__input.write(BinaryWriter.uIntFormat.pack(len(self.__currentChunk.data)))
-        self.__input.write(str(self.__currentChunk.data))
 
     def beginChunk(self, name):
-        print "begin chunk %s" % name
         if len(name) != 4:
             raise ValueError("Invalid chunk identifier")
 
-        self.__chunks.append(Chunk(name))
-        self.__currentChunk = self.__chunks[-1] 
+        self.__output.write(name)
+        self.__chunks.append((name, self.__output.tell()))
+        # reserve size field
+        self.__output.write(BinaryWriter.uIntFormat.pack(0))
 
     def endChunk(self, name):
-        print "end chunk %s %d" % (name, len(self.__currentChunk.data))
         if not len(self.__chunks):
             raise ValueError("No chunk to finish")
-        if name != self.__currentChunk.name:
+        (current, offset) = self.__chunks[-1]
+        if name != current:
             raise ValueError("Incorrect chunk name")
 
-        if len(self.__chunks) == 1:
-            self.__writeChunkToFile()
-        else:
-            current = self.__currentChunk
-            self.__currentChunk = self.__chunks[-2]
-            self.write(current.name)
-            self.writeString(current.data)
-    
+        end = self.__output.tell()
+        self.__output.seek(offset)
+        self.__output.write(BinaryWriter.uIntFormat.pack(end - offset - BinaryWriter.uIntFormat.size))
+        self.__output.seek(end)
+
         self.__chunks.pop()
 
     def writeArray(self, fmt, data, count):
@@ -64,7 +70,7 @@ class BinaryWriter(object):
         self.write(fmt.pack(*values))
 
     def write(self, value):
-        self.__currentChunk.data.extend(value)
+        self.__output.write(value)
 
     def writeString(self, value):
         self.writeUInt(len(value))
@@ -84,4 +90,4 @@ class BinaryWriter(object):
         self.writeFmt(BinaryWriter.versionFormat, (int(major), int(minor)))
 
     def finalize(self):
-        self.__input.close()
+        self.__output.close()
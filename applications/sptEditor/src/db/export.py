@@ -1,43 +1,155 @@
+import io
 import math
 import os.path
+import hashlib
+import itertools
+import multiprocessing
 
 from sptmath import Vec3, Decimal
 from model.tracks import Track, Switch
 from model.groups import RailContainer
+from model.scenery import SceneryListener
 
 from time import sleep
 
-from sctwriter import writeSector, SECTOR_SIZE
+from sctwriter import packSector, writePackedSector, SECTOR_SIZE
 from scvwriter import writeVariant
 
 DEC_SECTOR_SIZE = Decimal(str(SECTOR_SIZE))
 
+# Name of file with digests of sector files in export directory
+MANIFEST_FILE_NAME = "sectors.sha1"
+VARIANT_FILE_NAME = "default.scv"
+
 #SECTOR_CENTER = Vec3(SECTOR_SIZE / 2, SECTOR_SIZE / 2, 0)
 
-def exportScenery(path, tracks, switches, callback):
+def exportScenery(path, tracks, switches, callback, processes = 1, dirty = None):
+    """
+    Export scenery to directory.
+
+    Sectors are packed into plain tuples, so when more than one process
+    is requested they are written by pool of worker processes. Output
+    is the same regardless of number of processes.
+
+    Digests of sector files are kept in manifest file of the directory
+    and only sector files with changed contents are written again.
+    Variant file is written again only when set of sectors changes.
+
+    :param path: output directory.
+    :param tracks: list of tracks.
+    :param switches: list of switches.
+    :param callback: function called with percent of packed sectors.
+    :param processes: number of worker processes writing sectors.
+    :param dirty: positions of sectors changed since the last export
+        to the directory, see SectorTracker. If given, other sectors
+        present in manifest are not packed at all.
+    :returns: list of names of written files.
+    """
     sectors = dict()
     
     __sortTrackings(sectors, tracks, 'tracks')
     __sortTrackings(sectors, switches, 'switches')
+
+    manifest = readManifest(path)
+    names = dict((sectorFileName(position), sector) for (position, sector) in sectors.iteritems())
+
+    digests = dict()
+    pending = []
+    for (name, sector) in names.iteritems():
+        if manifest is None or name not in manifest \
+                or not os.path.exists(os.path.join(path, name)):
+            pending.append((name, None))
+        elif dirty is None or sector.position in dirty:
+            pending.append((name, manifest[name]))
+        else:
+            digests[name] = manifest[name]
     
     progress = 0
     percent = 0
     callback(percent);
-        
-    for sector in sectors.itervalues():
-        sector_name = "%+05d%+05d.sct" % sector.position
-        with file(os.path.abspath(os.path.join(path, sector_name)), "wb") as fout:
-            position = Vec3(Decimal(sector.position[0]) * DEC_SECTOR_SIZE, Decimal(sector.position[1]) * DEC_SECTOR_SIZE, Decimal("0.0"))
-            writeSector(fout, position, sector.tracks, sector.switches)
-        
-        progress += 1
-        newPercent = (progress * 100) / len(sectors)
-        if(newPercent > percent):
-            percent = newPercent
-            callback(percent)
+
+    jobs = ((os.path.abspath(os.path.join(path, name)), digest, \
+        __packSectorData(names[name])) for (name, digest) in pending)
+
+    pool = None
+    if processes > 1 and len(pending) > 1:
+        pool = multiprocessing.Pool(min(processes, len(pending)))
+        results = pool.imap_unordered(__writeSectorFile, jobs)
+    else:
+        results = itertools.imap(__writeSectorFile, jobs)
+
+    written = []
+    try:
+        for (name, digest, changed) in results:
+            digests[name] = digest
+            if changed:
+                written.append(name)
+
+            progress += 1
+            newPercent = (progress * 100) / len(pending)
+            if(newPercent > percent):
+                percent = newPercent
+                callback(percent)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # remove files of sectors that are gone
+    for name in set(manifest or ()).difference(names):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
             
-    with file(os.path.join(path, "default.scv"), "wb") as fout:
-        writeVariant(fout, 0, sectors.values())
+    variantPath = os.path.join(path, VARIANT_FILE_NAME)
+    if manifest is None or set(manifest) != set(names) or not os.path.exists(variantPath):
+        with file(variantPath, "wb") as fout:
+            writeVariant(fout, 0, sectors.values())
+        written.append(VARIANT_FILE_NAME)
+
+    writeManifest(path, digests)
+    return written
+
+def sectorPosition(tracking):
+    """
+    Returns position of sector containing tracking.
+    """
+    return (math.floor(tracking.p1.x / DEC_SECTOR_SIZE), math.floor(tracking.p1.y / DEC_SECTOR_SIZE))
+
+def sectorFileName(position):
+    """
+    Returns name of sector file.
+
+    >>> sectorFileName((-1.0, 2.0))
+    '-0001+0002.sct'
+    """
+    return "%+05d%+05d.sct" % position
+
+def readManifest(path):
+    """
+    Reads digests of sector files from manifest in export directory.
+
+    :returns: dictionary of name -> digest, None if there is no manifest.
+    """
+    try:
+        with file(os.path.join(path, MANIFEST_FILE_NAME), "r") as fin:
+            lines = fin.read().splitlines()
+    except EnvironmentError:
+        return None
+
+    manifest = dict()
+    for line in lines:
+        (digest, name) = line.split(None, 1)
+        manifest[name] = digest
+    return manifest
+
+def writeManifest(path, digests):
+    """
+    Writes digests of sector files to manifest in export directory.
+    Format is the one of sha1sum utility.
+    """
+    with file(os.path.join(path, MANIFEST_FILE_NAME), "w") as fout:
+        for name in sorted(digests):
+            fout.write("%s  %s\n" % (digests[name], name))
     
 class SectorData(object):
     def __init__(self, position, variant = 0):
@@ -46,6 +158,35 @@ class SectorData(object):
         self.switches = list()
         self.variant = variant
     
+def __packSectorData(sector):
+    position = Vec3(Decimal(sector.position[0]) * DEC_SECTOR_SIZE, Decimal(sector.position[1]) * DEC_SECTOR_SIZE, Decimal("0.0"))
+    return packSector(position, sector.tracks, sector.switches)
+
+def __writeSectorFile(job):
+    """
+    Writes packed sector to file if its contents differ from digest,
+    run by worker processes.
+    """
+    (path, digest, packed) = job
+    fout = SectorBuffer()
+    writePackedSector(fout, packed)
+    data = fout.getvalue()
+
+    newDigest = hashlib.sha1(data).hexdigest()
+    changed = newDigest != digest
+    if changed:
+        with file(path, "wb") as fout:
+            fout.write(data)
+    return (os.path.basename(path), newDigest, changed)
+
+class SectorBuffer(io.BytesIO):
+    """
+    Buffer keeping sector data after BinaryWriter finalizes it.
+    """
+
+    def close(self):
+        pass
+
 def __sortTrackings(sectors, trackings, dest):
     """
     Sort trackings by sector and type.
@@ -56,13 +197,86 @@ def __sortTrackings(sectors, trackings, dest):
     """
     
     for tracking in trackings:
-        position = (math.floor(tracking.p1.x / DEC_SECTOR_SIZE), math.floor(tracking.p1.y / DEC_SECTOR_SIZE))
+        position = sectorPosition(tracking)
         #position += SECTOR_CENTER
         
         if position not in sectors:
             sectors[position] = SectorData(position)
             
         getattr(sectors[position], dest).append(tracking)            
+
+class SectorTracker(SceneryListener):
+    """
+    Collects positions of sectors changed since the last export
+    to each directory. Registered as listener of scenery it marks
+    sectors of added and removed rail trackings and sectors of rail
+    trackings connected to them.
+    """
+
+    def __init__(self, scenery):
+        SceneryListener.__init__(self)
+        # End points and positions of sectors having trackings ending there
+        self.points = dict()
+        # Export directories and positions of changed sectors
+        self.exports = dict()
+
+        for tracking in scenery.RailTrackingIterator():
+            for (p, position) in self.__endPoints(tracking):
+                self.points.setdefault(p, []).append(position)
+
+    def Add(self, scenery, element):
+        ends = self.__endPoints(element)
+        for (p, position) in ends:
+            self.points.setdefault(p, []).append(position)
+        self.__touch(ends)
+
+    def Remove(self, scenery, element):
+        ends = self.__endPoints(element)
+        self.__touch(ends)
+        for (p, position) in ends:
+            positions = self.points[p]
+            positions.remove(position)
+            if not positions:
+                del self.points[p]
+
+    def dirty(self, path):
+        """
+        Returns positions of sectors changed since the last export
+        to path or None if scenery wasn't exported there.
+        """
+        dirty = self.exports.get(os.path.abspath(path))
+        return set(dirty) if dirty is not None else None
+
+    def exported(self, path):
+        """
+        Marks all sectors exported to path.
+        """
+        self.exports[os.path.abspath(path)] = set()
+
+    def invalidate(self, path):
+        """
+        Forgets export to path, so all sectors are checked next time.
+        """
+        self.exports.pop(os.path.abspath(path), None)
+
+    def __touch(self, ends):
+        positions = set()
+        for (p, position) in ends:
+            positions.update(self.points.get(p, ()))
+            positions.add(position)
+        for dirty in self.exports.itervalues():
+            dirty.update(positions)
+
+    def __endPoints(self, element):
+        """
+        Returns end points of tracks and switches of element
+        paired with positions of their sectors.
+        """
+        if isinstance(element, RailContainer):
+            trackings = itertools.chain(element.tracks(), element.switches())
+        else:
+            trackings = [element]
+        return [(p, sectorPosition(t)) for t in trackings for p in t.getEndPoints()]
         
 if __name__ == "__main__":
     import yaml
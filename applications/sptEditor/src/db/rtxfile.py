@@ -0,0 +1,150 @@
+"""
+Module containing spatial index sidecar file of scenery.
+
+The sidecar keeps packed RTree layout of the top level rail container
+next to the scenery file, so the tree is read from memory mapped
+file instead of being built when the scenery is opened again.
+It is valid only for the scenery file with the same SHA-1 digest.
+"""
+
+import hashlib
+import itertools
+import logging
+import mmap
+import struct
+
+from struct import Struct
+
+import sptial
+
+from binwriter import BinaryWriter
+from binreader import BinaryReader
+
+INDEX_FILE_VERSION = "1.0"
+INDEX_FILE_EXTENSION = ".rtx"
+
+# scenery digest, number of trackings, nodes and entries
+__headerFormat = Struct("<20s3I")
+# leaf flag and number of entries
+__nodeFormat = Struct("<BI")
+# lower and upper bounds, child node or tracking number
+__entryFormat = Struct("<6iI")
+
+logger = logging.getLogger("SpatialIndex")
+
+def indexPath(path):
+    """
+    Returns path of the sidecar file for scenery file at path.
+    """
+    return path + INDEX_FILE_EXTENSION
+
+def sceneryDigest(data):
+    """
+    Returns digest of scenery file contents keying the sidecar file.
+    """
+    return hashlib.sha1(data).digest()
+
+def writeIndex(path, digest, tree, trackings):
+    """
+    Writes sidecar file for scenery file.
+
+    :param path: scenery file path.
+    :param digest: digest of scenery file contents.
+    :param tree: RTree of the top level rail container.
+    :param trackings: tree objects in the order of scenery file.
+    """
+    numbers = dict((id(t), n) for (n, t) in enumerate(trackings))
+    nodes = tree.pack(lambda obj: numbers[id(obj)])
+    entries = [bounds + (ref,) for (leaf, children) in nodes for (bounds, ref) in children]
+
+    with file(indexPath(path), "wb") as fout:
+        writer = BinaryWriter(fout)
+
+        writer.beginChunk("RTIX")
+
+        writer.beginChunk("HEAD")
+        writer.writeVersion(INDEX_FILE_VERSION)
+        writer.writeFmt(__headerFormat, (digest, len(numbers), len(nodes), len(entries)))
+        writer.endChunk("HEAD")
+
+        writer.beginChunk("NODS")
+        writer.writeArray(__nodeFormat, ((leaf, len(children)) for (leaf, children) in nodes), len(nodes))
+        writer.endChunk("NODS")
+
+        writer.beginChunk("ENTR")
+        writer.writeArray(__entryFormat, entries, len(entries))
+        writer.endChunk("ENTR")
+
+        writer.endChunk("RTIX")
+        writer.finalize()
+
+def readIndex(path, digest, trackings):
+    """
+    Reads RTree of trackings from sidecar file of scenery file.
+
+    :param path: scenery file path.
+    :param digest: digest of scenery file contents.
+    :param trackings: list of tree objects in the order of scenery file.
+    :returns: RTree or None if sidecar doesn't match the scenery.
+    :raises: IOError, ValueError if sidecar is missing or malformed
+    """
+    with file(indexPath(path), "rb") as fin:
+        data = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+
+    try:
+        reader = BinaryReader(data).readChunk("RTIX")
+
+        head = reader.readChunk("HEAD")
+        if head.readVersion() != INDEX_FILE_VERSION:
+            return None
+        (fileDigest, count, nodeCount, entryCount) = head.readFmt(__headerFormat)
+        if fileDigest != digest or count != len(trackings):
+            return None
+
+        nodes = list(reader.readChunk("NODS").readArray(__nodeFormat, nodeCount))
+        entries = reader.readChunk("ENTR").readArray(__entryFormat, entryCount)
+
+        layout = [(leaf, [(e[:6], e[6]) for e in itertools.islice(entries, size)]) \
+            for (leaf, size) in nodes]
+    finally:
+        data.close()
+
+    def resolve(ref):
+        if ref >= count:
+            raise ValueError("Invalid tracking number %d" % ref)
+        return trackings[ref]
+
+    return sptial.RTree.unpack(layout, resolve)
+
+class IndexSnapshot(object):
+    """
+    Sidecar file of the scenery being loaded. It restores the tree
+    of top level rail container and keeps its trackings in order
+    of scenery file, so the sidecar can be stored if not restored.
+    """
+
+    def __init__(self, path, digest):
+        self.path = path
+        self.digest = digest
+        self.trackings = None
+        self.restored = False
+
+    def restore(self, trackings):
+        """
+        Returns RTree of trackings or None if sidecar is not usable.
+        """
+        self.trackings = trackings
+        try:
+            tree = readIndex(self.path, self.digest, trackings)
+        except (EnvironmentError, ValueError, struct.error), inst:
+            logger.info("Spatial index not restored: %s", inst)
+            return None
+        self.restored = tree is not None
+        return tree
+
+    def store(self, tree):
+        """
+        Writes sidecar for the tree of trackings passed to restore.
+        """
+        if self.trackings is not None:
+            writeIndex(self.path, self.digest, tree, self.trackings)
@@ -2,12 +2,16 @@ import time
 
 import array
 import struct 
-import operator
 import itertools
 
 from struct import Struct
 from sptmath import Vec3, Decimal
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from binwriter import BinaryWriter
 
 SECTOR_SIZE = 2000
@@ -28,24 +32,73 @@ def writeSector(fout, position, tracks, switches):
     :param switches: list of switches in sector.
     :raises: SectorWriteError
     """
-    writer = BinaryWriter(fout)
-        
-    # transform tracks and switches
-    tracks = [SectorTrack(track, position) for track in tracks]
-    switches = [SectorSwitch(switch, position) for switch in switches]
-    
-    # build id -> tracking index
+    writePackedSector(fout, packSector(position, tracks, switches))
+
+def packSector(position, tracks, switches):
+    """
+    Pack sector data into plain tuples of floats and ints.
+
+    Coordinates are translated to the sector and connections resolved
+    to tracking numbers, so packed sector can be written without model
+    objects, e.g. by worker process.
+
+    :param position: sector center position relative to scenery.
+    :param tracks: list of tracks in sector.
+    :param switches: list of switches in sector.
+    :returns: tuple of position, tracks, switches, track names and switch names.
+
+    >>> packSector(Vec3("2000", "0", "0"), [], [])[0]
+    (2000.0, 0.0, 0.0)
+    """
+    # build tracking -> id index
     index = __buildTrackingIndex(tracks, switches)
-    
+
+    def point(p):
+        return tuple(float(c) for c in (p - position).to_tuple())
+
+    def vector(v):
+        return tuple(float(c) for c in v.to_tuple())
+
+    def connection(p, instance):
+        return __connection(p, instance, index)
+
+    packedTracks = []
+    for track in tracks:
+        p1, p2 = point(track.p1), point(track.p2)
+        packedTracks.append((p1, vector(track.v1), p2, vector(track.v2), \
+            connection(p1, track.n1), connection(p2, track.n2)))
+
+    packedSwitches = []
+    for switch in switches:
+        pc, p1, p2 = point(switch.pc), point(switch.p1), point(switch.p2)
+        packedSwitches.append((pc, vector(switch.vc1), vector(switch.vc2), \
+            p1, vector(switch.v1), p2, vector(switch.v2), \
+            connection(pc, switch.nc), connection(p1, switch.n1), connection(p2, switch.n2)))
+
+    return (tuple(float(c) for c in position.to_tuple()), packedTracks, packedSwitches, \
+        __packNames(tracks, index), __packNames(switches, index))
+
+def writePackedSector(fout, packed):
+    """
+    Write sector data packed by packSector to file.
+
+    :param fout: output file object.
+    :param packed: packed sector data.
+    :raises: SectorWriteError
+    """
+    (position, tracks, switches, trackNames, switchNames) = packed
+
+    writer = BinaryWriter(fout)
+
     writer.beginChunk("SECT")
     
     __writeHeader(writer, position)
     
-    __writeTrackList(writer, tracks, index)
-    __writeSwitchList(writer, switches, index)
+    __writeTrackList(writer, tracks)
+    __writeSwitchList(writer, switches)
     
-    __writeNames(writer, "TRNM", tracks, index)
-    __writeNames(writer, "SWNM", switches, index)
+    __writeNames(writer, "TRNM", trackNames)
+    __writeNames(writer, "SWNM", switchNames)
     
     writer.endChunk("SECT")
     writer.finalize()
@@ -54,63 +107,94 @@ def __buildTrackingIndex(*args):
     index = dict()
     
     for source in args:
-        # extract tracking.original
-        keys = itertools.imap(operator.attrgetter('original'), source)
         # create list of ids
         values = range(len(index), len(index) + len(source) + 1)
-        # update index with tracking.original -> id pairs
-        
-        index.update(itertools.izip(keys, values))        
+        # update index with tracking -> id pairs
+        index.update(itertools.izip(source, values))        
             
     return index
 
 def __connection(position, instance, index):
     if instance is None:
         return MAX_UINT32
-    if (position.x < 0) or (position.x > SECTOR_SIZE) or (position.y < 0) or (position.y > SECTOR_SIZE):
+    (x, y, z) = position
+    if (x < 0) or (x > SECTOR_SIZE) or (y < 0) or (y > SECTOR_SIZE):
         return MAX_UINT32 - 1
     return index[instance]
+
+def __packNames(source, index):
+    # create list of id -> name pairs for each named tracking
+    return [(index[tracking], tracking.name) for tracking in source if tracking.name is not None]
     
 def __writeHeader(writer, position):
     writer.beginChunk("HEAD")
     
     writer.writeVersion(SECTOR_FILE_VERSION)
     # write sector position
-    writer.writeFmt(Struct("<3f"), position.to_tuple())
+    writer.writeFmt(Struct("<3f"), position)
 
     writer.endChunk("HEAD")
     
-def __writeTrackList(writer, tracks, index):
-    def writeKind(kind):
-        fmt = __trackFormats[kind]
-        source = [track.path.to_tuple() + (__connection(track.p1, track.n1, index), __connection(track.p2, track.n2, index)) for track in tracks if track.path.kind == kind]
-
-        writer.writeUInt(len(source))
-        for entry in source:
-            writer.writeFmt(fmt, entry) 
-        
-    writer.beginChunk("TRLS")                
-    writeKind(PathKind.STRAIGHT)
-    writeKind(PathKind.BEZIER)
-    writer.endChunk("TRLS")    
+def __writeTrackList(writer, tracks):
+    writer.beginChunk("TRLS")
+    if numpy is not None and tracks:
+        for entries in __trackArrays(tracks):
+            writer.writeUInt(len(entries))
+            writer.write(entries.tobytes())
+    else:
+        paths = [(_getPath(*_vertices(p1, v1, p2, v2)), n1, n2) for (p1, v1, p2, v2, n1, n2) in tracks]
+        for kind in (PathKind.STRAIGHT, PathKind.BEZIER):
+            source = [path.to_tuple() + (n1, n2) for (path, n1, n2) in paths if path.kind == kind]
+            writer.writeUInt(len(source))
+            writer.writeArray(__trackFormats[kind], source, len(source))
+    writer.endChunk("TRLS")
+
+def __trackArrays(tracks):
+    """
+    Returns structured arrays of straight and bezier tracks matching
+    track formats. Paths are classified the same way as by _getPath.
+    """
+    points = numpy.array([t[:4] for t in tracks], numpy.float64)
+    connections = numpy.array([t[4:] for t in tracks], numpy.uint32)
+
+    p1 = points[:, 0]
+    v1 = p1 + points[:, 1]
+    p2 = points[:, 2]
+    v2 = p2 + points[:, 3]
+
+    straight = numpy.all(abs(v1 - p1) < 1e-6, axis = 1) & numpy.all(abs(v2 - p2) < 1e-6, axis = 1)
+
+    result = []
+    for (kind, mask) in ((PathKind.STRAIGHT, straight), (PathKind.BEZIER, ~straight)):
+        entries = numpy.zeros(numpy.count_nonzero(mask), __trackDtypes[kind])
+        entries["p1"] = p1[mask]
+        entries["p2"] = p2[mask]
+        if kind == PathKind.BEZIER:
+            entries["v1"] = v1[mask]
+            entries["v2"] = v2[mask]
+        entries["n1"] = connections[mask, 0]
+        entries["n2"] = connections[mask, 1]
+        result.append(entries)
+    return result
     
-def __writeSwitchList(writer, switches, index):
+def __writeSwitchList(writer, switches):
     def flat(switch):
-        fmt = __switchFormats[switch.straight.kind + switch.diverted.kind * 2]
-        return (fmt, (0 if switch.position == "STRAIGHT" else 1,) + \
-            (switch.straight.kind,) + switch.straight.to_tuple() + \
-            (switch.diverted.kind,) + switch.diverted.to_tuple() + \
-            (__connection(switch.pc, switch.nc, index), __connection(switch.p1, switch.n1, index), __connection(switch.p2, switch.n2, index)))
+        (pc, vc1, vc2, p1, v1, p2, v2, nc, n1, n2) = switch
+        straight = _getPath(*_vertices(pc, vc1, p1, v1))
+        diverted = _getPath(*_vertices(pc, vc2, p2, v2))
+        fmt = __switchFormats[straight.kind + diverted.kind * 2]
+        # switches are exported in straight position
+        return (fmt, (0,) + \
+            (straight.kind,) + straight.to_tuple() + \
+            (diverted.kind,) + diverted.to_tuple() + \
+            (nc, n1, n2))
     
     writer.beginChunk("SWLS")
     writer.writeUInt(len(switches))
     writer.writeVarArray(itertools.imap(flat, switches))
     writer.endChunk("SWLS")
     
-def __writeNames(writer, chunk, source, index):
-    # create list of id -> name pairs for each named tracking
-    source = [(index[tracking.original], tracking.name) for tracking in source if tracking.name is not None]
-
+def __writeNames(writer, chunk, source):
     writer.beginChunk(chunk)
         
     writer.writeUInt(len(source))
@@ -126,14 +210,26 @@ def _getPath(p1, v1, p2, v2):
     
     return BezierPath(p1, v1, p2, v2)
 
-def _translate(point, offset):
-    return FastVec3(*(point - offset).to_tuple())
+def _vertices(p1, v1, p2, v2):
+    """
+    Returns end points and control points of packed path.
+    """
+    p1 = FastVec3(*p1)
+    p2 = FastVec3(*p2)
+    return (p1, p1 + FastVec3(*v1), p2, p2 + FastVec3(*v2))
 
 __trackFormats = [
     Struct("<3f3f I I"), # straight, prev track, next track
     Struct("<3f3f3f3f I I") # bezier, prev track, next track
 ]
 
+if numpy is not None:
+    # structured arrays of track formats
+    __trackDtypes = [
+        numpy.dtype([("p1", "<f4", 3), ("p2", "<f4", 3), ("n1", "<u4"), ("n2", "<u4")]),
+        numpy.dtype([("p1", "<f4", 3), ("v1", "<f4", 3), ("p2", "<f4", 3), ("v2", "<f4", 3), ("n1", "<u4"), ("n2", "<u4")])
+    ]
+
 __switchFormats = [
     Struct("<B B 3f3f B 3f3f I I I"), # position, straight, straight, common track, straight track, diverted track
     Struct("<B B 3f3f B 3f3f3f3f I I I"), # position, straight, bezier, common track, straight track, diverted track
@@ -198,42 +294,6 @@ class BezierPath(object):
     def to_tuple(self):
         return self.p1.to_tuple() + self.v1.to_tuple() + self.p2.to_tuple() + self.v2.to_tuple()
 
-class SectorTrack(object):
-    def __init__(self, source, offset): 
-        self.p1 = _translate(source.p1, offset)
-        self.v1 = self.p1 + FastVec3.from_vec3(source.v1)
-        self.p2 = _translate(source.p2, offset)
-        self.v2 = self.p2 + FastVec3.from_vec3(source.v2)
-
-        self.path = _getPath(self.p1, self.v1, self.p2, self.v2)
-        self.n1 = source.n1
-        self.n2 = source.n2
-
-        self.name = source.name
-        self.original = source
-
-class SectorSwitch(object):
-    def __init__(self, source, offset): 
-        self.pc = _translate(source.pc, offset)
-        self.vc1 = self.pc + FastVec3.from_vec3(source.vc1)
-        self.vc2 = self.pc + FastVec3.from_vec3(source.vc2)
-        self.p1 = _translate(source.p1, offset)
-        self.v1 = self.p1 + FastVec3.from_vec3(source.v1)
-        self.p2 = _translate(source.p2, offset)
-        self.v2 = self.p2 + FastVec3.from_vec3(source.v2)
-
-        self.straight = _getPath(self.pc, self.vc1, self.p1, self.v1)
-        self.diverted = _getPath(self.pc, self.vc2, self.p2, self.v2)
-
-        self.nc = source.nc
-        self.n1 = source.n1
-        self.n2 = source.n2
-
-        self.name = source.name
-        self.position = "STRAIGHT"
-        
-        self.original = source
-
 if __name__ == "__main__":
     class Track(object):
         def __init__(self, p1, v1, p2, v2, name = None):
@@ -0,0 +1,176 @@
+"""
+Module containing native binary scenery format.
+
+It stores the editable model, that is nested rail containers with
+tracks and switches, in chunks of BinaryWriter. Coordinates are kept
+as raw fixed point values of Decimal, so the scenery is read back
+exactly as it was saved. Connections are rebuilt while reading.
+
+The rail chunk is a preorder list of elements, each one starting with
+the kind, optionally followed by the name. Containers are followed by
+the number of children and the children themselves.
+"""
+
+from struct import Struct
+
+from sptmath import Vec3, Decimal
+from model.tracks import Track, Switch
+from model.groups import RailContainer, RailGroup
+from model.scenery import Scenery
+
+from binwriter import BinaryWriter
+from binreader import BinaryReader
+
+SCENERY_FILE_VERSION = "1.0"
+SCENERY_FILE_EXTENSION = ".sptb"
+
+# Element kinds
+KIND_TRACK = 0
+KIND_SWITCH = 1
+KIND_CONTAINER = 2
+KIND_GROUP = 3
+# Flag of kind telling that element is named
+KIND_NAMED = 0x80
+
+__kindFormat = Struct("<B")
+__trackFormat = Struct("<12q")
+__switchFormat = Struct("<21q")
+
+Track_attrs = ["p1", "v1", "v2", "p2"]
+Switch_attrs = ["pc", "p1", "p2", "vc1", "vc2", "v1", "v2"]
+
+class SceneryReadError(RuntimeError):
+    pass
+
+def isNativeFile(path):
+    """
+    Checks if the scenery file at path is in native format.
+
+    >>> isNativeFile("test.sptb"), isNativeFile("TEST.SPTB"), isNativeFile("test")
+    (True, True, False)
+    """
+    return path.lower().endswith(SCENERY_FILE_EXTENSION)
+
+def writeScenery(fout, scenery):
+    """
+    Write scenery to file.
+
+    :param fout: output file object.
+    :param scenery: scenery to write.
+    """
+    writer = BinaryWriter(fout)
+
+    writer.beginChunk("SPTS")
+
+    writer.beginChunk("HEAD")
+    writer.writeVersion(SCENERY_FILE_VERSION)
+    writer.writeUInt(Decimal().base())
+    writer.endChunk("HEAD")
+
+    writer.beginChunk("RAIL")
+    __writeElement(writer, scenery.tracks)
+    writer.endChunk("RAIL")
+
+    writer.endChunk("SPTS")
+    writer.finalize()
+
+def __writeElement(writer, element):
+    if isinstance(element, Track):
+        kind, fmt, attrs = KIND_TRACK, __trackFormat, Track_attrs
+    elif isinstance(element, Switch):
+        kind, fmt, attrs = KIND_SWITCH, __switchFormat, Switch_attrs
+    elif isinstance(element, RailGroup):
+        kind = KIND_GROUP
+    elif isinstance(element, RailContainer):
+        kind = KIND_CONTAINER
+    else:
+        raise ValueError, "Unsupported element %s" % element
+
+    name = element.name
+    if name is not None:
+        kind |= KIND_NAMED
+    writer.writeFmt(__kindFormat, (kind,))
+    if name is not None:
+        writer.writeString(unicode(name).encode("utf-8"))
+
+    if (kind & ~KIND_NAMED) in (KIND_CONTAINER, KIND_GROUP):
+        children = list(element.children)
+        writer.writeUInt(len(children))
+        for c in children:
+            __writeElement(writer, c)
+    else:
+        values = []
+        for attr in attrs:
+            p = getattr(element, attr)
+            values += (p.x.raw(), p.y.raw(), p.z.raw())
+        writer.writeFmt(fmt, values)
+
+def readScenery(data, snapshot = None):
+    """
+    Read scenery from data.
+
+    :param data: string or mmap with contents of scenery file.
+    :param snapshot: optional db.rtxfile.IndexSnapshot used to restore
+        index of top level rail container.
+    :raises: SceneryReadError
+    """
+    try:
+        reader = BinaryReader(data).readChunk("SPTS")
+
+        head = reader.readChunk("HEAD")
+        version = head.readVersion()
+        if version != SCENERY_FILE_VERSION:
+            raise SceneryReadError("Unsupported scenery file version %s" % version)
+        point = __pointReader(head.readUInt())
+
+        tracks = __readElement(reader.readChunk("RAIL"), point, snapshot)
+    except ValueError, inst:
+        raise SceneryReadError(str(inst))
+
+    if not isinstance(tracks, RailContainer):
+        raise SceneryReadError("Scenery doesn't start with rail container")
+
+    scenery = Scenery()
+    scenery.tracks = tracks
+    return scenery
+
+def __pointReader(base):
+    """
+    Returns function making Vec3 from raw values of Decimals with base.
+    """
+    digits = len(str(base)) - 1
+
+    def decimal(raw):
+        sign = "-" if raw < 0 else ""
+        (integral, fraction) = divmod(abs(raw), base)
+        return "%s%d.%0*d" % (sign, integral, digits, fraction)
+
+    def point(x, y, z):
+        return Vec3(decimal(x), decimal(y), decimal(z))
+
+    return point
+
+def __readElement(reader, point, snapshot = None):
+    (kind,) = reader.readFmt(__kindFormat)
+    name = None
+    if kind & KIND_NAMED:
+        name = reader.readString().decode("utf-8")
+    kind &= ~KIND_NAMED
+
+    if kind in (KIND_CONTAINER, KIND_GROUP):
+        element = RailGroup() if kind == KIND_GROUP else RailContainer()
+        children = [__readElement(reader, point) for i in xrange(reader.readUInt())]
+        element.insertAll(children, snapshot)
+    elif kind in (KIND_TRACK, KIND_SWITCH):
+        if kind == KIND_TRACK:
+            element, fmt, attrs = Track(), __trackFormat, Track_attrs
+        else:
+            element, fmt, attrs = Switch(), __switchFormat, Switch_attrs
+        values = reader.readFmt(fmt)
+        for (i, attr) in enumerate(attrs):
+            setattr(element, attr, point(*values[3*i:3*i+3]))
+    else:
+        raise SceneryReadError("Unknown element kind %d" % kind)
+
+    element.name = name
+    return element
@@ -21,8 +21,9 @@ class RailContainer:
         # Contains all children
         self.children = sptial.RTree()
         # Outline trackings are at borders of this container and may attach
-        # to some external trackings.
-        self.outline_trackings = []
+        # to some external trackings. The map contains geometry points
+        # of outline trackings and lists of trackings having them.
+        self.outline_trackings = {}
         # A map containing points and external trackings
         self.connections = {}
 
@@ -71,6 +72,8 @@ class RailContainer:
         """
         Checks if a group contains given rail tracking
         """
+        if self.children.containsObject(tracking):
+            return True
         geometry = tracking.getEndPoints()
         cuboid = sptial.Cuboid.fromEndpoints(geometry)
         found = self.children.query(cuboid)
@@ -91,10 +94,7 @@ class RailContainer:
         if not self.containsPoint(point):
             raise ValueError, "This point is not outline point"
         # Get the tracking that has this outline point
-        internalTracking = None
-        for t in self.outline_trackings:
-            if t.containsPoint(point):
-                internalTracking = t
+        internalTracking = self.__outlineAt(point)
         # And now compute normal vector on this track
         return internalTracking.getNormalVector(point)
 
@@ -135,10 +135,7 @@ class RailContainer:
         nextPoint = None
 
         # Get the first child from this container
-        currentTracking = None
-        for t in self.outline_trackings:
-            if t.containsPoint(point):
-                currentTracking = t
+        currentTracking = self.__outlineAt(point)
 
         if currentTracking is None:
             raise ValueError, "Current tracking not found in container"
@@ -168,6 +165,62 @@ class RailContainer:
         if self.contains(tracking):
             raise ValueError, "Rail tracking is already in group"
 
+        self.__connect(tracking, geometry)
+
+        # Add to children
+        self.children.insert(cuboid, tracking)
+
+        if isDebug:
+            logger.debug("Rail tracking " + str(tracking) + " has been successfully " \
+                + "inserted into group")
+
+            logger.debug(self)
+
+
+    def insertAll(self, trackings, snapshot = None):
+        """
+        Inserts given rail trackings into group at once.
+
+        All trackings are accepted first and then connected in a single
+        pass, see __connectAll. The children index is packed at once too
+        if trackings outnumber children, otherwise they are inserted into
+        the index one by one. Empty group takes the children index from
+        snapshot.restore(trackings) instead if snapshot is given and
+        restores it.
+        """
+        batch = set()
+        entries = []
+
+        tree = None
+        if snapshot is not None and len(self.children) == 0:
+            tree = snapshot.restore(trackings)
+
+        for tracking in trackings:
+            if tracking in batch or self.contains(tracking):
+                raise ValueError, "Rail tracking is already in group"
+
+            batch.add(tracking)
+            if tree is None:
+                entries.append((sptial.Cuboid.fromEndpoints(tracking.getEndPoints()), tracking))
+
+        self.__connectAll(trackings)
+
+        if tree is not None:
+            self.children = tree
+        elif len(entries) > len(self.children):
+            self.children = sptial.RTree.bulkLoad(list(self.children.items()) + entries)
+        else:
+            for (cuboid, tracking) in entries:
+                self.children.insert(cuboid, tracking)
+
+
+    def __connect(self, tracking, geometry):
+        """
+        Binds given rail tracking with outline trackings of this group
+        and updates outline points.
+        """
+        isDebug = logger.isEnabledFor(logging.DEBUG)
+
         if not tracks.isDisconnected(tracking):
             raise ValueError, "Connected rail tracking cannot " \
                 + "be inserted into group"
@@ -179,7 +232,7 @@ class RailContainer:
                 logger.debug(("Processing %d geometry point " \
                     + tracks.coord2str(gpoint)) % i)
 
-            for child in self.outline_trackings:
+            for child in list(self.outline_trackings.get(gpoint, ())):
                 if child.containsPoint(gpoint):
                     if isDebug:
                         logger.debug("Found following rail tracking that has " \
@@ -214,13 +267,12 @@ class RailContainer:
                         tracking.setTracking(gpoint, child)
 
                         # Remove rail tracking from outline if necessary
-                        if child in self.outline_trackings \
-                            and not self.isOutlineNow(child):
+                        if not self.isOutlineNow(child):
                             if isDebug:
                                 logger.debug("Child found in outline " \
                                     + "collections however it is inline now so " \
                                     + "removing it from outlines")
-                            self.outline_trackings.remove(child)
+                            self.__removeOutline(child)
 
                         # Check geometry and remove outline point
                         if gpoint in self.connections:
@@ -252,16 +304,133 @@ class RailContainer:
                 logger.debug(("Not all geometry points where bound " \
                     + "to existing trackings. Found status %x. " \
                     + "Adding tracking to outlines") % founds)
-            self.outline_trackings.insert(0, tracking)
+            self.__addOutline(tracking, True)
 
-        # Add to children
-        self.children.insert(cuboid, tracking)
 
-        if isDebug:
-            logger.debug("Rail tracking " + str(tracking) + " has been successfully " \
-                + "inserted into group")
+    def __connectAll(self, trackings):
+        """
+        Binds given rail trackings with each other and with outline
+        trackings of this group in a single pass over a hash of their
+        geometry points, then updates outline points and trackings once.
 
-            logger.debug(self)
+        Trackings are bound the same way as by subsequent __connect calls,
+        that is to the most recently added outline tracking at the point
+        having negative normal vector.
+        """
+        for tracking in trackings:
+            if not tracks.isDisconnected(tracking):
+                raise ValueError, "Connected rail tracking cannot " \
+                    + "be inserted into group"
+
+        # Outline trackings at geometry points, the most recent first
+        ends = {}
+        # Geometry points and True if left unbound by the last tracking
+        points = {}
+        # Trackings which are no longer outline by identity
+        inline = {}
+        outlines = []
+
+        for tracking in trackings:
+            geometry = tracking.getEndPoints()
+            bound = 0
+
+            for gpoint in geometry:
+                candidates = ends.get(gpoint)
+                if candidates is None:
+                    candidates = ends[gpoint] = list(self.outline_trackings.get(gpoint, ()))
+
+                found = False
+                v_tracking_normal = None
+                for child in candidates:
+                    if id(child) in inline or not child.containsPoint(gpoint):
+                        continue
+
+                    if v_tracking_normal is None:
+                        v_tracking_normal = tracking.getNormalVector(gpoint)
+
+                    if sptmath.isNegativeVector(v_tracking_normal, child.getNormalVector(gpoint)):
+                        connOutside = None
+                        if gpoint not in points:
+                            connOutside = self.connections.get(gpoint, None)
+
+                        if child.point2tracking(gpoint) != None or connOutside != None:
+                            # Connection in use, an error
+                            raise Exception, "Inconsistent state"
+
+                        child.setTracking(gpoint, tracking)
+                        tracking.setTracking(gpoint, child)
+
+                        if not self.isOutlineNow(child):
+                            inline[id(child)] = child
+                        found = True
+                        break
+
+                points[gpoint] = not found
+                if found:
+                    bound += 1
+
+            if bound < len(geometry):
+                for gpoint in geometry:
+                    ends[gpoint].insert(0, tracking)
+                outlines.append(tracking)
+
+        for gpoint, unbound in points.iteritems():
+            if unbound:
+                self.connections[gpoint] = None
+            elif gpoint in self.connections:
+                del self.connections[gpoint]
+
+        added = set(id(t) for t in outlines)
+        for (key, child) in inline.iteritems():
+            if key not in added:
+                self.__removeOutline(child)
+
+        for tracking in outlines:
+            if id(tracking) not in inline:
+                self.__addOutline(tracking, True)
+
+
+    def __addOutline(self, tracking, first = False):
+        """
+        Adds the rail tracking to outline trackings at its geometry points.
+        """
+        for p in tracking.getEndPoints():
+            trackings = self.outline_trackings.setdefault(p, [])
+            if first:
+                trackings.insert(0, tracking)
+            else:
+                trackings.append(tracking)
+
+
+    def __removeOutline(self, tracking):
+        """
+        Removes the rail tracking from outline trackings.
+        """
+        for p in tracking.getEndPoints():
+            trackings = [t for t in self.outline_trackings.get(p, ()) if t is not tracking]
+            if trackings:
+                self.outline_trackings[p] = trackings
+            elif p in self.outline_trackings:
+                del self.outline_trackings[p]
+
+
+    def __isOutline(self, tracking):
+        """
+        Checks if the rail tracking is one of outline trackings.
+        """
+        p = tracking.getEndPoints()[0]
+        for t in self.outline_trackings.get(p, ()):
+            if t is tracking:
+                return True
+        return False
+
+
+    def __outlineAt(self, point):
+        """
+        Returns the last outline tracking having given geometry point.
+        """
+        trackings = self.outline_trackings.get(point)
+        return trackings[-1] if trackings else None
 
 
     def remove(self, tracking):
@@ -302,12 +471,12 @@ class RailContainer:
                 tracking.setTracking(gpoint, None)
 
                 # Add previous tracking to outline if it becomes outline now
-                if previous not in self.outline_trackings:
+                if not self.__isOutline(previous):
                     if isDebug:
                        logger.debug("Adding previous tracking " + str(previous) \
                            + " to outlines")
 
-                    self.outline_trackings.append(previous)
+                    self.__addOutline(previous)
 
                 if isDebug:
                     logger.debug("Adding point " + tracks.coord2str(gpoint) \
@@ -323,12 +492,12 @@ class RailContainer:
 
             i = i+1
 
-        if tracking in self.outline_trackings:
+        if self.__isOutline(tracking):
             if isDebug:
                 logger.debug("Removing tracking " + str(tracking) \
                     + " from outlines")
 
-            self.outline_trackings.remove(tracking)
+            self.__removeOutline(tracking)
 
         self.children.delete(cuboid, tracking)
 
@@ -386,14 +555,22 @@ class RailContainer:
         """
         items = self.connections.items()
         self.connections = dict(items)
-        
-        children = iter(self.children)
-        tree = sptial.RTree()
-        for c in children:
-            geometry = c.getEndPoints()
-            cuboid = sptial.Cuboid.fromEndpoints(geometry)
-            tree.insert(cuboid, c)
-        self.children = tree
+        items = self.outline_trackings.items()
+        self.outline_trackings = dict(items)
+
+        changed = []
+        for (cuboid, c) in self.children.items():
+            nCuboid = sptial.Cuboid.fromEndpoints(c.getEndPoints())
+            if nCuboid != cuboid:
+                changed.append((c, nCuboid))
+
+        if len(changed) > len(self.children) / 2:
+            # Most of children moved, pack the index again
+            self.children = sptial.RTree.bulkLoad( \
+                [(sptial.Cuboid.fromEndpoints(c.getEndPoints()), c) for c in self.children])
+        else:
+            for (c, nCuboid) in changed:
+                self.children.update(c, nCuboid)
           
 
   
@@ -8,6 +8,8 @@ the simulator.
 
 import groups
 import tracks
+import tiles
+import sptial
 from sptmath import Vec3
 
 class Scenery:
@@ -15,21 +17,49 @@ class Scenery:
     Scenery defines world being simulated.
     """
     
+    # Default number of tiles kept loaded in paging mode
+    TILE_CAPACITY = 16
+
     def __init__(self):
         self.listeners = []
         self.tracks = groups.RailContainer()
+        # Tile store of all rail trackings in paging mode
+        self.store = None
+        # Keys of tiles loaded into tracks and their last use
+        self.loaded = {}
+        self.capacity = self.TILE_CAPACITY
+        self.clock = 0
 
 
     def AddRailTracking(self, tracking):
         """
         Adds a new rail tracking to the scenery.
         """
+        if self.store is not None:
+            self.__load([self.store.key(tracking)])
+            self.store.add(tracking)
         self.tracks.insert(tracking)
         self.FireSceneryChange(SceneryListener.Add, tracking)
 
 
+    def AddRailTrackings(self, trackings):
+        """
+        Adds new rail trackings to the scenery at once.
+        """
+        if self.store is not None:
+            self.__load(set(self.store.key(t) for t in trackings))
+            for tracking in trackings:
+                self.store.add(tracking)
+        self.tracks.insertAll(trackings)
+        for tracking in trackings:
+            self.FireSceneryChange(SceneryListener.Add, tracking)
+
+
     def RemoveRailTracking(self, tracking):
-        if not self.tracks.contains(tracking):
+        if self.store is not None and id(tracking) in self.store.owners:
+            self.__load([self.store.owners[id(tracking)][0]])
+            self.store.remove(tracking)
+        elif not self.tracks.contains(tracking):
             return
 
         self.tracks.remove(tracking)
@@ -37,22 +67,132 @@ class Scenery:
 
 
     def RailTrackingIterator(self):
+        if self.store is not None:
+            return iter(self.store)
         return self.tracks.children
     
     
     def GetMbc(self):
+        if self.store is not None:
+            return self.store.getMbc()
         return self.tracks.children.getMbc()
     
     
     def Query(self, vp):
+        self.__page(vp)
         return self.tracks.children.queryView(vp)
     
     
     def QueryPoint(self, p):
         assert isinstance(p, Vec3)
+        self.__page(sptial.Cuboid.fromEndpoints([p]))
         return self.tracks.children.queryPoint(p.x, p.y, p.z)
 
 
+    def Nearest(self, p, k = 1, maxDist = None, distance = None):
+        """
+        Finds rail trackings nearest to the point p in view
+        and yields (distance, rail tracking) pairs, closest first.
+        In paging mode only tiles within maxDist are searched, or
+        the tiles around p if maxDist is not given.
+        """
+        if self.store is not None:
+            d = maxDist if maxDist is not None else self.store.size
+            d = int(d) + 1
+            c = sptial.Cuboid.fromEndpoints([p])
+            self.__page(sptial.Cuboid((c.minX - d, c.minY - d, c.minZ), \
+                (c.maxX + d, c.maxY + d, c.maxZ)))
+        return self.tracks.children.nearest(p.x, p.y, k, maxDist, distance)
+
+
+    def EnablePaging(self, capacity = TILE_CAPACITY):
+        """
+        Moves rail trackings into tile store. Tiles are loaded into
+        tracks when they are queried and the least recently used ones
+        are evicted when more than capacity tiles are loaded.
+        """
+        if self.store is None:
+            store = tiles.TileStore()
+            for tracking in self.tracks.children:
+                tiles.disconnect(tracking)
+                store.add(tracking)
+            self.tracks = groups.RailContainer(self.tracks.name)
+            self.store = store
+            self.loaded = {}
+        self.capacity = capacity
+
+
+    def LoadAll(self):
+        """
+        Loads all tiles in paging mode, so tracks contain all rail trackings.
+        """
+        if self.store is not None:
+            self.__load(self.store.tiles.keys())
+
+
+    def GetStubs(self):
+        """
+        Returns outline points of tracks leading to rail trackings in tiles
+        that are not loaded mapped to lists of keys of these tiles.
+        """
+        stubs = {}
+        if self.store is not None:
+            for (p, tracking) in self.tracks.connections.iteritems():
+                keys = self.__unloadedAt(p)
+                if tracking is None and keys:
+                    stubs[p] = keys
+        return stubs
+
+
+    def IsStub(self, p):
+        """
+        Returns True if rail trackings in tiles that are not loaded
+        end at the point, so it's connected outside of tracks.
+        """
+        return self.store is not None and len(self.__unloadedAt(p)) > 0
+
+
+    def __unloadedAt(self, p):
+        return [k for k in self.store.points.get(p, ()) if k not in self.loaded]
+
+
+    def __page(self, cuboid):
+        """
+        Loads tiles overlapping cuboid and evicts the least recently
+        used tiles over capacity.
+        """
+        if self.store is None:
+            return
+
+        keys = self.store.keys(cuboid)
+        self.__load(keys)
+
+        if len(self.loaded) > self.capacity:
+            used = set(keys)
+            unused = sorted((clock, key) for (key, clock) in self.loaded.iteritems() \
+                if key not in used)
+            for (clock, key) in unused[:len(self.loaded) - self.capacity]:
+                self.__evict(key)
+
+
+    def __load(self, keys):
+        self.clock += 1
+        for key in keys:
+            trackings = self.store.trackings(key)
+            if key not in self.loaded and trackings:
+                self.tracks.insertAll(trackings)
+            self.loaded[key] = self.clock
+
+
+    def __evict(self, key):
+        trackings = self.store.trackings(key)
+        for tracking in trackings:
+            self.tracks.remove(tracking)
+        del self.loaded[key]
+        for tracking in trackings:
+            self.FireSceneryChange(SceneryListener.Unload, tracking)
+
+
     def RegisterListener(self, listener):
         """
         Registers a listener in this scenery.
@@ -70,9 +210,10 @@ class Scenery:
     def FireSceneryChange(self, event, element):
         """
         Notifies registered listeners about the change.
+        Event is the method of SceneryListener called on each listener.
         """
         for l in self.listeners:
-            event(l, self, element)
+            getattr(l, event.__name__)(self, element)
 
 class SceneryListener:
     """
@@ -88,3 +229,10 @@ class SceneryListener:
     def Remove(self, scenery, element):
         pass
 
+    def Unload(self, scenery, element):
+        """
+        Rail tracking was evicted from tracks in paging mode. It's still
+        part of scenery and is loaded again when queried.
+        """
+        pass
+
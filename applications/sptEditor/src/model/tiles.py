@@ -0,0 +1,189 @@
+"""
+Module containing paged store of rail trackings.
+"""
+
+import sptial
+import groups
+import db.sctwriter
+
+# Tiles are aligned with sectors of exported scenery
+TILE_SIZE = db.sctwriter.SECTOR_SIZE
+
+
+class TileStore(object):
+    """
+    Backing store of rail trackings partitioned into square tiles.
+
+    A rail tracking belongs to the tile of its p1 point, as it belongs
+    to the sector of exported scenery, and rail container to the tile
+    of its first end point. The store
+    keeps bounds of the tiles, so tiles overlapping a view can be found
+    without indexing their trackings, and end points of trackings, so
+    connections leading into any tile can be found without loading it.
+    """
+
+    def __init__(self, size = TILE_SIZE):
+        self.size = size
+        # Tile keys and lists of trackings
+        self.tiles = {}
+        # Tile keys and cuboids bounding their trackings, None if unknown
+        self.bounds = {}
+        # End points and keys of tiles having trackings ending there
+        self.points = {}
+        # Tile keys and end points of trackings by identity as they were
+        # added, so the trackings may be moved meanwhile
+        self.owners = {}
+        # The farthest distance of end points outside their tiles
+        self.margin = 0
+
+
+    def __len__(self):
+        return sum(len(t) for t in self.tiles.itervalues())
+
+
+    def __iter__(self):
+        for trackings in self.tiles.itervalues():
+            for t in trackings:
+                yield t
+
+
+    def key(self, tracking):
+        """
+        Returns key of the tile for rail tracking.
+
+        Example:
+        >>> from model.tracks import Track
+        >>> from sptmath import Vec3
+        >>> from model.tracks import Switch
+        >>> TileStore().key(Track(Vec3("-0.5", "4000", "0"), Vec3(), Vec3(), Vec3("10", "10", "0")))
+        (-1, 2)
+        >>> TileStore().key(Switch(pc = Vec3("-10", "10", "0"), p1 = Vec3("10", "10", "0")))
+        (0, 0)
+        """
+        if isinstance(tracking, groups.RailContainer):
+            p = tracking.getEndPoints()[0]
+        else:
+            p = tracking.p1
+        return (int(p.x.to_floor()) // self.size, int(p.y.to_floor()) // self.size)
+
+
+    def add(self, tracking):
+        """
+        Adds rail tracking to its tile and returns key of the tile.
+        """
+        key = self.key(tracking)
+        geometry = tracking.getEndPoints()
+        self.tiles.setdefault(key, []).append(tracking)
+        self.owners[id(tracking)] = (key, geometry)
+        if self.bounds.get(key) is not None:
+            self.bounds[key] = self.bounds[key].union( \
+                sptial.Cuboid.fromEndpoints(geometry))
+        else:
+            self.bounds[key] = None
+        for p in geometry:
+            self.points.setdefault(p, []).append(key)
+
+        (x, y) = (key[0] * self.size, key[1] * self.size)
+        for p in geometry:
+            self.margin = max(self.margin, x - int(p.x.to_floor()), int(p.x.to_ceiling()) - x - self.size,
+                y - int(p.y.to_floor()), int(p.y.to_ceiling()) - y - self.size)
+        return key
+
+
+    def remove(self, tracking):
+        """
+        Removes rail tracking from its tile and returns key of the tile.
+        """
+        if id(tracking) not in self.owners:
+            raise ValueError, "Rail tracking is not in store"
+
+        (key, geometry) = self.owners.pop(id(tracking))
+        trackings = [t for t in self.tiles[key] if t is not tracking]
+        if trackings:
+            self.tiles[key] = trackings
+            self.bounds[key] = None
+        else:
+            del self.tiles[key]
+            del self.bounds[key]
+
+        for p in geometry:
+            keys = self.points[p]
+            keys.remove(key)
+            if not keys:
+                del self.points[p]
+        return key
+
+
+    def trackings(self, key):
+        """
+        Returns list of rail trackings in the tile.
+        """
+        return list(self.tiles.get(key, ()))
+
+
+    def tileBounds(self, key):
+        """
+        Returns cuboid bounding rail trackings of the tile.
+        """
+        if self.bounds[key] is None:
+            self.bounds[key] = sptial.Cuboid.unionAll( \
+                sptial.Cuboid.fromEndpoints(t.getEndPoints()) for t in self.tiles[key])
+        return self.bounds[key]
+
+
+    def keys(self, cuboid):
+        """
+        Returns keys of tiles having bounds overlapping the cuboid in view.
+        Bounds touching the cuboid are included too.
+
+        Only tiles within margin of the cuboid are checked, unless there
+        are fewer tiles in the store than such candidates.
+
+        Example:
+        >>> from model.tracks import Track
+        >>> from sptmath import Vec3
+        >>> store = TileStore(100)
+        >>> store.add(Track(Vec3("10", "10", "0"), Vec3(), Vec3(), Vec3("150", "10", "0")))
+        (0, 0)
+        >>> store.add(Track(Vec3("250", "10", "0"), Vec3(), Vec3(), Vec3("260", "10", "0")))
+        (2, 0)
+        >>> store.margin
+        50
+        >>> sorted(store.keys(sptial.Cuboid((120, 0, 0), (140, 20, 0))))
+        [(0, 0)]
+        >>> sorted(store.keys(sptial.Cuboid((160, 0, 0), (255, 20, 0))))
+        [(2, 0)]
+        """
+        minX = (cuboid.minX - self.margin) // self.size
+        maxX = (cuboid.maxX + self.margin) // self.size
+        minY = (cuboid.minY - self.margin) // self.size
+        maxY = (cuboid.maxY + self.margin) // self.size
+
+        if (maxX - minX + 1) * (maxY - minY + 1) > len(self.tiles):
+            candidates = self.tiles.keys()
+        else:
+            candidates = [(x, y) for x in xrange(minX, maxX + 1) for y in xrange(minY, maxY + 1) \
+                if (x, y) in self.tiles]
+
+        result = []
+        for key in candidates:
+            b = self.tileBounds(key)
+            if b.minX <= cuboid.maxX and cuboid.minX <= b.maxX \
+                    and b.minY <= cuboid.maxY and cuboid.minY <= b.maxY:
+                result.append(key)
+        return result
+
+
+    def getMbc(self):
+        return sptial.Cuboid.unionAll(self.tileBounds(key) for key in self.tiles)
+
+
+
+def disconnect(tracking):
+    """
+    Unbinds rail tracking from trackings connected to its end points
+    leaving the other side of connections as it is.
+    """
+    for p in tracking.getEndPoints():
+        if tracking.point2tracking(p) is not None:
+            tracking.setTracking(p, None)
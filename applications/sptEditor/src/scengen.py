@@ -30,28 +30,27 @@ def generateLargeScenery():
     scenery = Scenery()
     trackfc = ui.trackfc.TrackFactory(EditorMock())
 
-    timeSum = datetime.timedelta 
     prefabsmap = yaml.load(file("prefabric.yaml", "r"), sptyaml.SptLoader)
     prefabs = []
     for l in prefabsmap.values():
         prefabs += l
 
-    timeSum = datetime.timedelta()
+    timeStart = datetime.datetime.now()
+
+    trackings = []
     for n in range(1, 2000):
         e = random.choice(prefabs)
         handle = random.choice(e.handles)
-        timeStart = datetime.datetime.now()
-
-        t = trackfc.CopyRailTracking(e.railTracking, handle[0])
-        scenery.AddRailTracking(t)
-
-        timeEnd = datetime.datetime.now()
-        delta = timeEnd - timeStart
-        print "%d %.3f" % (n, float(delta.seconds + delta.microseconds / 1000000.0))
-        timeSum += delta
-                
-    idelta = timeSum.days * 86400 + timeSum.seconds
-    print "Insertations lasted %d sec" % idelta
+        trackings.append(trackfc.CopyRailTracking(e.railTracking, handle[0]))
+
+    timeCopy = datetime.datetime.now()
+    scenery.AddRailTrackings(trackings)
+    timeEnd = datetime.datetime.now()
+
+    delta = timeCopy - timeStart
+    print "Copies lasted %.3f sec" % float(delta.seconds + delta.microseconds / 1000000.0)
+    delta = timeEnd - timeCopy
+    print "Insertations lasted %.3f sec" % float(delta.seconds + delta.microseconds / 1000000.0)
 
     scenery_file = open("large.yaml", "w")
     scenery_file.write( yaml.dump(scenery) )
@@ -2,14 +2,27 @@
 SPaTial indexing structures.
 """
 
+import heapq
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from sptmath import Vec3
 
 
-class Cuboid:
+class Cuboid(object):
     """
     Cuboid that is based on integer coordinates
     """
 
+    __slots__ = ("minX", "maxX", "minY", "maxY", "minZ", "maxZ")
+
+    # Names of lower and upper bound attributes for each axis
+    axes = (("minX", "maxX"), ("minY", "maxY"), ("minZ", "maxZ"))
+
     def __init__(self, p1, p2):
         self.minX = p1[0]
         self.maxX = p2[0]
@@ -34,6 +47,10 @@ class Cuboid:
             and self.maxZ == o.maxZ
 
 
+    def __ne__(self, o):
+        return not self.__eq__(o)
+
+
     def volume(self):
         """
         Returns the volume of the cuboid.
@@ -50,6 +67,55 @@ class Cuboid:
         return w * h * d
 
 
+    def margin(self):
+        """
+        Returns the sum of edge lengths of the cuboid (divided by 4).
+
+        Examples:
+        >>> Cuboid((1, -2, -1), (2, -1, 1)).margin()
+        4
+        """
+        return (self.maxX - self.minX) + (self.maxY - self.minY) \
+            + (self.maxZ - self.minZ)
+
+
+    def extent(self):
+        """
+        Returns the number of integral points within the cuboid.
+        Unlike volume it doesn't vanish for flat cuboids.
+
+        Examples:
+        >>> Cuboid((0, 0, 0), (10, 2, 0)).extent()
+        33
+        >>> Cuboid((1, -2, -1), (2, -1, 1)).extent()
+        12
+        """
+        w = self.maxX - self.minX + 1
+        h = self.maxY - self.minY + 1
+        d = self.maxZ - self.minZ + 1
+        return w * h * d
+
+
+    def overlapExtent(self, oc):
+        """
+        Returns the number of integral points shared by
+        this cuboid and another.
+
+        Examples:
+        >>> c = Cuboid((0, 0, 0), (10, 2, 0))
+        >>> c.overlapExtent(Cuboid((10, 1, 0), (12, 4, 0)))
+        2
+        >>> c.overlapExtent(Cuboid((11, 1, 0), (12, 4, 0)))
+        0
+        """
+        w = min(self.maxX, oc.maxX) - max(self.minX, oc.minX) + 1
+        h = min(self.maxY, oc.maxY) - max(self.minY, oc.minY) + 1
+        d = min(self.maxZ, oc.maxZ) - max(self.minZ, oc.minZ) + 1
+        if w <= 0 or h <= 0 or d <= 0:
+            return 0
+        return w * h * d
+
+
     def overlap(self, oc):
         """
         Returns the volume of overlapping part of
@@ -68,8 +134,9 @@ class Cuboid:
 
 
     def contains(self, oc):
-        return self.containsPoint(oc.minX, oc.minY, oc.minZ) \
-            and self.containsPoint(oc.maxX, oc.maxY, oc.maxZ)
+        return self.minX <= oc.minX and oc.maxX <= self.maxX \
+            and self.minY <= oc.minY and oc.maxY <= self.maxY \
+            and self.minZ <= oc.minZ and oc.maxZ <= self.maxZ
 
 
     def containsPoint(self, x, y, z):
@@ -109,17 +176,26 @@ class Cuboid:
         True
         >>> c.intersects(d)
         True
+        >>> a.intersects(Cuboid((2, 0, 1), (3, 0, 2)))
+        False
         """
         if self == oc:
             return True
-        inter = self.intersection(oc)
-        if inter.volume() > 0:
-            return True
-        elif inter != NullCuboid:
-            return True
-        else:
+        if self is NullCuboid or oc is NullCuboid:
             return False
 
+        w = (self.maxX if self.maxX < oc.maxX else oc.maxX) \
+            - (self.minX if self.minX > oc.minX else oc.minX)
+        if w < 0: return False
+        h = (self.maxY if self.maxY < oc.maxY else oc.maxY) \
+            - (self.minY if self.minY > oc.minY else oc.minY)
+        if h < 0: return False
+        d = (self.maxZ if self.maxZ < oc.maxZ else oc.maxZ) \
+            - (self.minZ if self.minZ > oc.minZ else oc.minZ)
+        if d < 0: return False
+        # touching in a single point only
+        return w != 0 or h != 0 or d != 0
+
 
     def intersection(self, oc):
         """
@@ -171,15 +247,27 @@ class Cuboid:
     def viewIntersects(self, oc):
         """
         Returns True if this cuboid intersects another oc in view.
+
+        Examples:
+        >>> a = Cuboid((0, 0, 0), (2, 2, 0))
+        >>> a.viewIntersects(Cuboid((1, 2, 5), (3, 4, 6)))
+        True
+        >>> a.viewIntersects(Cuboid((2, 2, 0), (3, 4, 0)))
+        False
         """
         if self == oc:
             return True
-        inter = self.viewIntersection(oc)
-        if inter != NullCuboid:
-            return True
-        else:
+        if self is NullCuboid or oc is NullCuboid:
             return False
 
+        w = (self.maxX if self.maxX < oc.maxX else oc.maxX) \
+            - (self.minX if self.minX > oc.minX else oc.minX)
+        if w < 0: return False
+        h = (self.maxY if self.maxY < oc.maxY else oc.maxY) \
+            - (self.minY if self.minY > oc.minY else oc.minY)
+        if h < 0: return False
+        return w != 0 or h != 0
+
 
     def union(self, oc):
         """
@@ -255,11 +343,16 @@ class Cuboid:
 NullCuboid = Cuboid((0, 0, 0), (0, 0, 0))
 
 
-class Rect:
+class Rect(object):
     """
     2D plane rectangle using integer coordinates.
     """
 
+    __slots__ = ("minX", "maxX", "minY", "maxY")
+
+    # Names of lower and upper bound attributes for each axis
+    axes = (("minX", "maxX"), ("minY", "maxY"))
+
     def __init__(self, p1, p2):
         self.minX = p1[0]
         self.maxX = p2[0]
@@ -280,6 +373,10 @@ class Rect:
             and self.maxY == o.maxY
 
 
+    def __ne__(self, o):
+        return not self.__eq__(o)
+
+
     def volume(self):
         """
         Returns the area (volume) of the rectangle.
@@ -295,6 +392,47 @@ class Rect:
         return w * h
 
 
+    def margin(self):
+        """
+        Returns the half of the rectangle perimeter.
+
+        Examples:
+        >>> Rect((1, -3), (5, 5)).margin()
+        12
+        """
+        return (self.maxX - self.minX) + (self.maxY - self.minY)
+
+
+    def extent(self):
+        """
+        Returns the number of integral points within the rectangle.
+
+        Examples:
+        >>> Rect((0, 4), (0, 5)).extent()
+        2
+        """
+        return (self.maxX - self.minX + 1) * (self.maxY - self.minY + 1)
+
+
+    def overlapExtent(self, oc):
+        """
+        Returns the number of integral points shared by this rectangle
+        and another one.
+
+        Examples:
+        >>> c = Rect((0, 0), (3, 2))
+        >>> c.overlapExtent(Rect((3, 2), (8, 4)))
+        1
+        >>> c.overlapExtent(Rect((5, -4), (8, -1)))
+        0
+        """
+        w = min(self.maxX, oc.maxX) - max(self.minX, oc.minX) + 1
+        h = min(self.maxY, oc.maxY) - max(self.minY, oc.minY) + 1
+        if w <= 0 or h <= 0:
+            return 0
+        return w * h
+
+
     def overlap(self, oc):
         """
         Returns the area of overlapping part of this rectangle and another one.
@@ -312,8 +450,8 @@ class Rect:
 
 
     def contains(self, oc):
-        return self.containsPoint(oc.minX, oc.minY) \
-            and self.containsPoint(oc.maxX, oc.maxY)
+        return self.minX <= oc.minX and oc.maxX <= self.maxX \
+            and self.minY <= oc.minY and oc.maxY <= self.maxY
     
 
     def containsPoint(self, x, y):
@@ -353,14 +491,18 @@ class Rect:
         """
         if self == oc:
             return True
-        inter = self.intersection(oc)
-        if inter.volume() > 0:
-            return True
-        elif inter != NullRect:
-            return True
-        else:
+        if self is NullRect or oc is NullRect:
             return False
 
+        w = (self.maxX if self.maxX < oc.maxX else oc.maxX) \
+            - (self.minX if self.minX > oc.minX else oc.minX)
+        if w < 0: return False
+        h = (self.maxY if self.maxY < oc.maxY else oc.maxY) \
+            - (self.minY if self.minY > oc.minY else oc.minY)
+        if h < 0: return False
+        # touching in a single point only
+        return w != 0 or h != 0
+
 
     def intersection(self, oc):
         """
@@ -443,27 +585,47 @@ NullRect = Rect((0, 0), (0, 0))
 class RTree:
     """
     RTree implementation based on Cuboids with integral coordinates.
+
+    The tree supports two insertion strategies selected by mode:
+    QUADRATIC is the Guttman's quadratic split and RSTAR applies
+    R*-tree subtree choice, split and forced reinsertion.
     """
 
-    class LeafEntry:
+    # Insertion strategies
+    QUADRATIC = 0
+    RSTAR = 1
+
+    # Part of entries of overflown node reinserted in RSTAR mode
+    REINSERT_FACTOR = 0.3
+
+    # Minimal number of node children scanned with numpy
+    VECTOR_THRESHOLD = 16
+
+    class LeafEntry(object):
         """
         A leaf entry contains cuboid and the object.
+        It has also the leaf node containing it.
         """
 
+        __slots__ = ("cuboid", "obj", "node")
+
         def __init__(self, cuboid, obj):
             self.cuboid = cuboid
             self.obj = obj
+            self.node = None
 
 
         def __repr__(self):
             return "Leaf: %s %s" % (self.cuboid, self.obj)
 
 
-    class IndexEntry:
+    class IndexEntry(object):
         """
         An index entry contains cuboid and the index to next Node.
         """
 
+        __slots__ = ("cuboid", "index")
+
         def __init__(self, cuboid, index):
             self.cuboid = cuboid
             self.index = index
@@ -473,16 +635,22 @@ class RTree:
             return "Index: %s" % (self.cuboid)
 
 
-    class Node:
+    class Node(object):
         """
         Node contains children of either LeafEntries or IndexEntries.
         It contains at least RTree.minSize to RTree.pageSize at most entries.
         It has also the parent unless a tree root.
+        The bounding cuboid is cached and has to be maintained
+        by modifying children only through Node methods.
         """
 
+        __slots__ = ("cuboidClass", "children", "bounds", "array", "parent")
+
         def __init__(self, cuboidClass, parent = None, firstElem = None):
             self.cuboidClass = cuboidClass
             self.children = []
+            self.bounds = None
+            self.array = None
             if firstElem is not None:
                 self.addChild(firstElem)
             self.parent = parent
@@ -507,7 +675,28 @@ class RTree:
             """
             Returns minimal bounding cuboid for this node.
             """
-            return self.cuboidClass.unionAll(self.cuboids())
+            if self.bounds is None:
+                if not self.children:
+                    # no caching of null cuboid which is compared by identity
+                    return self.cuboidClass.unionAll(())
+                self.bounds = self.cuboidClass.unionAll(self.cuboids())
+            return self.bounds
+
+
+        def block(self):
+            """
+            Returns numpy array with rows of lower and upper bounds
+            of children cuboids along each axis. Returns None if numpy
+            is not available or a child has null cuboid.
+            """
+            if self.array is None:
+                if numpy is None:
+                    return None
+                if [c for c in self.children if _isNull(c.cuboid)]:
+                    return None
+                self.array = numpy.array([[getattr(c.cuboid, a) for c in self.children] \
+                    for axis in self.cuboidClass.axes for a in axis], numpy.int64)
+            return self.array
 
 
         def findEntry(self, subnode):
@@ -526,8 +715,13 @@ class RTree:
 
         def addChild(self, entry):
             self.children.append(entry)
+            self.array = None
+            if self.bounds is not None:
+                self.bounds = self.bounds.union(entry.cuboid)
             if isinstance(entry, RTree.IndexEntry):
                 entry.index.parent = self
+            else:
+                entry.node = self
         
 
         def addChildren(self, entries):
@@ -535,13 +729,178 @@ class RTree:
                 self.addChild(e)
 
 
-    def __init__(self, pageSize = 20, minSize = 10, cuboidClass = Cuboid):
+        def removeChild(self, entry):
+            self.children.remove(entry)
+            self.bounds = None
+            self.array = None
+
+
+        def setChildren(self, entries):
+            self.children = []
+            self.bounds = None
+            self.array = None
+            self.addChildren(entries)
+
+
+        def updateEntry(self, entry, cuboid):
+            """
+            Changes cuboid of the entry keeping bounds of this node.
+            """
+            old = entry.cuboid
+            entry.cuboid = cuboid
+            self.array = None
+            if self.bounds is not None:
+                if cuboid.contains(old):
+                    self.bounds = self.bounds.union(cuboid)
+                else:
+                    self.bounds = None
+
+
+    def __init__(self, pageSize = 20, minSize = 10, cuboidClass = Cuboid, mode = QUADRATIC):
         self.__size = 0
         self.__cuboidClass = cuboidClass
         self.__level = 1
         self.__pageSize = pageSize
         self.__minSize = minSize
+        self.__mode = mode
         self.__root = self.Node(self.__cuboidClass)
+        # Leaf entries by identity of objects
+        self.__leaves = {}
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_RTree__leaves"]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__leaves = {}
+        for e in self.iterateOverLeaves(self.__root):
+            self.__leaves.setdefault(id(e.obj), []).append(e)
+
+
+    @classmethod
+    def bulkLoad(cls, entries, pageSize = 20, minSize = 10, cuboidClass = Cuboid, mode = QUADRATIC):
+        """
+        Builds fully packed RTree from a sequence of (cuboid, obj) pairs
+        using Sort-Tile-Recursive algorithm.
+
+        Example:
+        >>> rtree = RTree.bulkLoad([(Cuboid((i, 0, 0), (i+1, 1, 0)), i) for i in xrange(100)])
+        >>> len(rtree)
+        100
+        >>> rtree.level()
+        2
+        >>> sorted(rtree.query(Cuboid((10, 0, 0), (11, 1, 0))))
+        [9, 10, 11]
+        """
+        tree = cls(pageSize, minSize, cuboidClass, mode)
+        level = [cls.LeafEntry(cuboid, obj) for (cuboid, obj) in entries]
+        tree.__size = len(level)
+        for e in level:
+            tree.__leaves.setdefault(id(e.obj), []).append(e)
+        while len(level) > pageSize:
+            nodes = []
+            for group in tree.tile(level):
+                node = cls.Node(cuboidClass)
+                node.addChildren(group)
+                nodes.append(node)
+            level = [cls.IndexEntry(n.mbc(), n) for n in nodes]
+            tree.__level += 1
+        tree.__root.addChildren(level)
+        return tree
+
+
+    def tile(self, entries):
+        """
+        Sorts entries into vertical slabs and then each slab into
+        groups of at most pageSize entries.
+        """
+        count = int(math.ceil(len(entries) / float(self.__pageSize)))
+        slabs = int(math.ceil(math.sqrt(count)))
+        entries = sorted(entries, key = lambda e: e.cuboid.minX + e.cuboid.maxX)
+        for slab in _partition(entries, slabs):
+            slab.sort(key = lambda e: e.cuboid.minY + e.cuboid.maxY)
+            count = int(math.ceil(len(slab) / float(self.__pageSize)))
+            for group in _partition(slab, count):
+                yield group
+
+
+    def pack(self, key):
+        """
+        Returns layout of the tree as a list of (leaf, entries) nodes
+        in preorder, the root first. Entries are (bounds, ref) pairs where
+        bounds are lower and then upper cuboid coordinates and ref is
+        the number of child node or key(obj) for leaf entries.
+
+        Example:
+        >>> rtree = RTree.bulkLoad([(Cuboid((i, 0, 0), (i+1, 1, 0)), i) for i in xrange(30)])
+        >>> nodes = rtree.pack(lambda obj: obj)
+        >>> [(leaf, len(entries)) for (leaf, entries) in nodes]
+        [(False, 2), (True, 15), (True, 15)]
+        >>> nodes[1][1][0]
+        ((0, 0, 0, 1, 1, 0), 0)
+        """
+        nodes = []
+        axes = self.__cuboidClass.axes
+
+        def bounds(c):
+            return tuple(getattr(c, lo) for (lo, hi) in axes) \
+                + tuple(getattr(c, hi) for (lo, hi) in axes)
+
+        def visit(node):
+            number = len(nodes)
+            entries = []
+            nodes.append((node.isLeaf(), entries))
+            if node.isLeaf():
+                for c in node.children:
+                    entries.append((bounds(c.cuboid), key(c.obj)))
+            else:
+                for c in node.children:
+                    entries.append((bounds(c.cuboid), visit(c.index)))
+            return number
+
+        visit(self.__root)
+        return nodes
+
+
+    @classmethod
+    def unpack(cls, nodes, resolve, pageSize = 20, minSize = 10, cuboidClass = Cuboid, mode = QUADRATIC):
+        """
+        Builds RTree from layout returned by pack, leaf objects
+        are obtained by resolve(ref).
+
+        Example:
+        >>> rtree = RTree.bulkLoad([(Cuboid((i, 0, 0), (i+1, 1, 0)), i) for i in xrange(30)])
+        >>> names = dict((i, str(i)) for i in xrange(30))
+        >>> copy = RTree.unpack(rtree.pack(lambda obj: obj), names.get)
+        >>> (len(copy), copy.level())
+        (30, 2)
+        >>> sorted(copy.query(Cuboid((10, 0, 0), (11, 1, 0))))
+        ['10', '11', '9']
+        """
+        tree = cls(pageSize, minSize, cuboidClass, mode)
+        dims = len(cuboidClass.axes)
+
+        def build(node, number, level):
+            (leaf, entries) = nodes[number]
+            for (bounds, ref) in entries:
+                cuboid = cuboidClass(bounds[:dims], bounds[dims:])
+                if leaf:
+                    entry = cls.LeafEntry(cuboid, resolve(ref))
+                    tree.__leaves.setdefault(id(entry.obj), []).append(entry)
+                    tree.__size += 1
+                else:
+                    entry = cls.IndexEntry(cuboid, cls.Node(cuboidClass))
+                    build(entry.index, ref, level + 1)
+                node.addChild(entry)
+            if leaf:
+                tree.__level = level
+
+        build(tree.__root, 0, 1)
+        return tree
 
 
     def insert(self, cuboid, obj):
@@ -561,19 +920,25 @@ class RTree:
         >>> rtree.level()
         1
         """
-        # choose leaf
-        node = self.chooseLeaf(self.__root, cuboid)
-        splitNode = None
-        newEntry = self.LeafEntry(cuboid, obj)
+        entry = self.LeafEntry(cuboid, obj)
+        self.__leaves.setdefault(id(obj), []).append(entry)
         self.__size += 1
-        if len(node.children) < self.__pageSize:
-            # install E
-            node.children.append(newEntry)
-        else:
-            # split node
-            node, splitNode = self.splitNode(node, newEntry)
+        self.insertEntry(entry, 1, set())
+
+
+    def insertEntry(self, entry, height, reinserted):
+        """
+        Inserts the entry into a node at given height, leaves
+        are at height 1. The reinserted set contains heights at which
+        forced reinsertion already took place.
+        """
+        orphans = []
+        # choose subtree
+        node = self.chooseSubtree(entry.cuboid, height)
+        # install E, split node if necessary
+        node, splitNode = self.installEntry(node, entry, height, reinserted, orphans)
         # adjust tree
-        node, splitNode = self.adjustTree(node, splitNode)
+        node, splitNode = self.adjustTree(node, splitNode, height, reinserted, orphans)
         # if node split propagation caused root to split
         if splitNode is not None:
             root = self.Node(self.__cuboidClass)
@@ -581,38 +946,117 @@ class RTree:
             root.addChild(self.IndexEntry(splitNode.mbc(), splitNode))
             self.__level += 1
             self.__root = root
-            
-        
+        # reinsert entries removed from overflown nodes
+        for (e, h) in orphans:
+            self.insertEntry(e, h, reinserted)
 
 
-    def chooseLeaf(self, node, cuboid):
+    def installEntry(self, node, entry, height, reinserted, orphans):
         """
-        Select a leaf node in which to place a new LeafEntry.
+        Adds the entry to the node. Overflown node is split or,
+        in RSTAR mode, some of its entries are moved to orphans
+        for a reinsertion.
         """
-        if node.isLeaf():
-            return node
-        else:
-            child = None
-            minVol = -1
-            for c in node.children:
-                v = c.cuboid.union(cuboid).volume() - c.cuboid.volume()
-                if minVol < 0 or v < minVol:
-                    minVol = v
-                    child = c.index
-
-            return self.chooseLeaf(child, cuboid)
+        if len(node.children) < self.__pageSize:
+            node.addChild(entry)
+            return (node, None)
+        if self.__mode == RTree.RSTAR and not node.isRoot() \
+                and height not in reinserted:
+            reinserted.add(height)
+            node.addChild(entry)
+            orphans.extend((e, height) for e in self.pickReinserts(node))
+            return (node, None)
+        return self.splitNode(node, entry)
+
+
+    def chooseSubtree(self, cuboid, height):
+        """
+        Select a node at given height in which to place a new entry.
+        """
+        node = self.__root
+        level = self.__level
+        while level > height:
+            if self.__mode == RTree.RSTAR:
+                node = self.pickSubtreeRStar(node, cuboid, level == 2)
+            else:
+                node = self.pickSubtree(node, cuboid)
+            level -= 1
+        return node
+
+
+    def pickSubtree(self, node, cuboid):
+        """
+        Select a child node which needs least enlargement to include cuboid.
+        """
+        child = None
+        minVol = -1
+        for c in node.children:
+            v = c.cuboid.union(cuboid).volume() - c.cuboid.volume()
+            if minVol < 0 or v < minVol:
+                minVol = v
+                child = c.index
+        return child
+
+
+    def pickSubtreeRStar(self, node, cuboid, leavesBelow):
+        """
+        Select a child node for the cuboid using R*-tree criteria:
+        least overlap enlargement if children are leaves,
+        least extent enlargement otherwise.
+        """
+        child = None
+        best = None
+        for c in node.children:
+            union = c.cuboid.union(cuboid)
+            extent = c.cuboid.extent()
+            key = (union.extent() - extent, extent)
+            if leavesBelow:
+                overlap = 0
+                for o in node.children:
+                    if o is not c:
+                        overlap += union.overlapExtent(o.cuboid) \
+                            - c.cuboid.overlapExtent(o.cuboid)
+                key = (overlap,) + key
+            if best is None or key < best:
+                best = key
+                child = c.index
+        return child
+
+
+    def pickReinserts(self, node):
+        """
+        Removes from overflown node entries which are the most distant
+        from its center and returns them, closest first.
+        """
+        mbc = node.mbc()
+        axes = self.__cuboidClass.axes
+
+        def distance(e):
+            d = 0
+            for (lo, hi) in axes:
+                c = getattr(e.cuboid, lo) + getattr(e.cuboid, hi) \
+                    - getattr(mbc, lo) - getattr(mbc, hi)
+                d += c * c
+            return d
+
+        count = max(1, int(self.REINSERT_FACTOR * self.__pageSize))
+        entries = sorted(node.children, key = distance)
+        node.setChildren(entries[:-count])
+        return entries[-count:]
     
 
     def splitNode(self, node, newElem):
         """
         Divide a set of M+1 entries into two groups.
         """
+        if self.__mode == RTree.RSTAR:
+            return self.splitNodeRStar(node, newElem)
+
         entries = node.children + [newElem]
         s1, s2 = self.pickSeeds(entries)
         #ga = self.Node(node.parent, s1)
         ga = node
-        ga.children = []
-        ga.addChild(s1)
+        ga.setChildren([s1])
         gb = self.Node(self.__cuboidClass, node.parent, s2)
         while len(entries) > 0:
             # 3.5.2. if one group has so few entries...
@@ -641,6 +1085,57 @@ class RTree:
         return (ga, gb)
 
 
+    def splitNodeRStar(self, node, newElem):
+        """
+        Divide a set of M+1 entries into two groups using R*-tree
+        split. The axis with minimal margin of distributions is chosen
+        first, then the distribution with minimal overlap.
+        """
+        entries = node.children + [newElem]
+        best = None
+        bestMargin = None
+        for (lo, hi) in self.__cuboidClass.axes:
+            sorts = [
+                sorted(entries, key = lambda e: (getattr(e.cuboid, lo), getattr(e.cuboid, hi))),
+                sorted(entries, key = lambda e: (getattr(e.cuboid, hi), getattr(e.cuboid, lo)))]
+            margin = 0
+            distributions = []
+            for s in sorts:
+                for (k, a, b) in self.distributions(s):
+                    margin += a.margin() + b.margin()
+                    distributions.append(((a.overlapExtent(b), a.extent() + b.extent()), s, k))
+            if bestMargin is None or margin < bestMargin:
+                bestMargin = margin
+                best = distributions
+
+        (key, s, k) = min(best, key = lambda d: d[0])
+        ga = node
+        ga.setChildren(s[:k])
+        gb = self.Node(self.__cuboidClass, node.parent)
+        gb.addChildren(s[k:])
+        return (ga, gb)
+
+
+    def distributions(self, entries):
+        """
+        Generates all divisions of sorted entries into two groups
+        having at least minSize entries, along with their bounding cuboids.
+        """
+        count = len(entries)
+        prefix = [None] * count
+        suffix = [None] * count
+        r = entries[0].cuboid
+        for i in xrange(count):
+            r = r.union(entries[i].cuboid)
+            prefix[i] = r
+        r = entries[-1].cuboid
+        for i in xrange(count - 1, -1, -1):
+            r = r.union(entries[i].cuboid)
+            suffix[i] = r
+        for k in xrange(self.__minSize, count - self.__minSize + 1):
+            yield (k, prefix[k-1], suffix[k])
+
+
     def pickSeeds(self, entries):
         """
         Selects two entries to be the first elements of the groups.
@@ -680,27 +1175,22 @@ class RTree:
         return next
 
         
-    def adjustTree(self, node, splitNode):
+    def adjustTree(self, node, splitNode, height, reinserted, orphans):
         """
-        Ascend from a leaf node to the root, adjusting covering
+        Ascend from a node at given height to the root, adjusting covering
         cubics and propagating node splits as necessary.
         """
         while not node.isRoot():
             parent = node.parent
             subEntry = parent.findEntry(node)
             assert subEntry is not None, node
-            subEntry.cuboid = node.mbc()
+            parent.updateEntry(subEntry, node.mbc())
             if splitNode is not None:
                 nnEntry = self.IndexEntry(splitNode.mbc(), splitNode)
-                if len(parent.children) < self.__pageSize:
-                    parent.addChild(nnEntry)
-                    splitNode = None
-                else:
-                    # split node
-                    node, splitNode = self.splitNode(parent, nnEntry)
-            #else:
-            #    node = parent
+                node, splitNode = self.installEntry(parent, nnEntry, height + 1,
+                    reinserted, orphans)
             node = parent
+            height += 1
         return node, splitNode
         
         
@@ -728,26 +1218,98 @@ class RTree:
         >>> list(iter(rtree))
         ['a', 'c']
         """
-        deleted = False
-        leafNode = self.findLeaf(self.__root, obj, cuboid)
-        if leafNode is None:
+        entry = self.findEntry(obj, cuboid)
+        if entry is None:
             return False # nothing was removed
-        dindex = -1
-        for c in leafNode.children:
-            dindex += 1
-            if c.obj == obj:
-                break
-        if dindex > -1:
-            del leafNode.children[dindex]
-            self.__size -= 1
-            deleted = True
+        entries = self.__leaves[id(entry.obj)]
+        entries.remove(entry)
+        if not entries:
+            del self.__leaves[id(entry.obj)]
+        self.__size -= 1
+        self.detachEntry(entry)
+        return True
+
+
+    def update(self, obj, cuboid):
+        """
+        Changes the cuboid of the object found by identity. The entry
+        is updated in place if the cuboid fits within the bounds of
+        its leaf's parent, otherwise it is reinserted.
+
+        Examples:
+        >>> rtree = RTree(minSize = 1, pageSize = 2)
+        >>> a, b, c = ['a'], ['b'], ['c']
+        >>> rtree.insert(Cuboid((0, 0, 0), (1, 1, 0)), a)
+        >>> rtree.insert(Cuboid((2, 2, 0), (3, 3, 0)), b)
+        >>> rtree.insert(Cuboid((8, 8, 0), (9, 9, 0)), c)
+        >>> rtree.update(b, Cuboid((20, 20, 0), (21, 21, 0)))
+        True
+        >>> list(rtree.queryPoint(2, 2, 0)), list(rtree.queryPoint(20, 20, 0))
+        ([], [['b']])
+        >>> rtree.update(['a'], Cuboid((0, 0, 0), (1, 1, 0)))
+        False
+        """
+        entries = self.__leaves.get(id(obj))
+        if not entries:
+            return False
+        entry = entries[0]
+        node = entry.node
+        if node.isRoot() or node.parent.mbc().contains(cuboid):
+            node.updateEntry(entry, cuboid)
+            self.adjustTree(node, None, 1, set(), [])
+        else:
+            self.detachEntry(entry)
+            entry.cuboid = cuboid
+            self.insertEntry(entry, 1, set())
+        return True
+
+
+    def detachEntry(self, entry):
+        """
+        Removes the leaf entry from its node and condenses the tree.
+        """
+        leafNode = entry.node
+        leafNode.removeChild(entry)
         self.condenseTree(leafNode)
         # reassign root
-        if len(self.__root.children) == 1 and self.__size > 1:
+        while len(self.__root.children) == 1 and not self.__root.isLeaf():
             self.__root = self.__root.children[0].index
             self.__root.parent = None
             self.__level -= 1
-        return deleted
+
+
+    def containsObject(self, obj):
+        """
+        Returns True if the object itself (not an equal one) is in RTree.
+
+        Examples:
+        >>> rtree = RTree()
+        >>> a, b = [1], [1]
+        >>> rtree.insert(Cuboid((0, 0, 0), (1, 1, 0)), a)
+        >>> rtree.containsObject(a), rtree.containsObject(b)
+        (True, False)
+        """
+        return id(obj) in self.__leaves
+
+
+    def findEntry(self, obj, cuboid):
+        """
+        Finds the leaf entry of the object. The object is looked up by
+        identity first, then among entries intersecting the cuboid
+        by equality.
+        """
+        entries = self.__leaves.get(id(obj))
+        if entries:
+            for e in entries:
+                if e.cuboid == cuboid:
+                    return e
+            return entries[0]
+        leafNode = self.findLeaf(self.__root, obj, cuboid)
+        if leafNode is not None:
+            for e in leafNode.children:
+                if e.obj == obj:
+                    return e
+        return None
 
 
     def findLeaf(self, node, o, cuboid):
@@ -756,7 +1318,7 @@ class RTree:
         """
         if not node.isLeaf():
             for c in node.children:
-                if c.cuboid.intersects(cuboid):
+                if c.cuboid.contains(cuboid) or c.cuboid.intersects(cuboid):
                     leafNode = self.findLeaf(c.index, o, cuboid)
                     if leafNode is not None:
                         return leafNode
@@ -781,16 +1343,16 @@ class RTree:
             subEntry = parent.findEntry(node)
             assert subEntry is not None, node
             if len(node.children) < self.__minSize:
-                parent.children.remove(subEntry)
+                parent.removeChild(subEntry)
                 toEliminate.append(node)
             else:
-                subEntry.cuboid = node.mbc()
+                parent.updateEntry(subEntry, node.mbc())
             node = parent
             parent = node.parent
         # reinsert orphaned entries
         for n in toEliminate:
-            for ins in self.iterateOverLeaves(n):
-                self.insert(ins.cuboid, ins.obj)
+            for ins in list(self.iterateOverLeaves(n)):
+                self.insertEntry(ins, 1, set())
 
 
     def query(self, cuboid):
@@ -806,7 +1368,8 @@ class RTree:
         ['bbb']
         """
         def p(o): return cuboid.intersects(o.cuboid)
-        return self._query(self.__root, p)
+        def m(b): return _intersectsMask(b, cuboid, len(cuboid.axes))
+        return self._query(self.__root, p, None if _isNull(cuboid) else m)
 
 
     def queryView(self, cuboid):
@@ -814,21 +1377,40 @@ class RTree:
         Finds all records that predicate is met.
         """
         def p(o): return cuboid.viewIntersects(o.cuboid)
-        return self._query(self.__root, p)
+        def m(b): return _intersectsMask(b, cuboid, 2)
+        return self._query(self.__root, p, None if _isNull(cuboid) else m)
 
 
-    def _query(self, node, pred):
-        if not node.isLeaf():
-            for c in node.children:
-                if pred(c):
-                    for s in self._query(c.index, pred):
-                        yield s
-        else:
-            for c in node.children:
-                if pred(c):
+    def _query(self, node, pred, mask = None):
+        """
+        Yields objects of entries matching the predicate. The mask
+        is vectorized form of the predicate applied to Node.block().
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            matched = self._match(node, pred, mask)
+            if not node.isLeaf():
+                # reversed to keep depth-first order of results
+                for c in reversed(matched):
+                    stack.append(c.index)
+            else:
+                for c in matched:
                     yield c.obj
 
 
+    def _match(self, node, pred, mask):
+        """
+        Returns children of the node matching the predicate.
+        """
+        children = node.children
+        if mask is not None and len(children) >= self.VECTOR_THRESHOLD:
+            block = node.block()
+            if block is not None:
+                return [children[i] for i in numpy.flatnonzero(mask(block))]
+        return [c for c in children if pred(c)]
+
+
     def queryPoint(self, x, y, z):
         """
         Queries for the point.
@@ -842,7 +1424,60 @@ class RTree:
         ['bbb']
         """
         def p(o): return o.cuboid.containsPoint(x, y, z)
-        return self._query(self.__root, p)
+        def m(b): return _containsPointMask(b, (x, y, z))
+        # numpy can't compare Decimal coordinates
+        integral = [v for v in (x, y, z) if isinstance(v, (int, long))]
+        return self._query(self.__root, p, m if len(integral) == 3 else None)
+
+
+    def nearest(self, x, y, k = 1, maxDist = None, distance = None):
+        """
+        Finds objects nearest to the point (x, y) in view, yielding
+        (distance, object) pairs in order of increasing distance.
+        At most k objects (all if k is None) not farther than maxDist
+        are returned.
+
+        The distance of an object is the distance of its cuboid unless
+        the distance function is given. The function is called lazily
+        for candidates and must not return less than the distance
+        of the object cuboid.
+
+        Examples:
+        >>> rtree = RTree()
+        >>> rtree.insert(Cuboid((0, 0, 0), (2, 2, 0)), 'a')
+        >>> rtree.insert(Cuboid((5, 0, 0), (6, 1, 0)), 'b')
+        >>> rtree.insert(Cuboid((0, 10, 0), (1, 11, 0)), 'c')
+        >>> list(rtree.nearest(4, 0))
+        [(1.0, 'b')]
+        >>> [o for (d, o) in rtree.nearest(4, 0, None)]
+        ['b', 'a', 'c']
+        >>> list(rtree.nearest(4, 0, 3, 2.0))
+        [(1.0, 'b'), (2.0, 'a')]
+        """
+        x = float(x)
+        y = float(y)
+        # items are (distance, sequence, item, resolved)
+        heap = [(0.0, 0, self.__root, True)]
+        sequence = 1
+        count = 0
+        while heap and (k is None or count < k):
+            d, seq, item, resolved = heapq.heappop(heap)
+            if maxDist is not None and d > maxDist:
+                break
+            if isinstance(item, RTree.LeafEntry):
+                if resolved:
+                    count += 1
+                    yield (d, item.obj)
+                else:
+                    heapq.heappush(heap, (distance(item.obj), seq, item, True))
+            else:
+                resolve = distance is None or not item.isLeaf()
+                for c in item.children:
+                    cd = _viewDistance(c.cuboid, x, y)
+                    if maxDist is None or cd <= maxDist:
+                        e = c if item.isLeaf() else c.index
+                        heapq.heappush(heap, (cd, sequence, e, resolve))
+                        sequence += 1
 
 
     def __len__(self):
@@ -861,6 +1496,14 @@ class RTree:
             yield l.obj
         
 
+    def items(self):
+        """
+        Iterates over (cuboid, object) pairs in RTree.
+        """
+        for l in self.iterateOverLeaves(self.__root):
+            yield (l.cuboid, l.obj)
+
+
     def iterateOverLeaves(self, node):
         if node.isLeaf():
             for c in node.children:
@@ -888,16 +1531,23 @@ class RTree:
 
     def checkParents(self):
         """
-        Sanity check for parents of nodes.
+        Sanity check for parents and cached bounding cuboids of nodes.
         """
         self._checkParents(self.__root)
+        assert self.__size == sum(len(l) for l in self.__leaves.values())
         
 
     def _checkParents(self, node):
+        assert node.mbc() == self.__cuboidClass.unionAll(node.cuboids()), node
         if not node.isLeaf():
             for c in node.children:
                 assert c.index.parent is node, (c.index, node)
+                assert c.cuboid == c.index.mbc(), (c.cuboid, c.index)
                 self._checkParents(c.index)
+        else:
+            for c in node.children:
+                assert c.node is node, c
+                assert c in self.__leaves[id(c.obj)], c
 
 
     def getRoot(self):
@@ -908,3 +1558,66 @@ class RTree:
         return self.__root.mbc()
 
 
+
+def _viewDistance(c, x, y):
+    """
+    Returns the distance of a point from the cuboid in view.
+
+    Examples:
+    >>> _viewDistance(Cuboid((0, 0, 0), (2, 2, 5)), 5, 6)
+    5.0
+    >>> _viewDistance(Cuboid((0, 0, 0), (2, 2, 5)), 1, 1)
+    0.0
+    """
+    dx = c.minX - x if x < c.minX else (x - c.maxX if x > c.maxX else 0.0)
+    dy = c.minY - y if y < c.minY else (y - c.maxY if y > c.maxY else 0.0)
+    return math.sqrt(dx * dx + dy * dy)
+
+
+def _isNull(c):
+    return c is NullCuboid or c is NullRect
+
+
+def _intersectsMask(block, c, axes):
+    """
+    Vectorized intersects test of cuboid c with columns of Node.block()
+    on the first given number of axes.
+    """
+    overlaps = True
+    touches = True
+    equal = True
+    for (i, (lo, hi)) in enumerate(c.axes):
+        clo, chi = getattr(c, lo), getattr(c, hi)
+        blo, bhi = block[2*i], block[2*i+1]
+        if i < axes:
+            w = numpy.minimum(bhi, chi) - numpy.maximum(blo, clo)
+            overlaps = overlaps & (w >= 0)
+            touches = touches & (w == 0)
+        equal = equal & (blo == clo) & (bhi == chi)
+    return (overlaps & ~touches) | equal
+
+
+def _containsPointMask(block, point):
+    """
+    Vectorized containsPoint test of columns of Node.block().
+    """
+    inside = True
+    for (i, v) in enumerate(point):
+        inside = inside & (block[2*i] <= v) & (v <= block[2*i+1])
+    return inside
+
+
+def _partition(seq, count):
+    """
+    Divides the list into count contiguous parts of nearly equal size.
+
+    Example:
+    >>> [len(p) for p in _partition(range(47), 3)]
+    [16, 16, 15]
+    """
+    size, rest = divmod(len(seq), count)
+    start = 0
+    for i in xrange(count):
+        end = start + size + (1 if i < rest else 0)
+        yield seq[start:end]
+        start = end
@@ -40,8 +40,8 @@ boost::int32_t Vec3::hash() const
     int seed = 17;
 
     seed = seed * 31 + _x.hash();
-    seed = seed * 31 + _x.hash();
-    seed = seed * 31 + _x.hash();
+    seed = seed * 31 + _y.hash();
+    seed = seed * 31 + _z.hash();
 
     return seed;
 }
@@ -7,6 +7,10 @@ It maps tags of YAML documents to Python classes
 
 import yaml
 
+from yaml.events import AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent, \
+    MappingStartEvent, MappingEndEvent, StreamEndEvent
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
 import model.tracks
 import model.groups
 import model.scenery
@@ -48,15 +52,24 @@ def represent_AxleCounter(dumper, data):
          "railtracking": data.getRailTracking(), \
          "3dpoint": data.getGeometryPoint()})
 
-class SptLoader(yaml.Loader):
+try:
+    from yaml import CLoader as _CLoader, CDumper as _CDumper
+except ImportError:
+    _CLoader, _CDumper = yaml.Loader, yaml.Dumper
+
+class SptConstructor(object):
     """
-    Base YAML loader for SPT model classes.
+    Constructors of SPT model classes for YAML loaders.
+
+    The snapshot attribute may be set to db.rtxfile.IndexSnapshot
+    of the document to restore the index of top level rail container.
     """
 
-    def __init__(self, stream):
-        yaml.Loader.__init__(self, stream)
+    def __init__(self):
+        self.snapshot = None
 
-         # This is a stack for parent rail containers if any
+         # This is a stack of children collected for parent rail containers
+         # if any, they are inserted at once when container is complete
         self.__stack = []
         
         classes = ["Vec3", "Track", "Switch", "RailContainer", "AxleCounter", "Scenery"]
@@ -79,7 +92,7 @@ class SptLoader(yaml.Loader):
             result.name = data["name"]
             
         if len(self.__stack) > 0:
-            self.__stack[-1].insert(result)
+            self.__stack[-1].append(result)
 
         return result
 
@@ -92,20 +105,25 @@ class SptLoader(yaml.Loader):
 
     def construct_RailContainer(self, loader, node):
         c = model.groups.RailContainer()
-        self.__stack.append(c)
+        self.__stack.append([])
 
         map = loader.construct_mapping(node, deep=True)
         if "name" in map:
             c.name = map["name"]
 
-        del self.__stack[-1]
+        children = self.__stack.pop()
+        if len(self.__stack) == 1:
+            # top level container of scenery
+            c.insertAll(children, self.snapshot)
+        else:
+            c.insertAll(children)
         if len(self.__stack) > 0:
-            self.__stack[-1].insert(c)
+            self.__stack[-1].append(c)
         return c
 
     def construct_Scenery(self, loader, node):
         s = model.scenery.Scenery()
-        self.__stack = [s.tracks];
+        self.__stack = [[]];
         map = loader.construct_mapping(node, deep=False)
         s.tracks = map["tracks"]
         return s
@@ -119,10 +137,215 @@ class SptLoader(yaml.Loader):
 #        self.parent.insert(a)
         return a
 
+class SptLoader(yaml.Loader, SptConstructor):
+    """
+    Base YAML loader for SPT model classes.
+    """
+
+    def __init__(self, stream):
+        yaml.Loader.__init__(self, stream)
+        SptConstructor.__init__(self)
+
+class SptCLoader(_CLoader, SptConstructor):
+    """
+    YAML loader for SPT model classes using libyaml parser if available.
+    """
+
+    def __init__(self, stream):
+        _CLoader.__init__(self, stream)
+        SptConstructor.__init__(self)
+
+class SptCDumper(_CDumper):
+    """
+    YAML dumper for SPT model classes using libyaml emitter if available.
+    """
+    pass
+
 # Dumper
-yaml.add_representer(sptmath.Vec3, represent_Vec3)
-yaml.add_representer(model.tracks.Track, represent_Track)
-yaml.add_representer(model.tracks.Switch, represent_Switch)
-yaml.add_representer(model.groups.RailContainer, represent_RailContainer)
-yaml.add_representer(model.scenery.Scenery, represent_Scenery)
-yaml.add_representer(model.vd.axleCounter.AxleCounter, represent_AxleCounter)
+for dumper in (yaml.Dumper, SptCDumper):
+    yaml.add_representer(sptmath.Vec3, represent_Vec3, dumper)
+    yaml.add_representer(model.tracks.Track, represent_Track, dumper)
+    yaml.add_representer(model.tracks.Switch, represent_Switch, dumper)
+    yaml.add_representer(model.groups.RailContainer, represent_RailContainer, dumper)
+    yaml.add_representer(model.scenery.Scenery, represent_Scenery, dumper)
+    yaml.add_representer(model.vd.axleCounter.AxleCounter, represent_AxleCounter, dumper)
+
+
+def loadScenery(stream, progress = None, snapshot = None, Loader = SptCLoader):
+    """
+    Loads scenery from YAML stream driven by parser events.
+
+    Rail containers are built directly from events, only their children
+    are composed into nodes and constructed one by one. So the document
+    node graph is never held in memory at once.
+
+    :param stream: string or file with YAML document.
+    :param progress: optional callback called with number of bytes
+        of the stream consumed so far, or of characters if the stream
+        is unicode or file.
+    :param snapshot: optional db.rtxfile.IndexSnapshot used to restore
+        index of top level rail container.
+    :param Loader: loader class with SptConstructor.
+    """
+    loader = Loader(stream)
+    loader.snapshot = snapshot
+    try:
+        data = stream if isinstance(stream, str) else None
+        return SceneryEvents(loader, progress, data).document()
+    finally:
+        loader.dispose()
+
+# Continuation bytes of UTF-8 sequences
+_UTF8_CONTINUATION = "".join(chr(c) for c in xrange(0x80, 0xc0))
+
+def byteOffset(data, start, chars):
+    """
+    Returns offset of UTF-8 encoded data after given number
+    of characters from start offset.
+
+    Example:
+    >>> byteOffset("a\xc5\x82b\xc5\x82", 0, 2)
+    3
+    >>> byteOffset("a\xc5\x82b\xc5\x82", 3, 2)
+    6
+    """
+    end = start
+    while chars > 0 and end < len(data):
+        step = data[end:end + chars]
+        # characters start at bytes other than continuation ones
+        chars -= len(step.translate(None, _UTF8_CONTINUATION))
+        end += len(step)
+    while end < len(data) and data[end] in _UTF8_CONTINUATION:
+        end += 1
+    return end
+
+class SceneryEvents(object):
+    """
+    Consumes parser events of a loader building scenery from them.
+    """
+
+    # Number of characters consumed between progress notifications
+    PROGRESS_STEP = 1 << 16
+
+    def __init__(self, loader, progress = None, data = None):
+        self.loader = loader
+        self.progress = progress
+        # UTF-8 encoded stream, marks of events count its characters
+        self.data = data
+        self.position = 0
+        self.offset = 0
+        self.anchors = {}
+
+    def event(self):
+        event = self.loader.get_event()
+        if self.progress is not None:
+            index = event.end_mark.index
+            if index - self.position >= self.PROGRESS_STEP \
+                or isinstance(event, StreamEndEvent):
+                if self.data is not None:
+                    self.offset = byteOffset(self.data, self.offset, index - self.position)
+                else:
+                    self.offset = index
+                self.position = index
+                self.progress(self.offset)
+        return event
+
+    def check(self, cls, tag = None):
+        if not self.loader.check_event(cls):
+            return False
+        return tag is None or self.loader.peek_event().tag == tag
+
+    def document(self):
+        self.event()
+        if self.check(StreamEndEvent):
+            return None
+        self.event()
+        if self.check(MappingStartEvent, u"Scenery"):
+            result = self.scenery()
+        else:
+            result = self.value()
+        self.event()
+        if not self.check(StreamEndEvent):
+            raise yaml.composer.ComposerError("expected a single document in the stream",
+                None, "but found another document", self.loader.peek_event().start_mark)
+        self.event()
+        return result
+
+    def scenery(self):
+        s = model.scenery.Scenery()
+        self.event()
+        while not self.check(MappingEndEvent):
+            if self.value() == "tracks":
+                s.tracks = self.element(True)
+            else:
+                self.value()
+        self.event()
+        return s
+
+    def element(self, top = False):
+        """
+        Builds rail container from events or constructs any other value.
+        """
+        if not self.check(MappingStartEvent, u"RailContainer"):
+            return self.value()
+
+        c = model.groups.RailContainer()
+        children = []
+        self.event()
+        while not self.check(MappingEndEvent):
+            key = self.value()
+            if key == "children":
+                self.event()
+                while not self.check(SequenceEndEvent):
+                    children.append(self.element())
+                self.event()
+            elif key == "name":
+                c.name = self.value()
+            else:
+                self.value()
+        self.event()
+
+        c.insertAll(children, self.loader.snapshot if top else None)
+        return c
+
+    def value(self):
+        return self.loader.construct_document(self.compose())
+
+    def compose(self):
+        """
+        Composes node of the next value like yaml.composer.Composer.
+        """
+        event = self.event()
+        if isinstance(event, AliasEvent):
+            if event.anchor not in self.anchors:
+                raise yaml.composer.ComposerError(None, None,
+                    "found undefined alias %r" % event.anchor, event.start_mark)
+            return self.anchors[event.anchor]
+
+        tag = event.tag
+        if isinstance(event, ScalarEvent):
+            if tag is None or tag == u"!":
+                tag = self.loader.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark,
+                style = event.style)
+        elif isinstance(event, SequenceStartEvent):
+            if tag is None or tag == u"!":
+                tag = self.loader.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None,
+                flow_style = event.flow_style)
+            while not self.check(SequenceEndEvent):
+                node.value.append(self.compose())
+            node.end_mark = self.event().end_mark
+        else:
+            if tag is None or tag == u"!":
+                tag = self.loader.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None,
+                flow_style = event.flow_style)
+            while not self.check(MappingEndEvent):
+                key = self.compose()
+                node.value.append((key, self.compose()))
+            node.end_mark = self.event().end_mark
+
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+        return node
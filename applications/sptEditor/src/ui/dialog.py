@@ -14,6 +14,7 @@ import os.path
 import sys
 import traceback
 import logging
+import multiprocessing
 
 from model.tracks import Track, Switch
 import ui.editor
@@ -443,12 +444,26 @@ class ExportDialog(wx.Dialog):
         """Does the right export."""
         self.Enable(False)
 
-        trackings = self.GetParent().editor.GetScenery().tracks
+        editor = self.GetParent().editor
+        scenery = editor.GetScenery()
+        # Editor keeps querying scenery meanwhile, tiles mustn't be
+        # evicted and lists are taken in GUI thread
+        capacity = scenery.capacity
+        scenery.capacity = sys.maxint
+        scenery.LoadAll()
+        tracks = list(scenery.tracks.tracks())
+        switches = list(scenery.tracks.switches())
+        processes = wx.FileConfig.Get().ReadInt("/ExportDialog/processes",
+            multiprocessing.cpu_count())
+        # Sectors changed later are exported next time
+        tracker = editor.sectorTracker
+        dirty = tracker.dirty(dest)
+        tracker.exported(dest)
         delayed.startWorker(self.ExportComplete,
             self.ExportWorkerJob,
-            cargs = (dir, name),
-            wargs = (dest, trackings.tracks(), trackings.switches(),
-                self.UpdatePercent))
+            cargs = (dir, name, dest, tracker, scenery, capacity),
+            wargs = (dest, tracks, switches,
+                self.UpdatePercent, processes, dirty))
 #            writer = db.sctwriter.SectorWriter(file(filename, "w"), sptmath.Vec3())
 #            scenery = self.editor.GetScenery()
 #            for t in scenery.tracks.tracks():
@@ -469,8 +484,9 @@ class ExportDialog(wx.Dialog):
 
     def ExportWorkerJob(self, *wargs):
         """Job run in separate thread."""
-        (directory, tracks, switches, updateCallback) = wargs
-        db.export.exportScenery(directory, tracks, switches, updateCallback)
+        (directory, tracks, switches, updateCallback, processes, dirty) = wargs
+        db.export.exportScenery(directory, tracks, switches, updateCallback,
+            processes, dirty)
         return True
 
     
@@ -485,6 +501,8 @@ class ExportDialog(wx.Dialog):
             config.Write("/ExportDialog/dir", cargs[0])
 
         except Exception, inst:
+            # Check all sectors next time
+            cargs[3].invalidate(cargs[2])
             raise inst
             self.__UpdatePercent(100)
             logging.exception("Error during scenery export")
@@ -492,6 +510,7 @@ class ExportDialog(wx.Dialog):
             wx.MessageBox("Error during scenery export.",
                 "Export scenery error", wx.OK | wx.ICON_ERROR, self)
         finally:
+            cargs[4].capacity = cargs[5]
             self.Enable(True)
 
 
@@ -16,9 +16,13 @@ import Application
 import sptial
 import model.tracks
 import model.scenery
+import db.export
 from ui.rulers import Ruler
 import ui.views
 import ui.trackfc
+import ui.tilecache
+import ui.lod
+import ui.pickbuffer
 from sptmath import Vec3
 
 
@@ -56,6 +60,7 @@ class SceneryEditor(wx.Panel):
 
         self.scenery = None        
         self.sceneryListener = SceneryListener(self)
+        self.sectorTracker = None
         self.selection = None
 
         sizer.Add(corner)
@@ -75,9 +80,12 @@ class SceneryEditor(wx.Panel):
         """
         if self.scenery is not None:
             self.scenery.UnregisterListener(self.sceneryListener)
+            self.scenery.UnregisterListener(self.sectorTracker)
         self.scenery = scenery
         self.SetSelection(None)
         self.scenery.RegisterListener(self.sceneryListener)
+        self.sectorTracker = db.export.SectorTracker(scenery)
+        self.scenery.RegisterListener(self.sectorTracker)
         for part in self.parts:
             part.SetScenery(scenery)
 
@@ -165,6 +173,11 @@ class PlanePart(wx.ScrolledWindow):
         self.main_window.SetStatusText("%.3f px/m" % SCALE_DEFAULT, 2)
 
         self.bounds = EditorBounds()
+        self.tileCache = ui.tilecache.TileCache()
+        self.lodCache = None
+        self.pickBuffer = None
+        if wx.FileConfig.Get().ReadInt("/PlanePart/pickBuffer", 1):
+            self.pickBuffer = ui.pickbuffer.PickBuffer()
 
         self.basePointView = None
 
@@ -196,6 +209,11 @@ class PlanePart(wx.ScrolledWindow):
     def SetScenery(self, scenery):
         mbc = scenery.GetMbc()
         self.bounds.Update(mbc.min(), mbc.max())
+        self.tileCache.Clear()
+        if self.pickBuffer is not None:
+            self.pickBuffer.Clear()
+        ui.views.GetGeometryCache().Clear()
+        self.lodCache = ui.lod.LodCache(scenery)
         self.Refresh()
         
         
@@ -331,6 +349,34 @@ class PlanePart(wx.ScrolledWindow):
         """        
         return self.bounds.ModelToView(point)
 
+
+    def GetElementAt(self, point):
+        """
+        Gets the scenery element closest to 2D point of UI editor
+        coordinates within highlight distance or None. The element
+        is looked up in pick buffer if it's rendered for the point.
+        """
+        if self.pickBuffer is not None and not self.bounds.scale.isLargeScale():
+            return self.pickBuffer.Pick(self.bounds, point, self.FindElementAt)
+        return self.FindElementAt(point)
+
+
+    def FindElementAt(self, point):
+        """
+        Finds the scenery element closest to 2D point of UI editor
+        coordinates within highlight distance or None using exact
+        geometry of elements.
+        """
+        scale = self.bounds.scale.get()
+        p3d = self.ViewToModel(point)
+
+        def distance(e):
+            return ui.views.GetViewer(e).GetDistance(self.bounds, point) / scale
+
+        found = next(self.GetScenery().Nearest(p3d, 1, \
+            ui.views.HIGHLIGHT_DISTANCE / scale, distance), None)
+        return found[1] if found is not None else None
+
     def CenterViewAt(self, (requiered_position_x, requiered_position_y)):
         """
         Centers the view on following point in pixels.
@@ -383,7 +429,7 @@ class PlanePart(wx.ScrolledWindow):
 
         startTime = datetime.datetime.now()
         try:
-            self.PaintBackground(dc, clip, context)
+            self.PaintTiles(dc, clip)
             self.PaintForeground(dc, clip, context)
         finally:
             if self.logger.isEnabledFor(logging.DEBUG):
@@ -393,6 +439,86 @@ class PlanePart(wx.ScrolledWindow):
                 self.logger.debug(u"Paint lasted %d \u00b5s" % idelta)
 
 
+    def PaintTiles(self, dc, clip):
+        """
+        Paints static layer, that is background and rail trackings,
+        from tile cache. Missing tiles are rendered.
+        """
+        self.tileCache.Validate(self.bounds)
+        picking = self.pickBuffer is not None and not self.bounds.scale.isLargeScale()
+        if picking:
+            self.pickBuffer.Validate(self.bounds)
+
+        for key in self.tileCache.GetKeys(self.bounds.scale.get(), clip):
+            bitmap = self.tileCache.Get(key, self.RenderTile)
+            rect = self.tileCache.GetRect(key)
+            dc.DrawBitmap(bitmap, rect.x, rect.y)
+            if picking:
+                self.pickBuffer.Get(key, self.RenderPickTile)
+
+
+    def RenderTile(self, key):
+        """
+        Renders bitmap of static layer for tile cache.
+        """
+        rect = self.tileCache.GetRect(key)
+        bitmap = wx.EmptyBitmap(rect.width, rect.height)
+        dc = wx.MemoryDC()
+        dc.SelectObject(bitmap)
+        try:
+            dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+            dc.Clear()
+            dc.SetDeviceOrigin(-rect.x, -rect.y)
+
+            context = ui.views.DrawContext(dc, self.bounds)
+            self.PaintBackground(dc, rect, context)
+            self.PaintTracks(dc, rect, context)
+        finally:
+            dc.SelectObject(wx.NullBitmap)
+        return bitmap
+
+
+    def RenderPickTile(self, key):
+        """
+        Renders tile of pick buffer.
+        """
+        rect = self.pickBuffer.GetRect(key)
+        margin = self.pickBuffer.margin
+        p3a = self.ViewToModel((rect.x - margin, rect.y - margin))
+        p3b = self.ViewToModel((rect.x + rect.width + margin, rect.y + rect.height + margin))
+
+        viewport = sptial.Cuboid.fromEndpoints([p3a, p3b])
+        elements = list(self.GetParent().scenery.Query(viewport))
+        return self.pickBuffer.Render(key, self.bounds, elements)
+
+
+    def InvalidateElement(self, element):
+        """
+        Drops cached tiles and pick buffer tiles showing the scenery
+        element, its polylines and level of detail geometry of its
+        sectors.
+        """
+        getBox = ui.views.GetViewer(element).GetBox
+        ui.views.GetGeometryCache().Invalidate(element)
+        self.tileCache.Invalidate(self.bounds, getBox)
+        if self.pickBuffer is not None:
+            self.pickBuffer.Invalidate(self.bounds, getBox)
+        if self.lodCache is not None:
+            # simplified polylines may change in the whole sector
+            for bounds in self.lodCache.Invalidate(element):
+                self.tileCache.Invalidate(self.bounds, ui.lod.SectorViewer(bounds).GetBox)
+
+
+    def UnloadElement(self, element):
+        """
+        Drops pick buffer tiles and polylines referring to the scenery
+        element evicted from tracks. Tiles show it still.
+        """
+        ui.views.GetGeometryCache().Invalidate(element)
+        if self.pickBuffer is not None:
+            self.pickBuffer.Invalidate(self.bounds, ui.views.GetViewer(element).GetBox)
+
+
     def PaintBackground(self, dc, clip, context):
         """
         Paints part background.
@@ -471,9 +597,8 @@ class PlanePart(wx.ScrolledWindow):
 
     def PaintForeground(self, dc, clip, context):
         """
-        Paints foreground
+        Paints foreground over static layer.
         """
-        self.PaintTracks(dc, clip, context)
         self.PaintSelection(dc, clip, context)
         self.PaintSnapPoint(dc, clip, context)
         self.PaintBasePoint(dc, clip, context)
@@ -481,21 +606,42 @@ class PlanePart(wx.ScrolledWindow):
         
     def PaintTracks(self, dc, clip, context):
         """
-        Paint rail trackings.
+        Paint rail trackings within clip rectangle.
         """
-
-        (vx, vy) = self.GetViewStart()
-        (ux, uy) = self.GetScrollPixelsPerUnit()
-        (sx, sy) = self.GetSize()
-
-        p3a = self.ViewToModel((vx*ux, vy*uy))
-        p3b = self.ViewToModel((vx*ux + sx, vy*uy + sy))
+        margin = ui.tilecache.TILE_MARGIN
+        p3a = self.ViewToModel((clip.x - margin, clip.y - margin))
+        p3b = self.ViewToModel((clip.x + clip.width + margin, clip.y + clip.height + margin))
         
         viewport = sptial.Cuboid.fromEndpoints([p3a, p3b])
+        if self.bounds.scale.isLargeScale() and self.lodCache is not None:
+            self.PaintLod(context, viewport)
+            return
         elements = self.GetParent().scenery.Query(viewport)
-        
+
+        batch = ui.views.DrawBatch(context)
         for t in elements:
-            ui.views.GetViewer(t).Draw(context)
+            ui.views.GetViewer(t).AddTo(batch)
+        batch.Draw()
+
+
+    def PaintLod(self, context, viewport):
+        """
+        Paints level of detail geometry of rail trackings within
+        viewport in scenery coordinates.
+        """
+        scale = self.bounds.scale.get()
+        (minX, maxY) = (float(self.bounds.minX), float(self.bounds.maxY))
+        (extentX, extentY) = (self.bounds.extentX, self.bounds.extentY)
+        colours = {ui.lod.KIND_TRACK: ui.views.COLOR_TRACK,
+            ui.lod.KIND_SWITCH: ui.views.COLOR_SWITCH}
+
+        batch = ui.views.DrawBatch(context)
+        for (kind, polyline) in self.lodCache.GetPolylines(scale,
+                viewport.minX, viewport.minY, viewport.maxX, viewport.maxY):
+            # the same transformation as EditorBounds.ModelToView
+            batch.Add(colours[kind], [[(int((x - minX) * scale + extentX),
+                int((maxY - y) * scale + extentY)) for (x, y) in polyline]])
+        batch.Draw()
             
             
     def PaintSelection(self, dc, clip, context):
@@ -974,22 +1120,26 @@ class BasePointMover:
             foundSnapData = None
             updateScreen = False
             
-            p2a = wx.Point(point.x - 5, point.y - 5)
-            p2b = wx.Point(point.x + 5, point.y + 5)
-            p3a = self.editorPart.ViewToModel(p2a)
-            p3b = self.editorPart.ViewToModel(p2b)            
-            
-            viewport = sptial.Cuboid.fromEndpoints([p3a, p3b])
-            elements = self.editorPart.GetParent().scenery.Query(viewport)
-            
-            for v in elements:
-                foundSnapData = ui.views.GetViewer(v).GetSnapData(self.editorPart.bounds, point)
-                if foundSnapData is not None:
-                    self.editorPart.snapData = foundSnapData
+            scale = self.editorPart.bounds.scale.get()
+            snapDistance = math.sqrt(ui.views.SNAP_DISTANCE_SQ)
+            p3d = self.editorPart.ViewToModel(point)
+            scenery = self.editorPart.GetParent().scenery
+            elements = scenery.Nearest(p3d, None, snapDistance / scale)
+
+            # Elements come closest first, stop when none can have closer snap point
+            foundDistance = None
+            for (d, v) in elements:
+                if foundDistance is not None and d * scale > foundDistance:
                     break
+                snapData = ui.views.GetViewer(v).GetSnapData(self.editorPart.bounds, point)
+                # Points leading into unloaded tiles are connected already
+                if snapData is not None and not scenery.IsStub(snapData.p3d):
+                    distance = math.hypot(snapData.p2d[0] - point.x, snapData.p2d[1] - point.y)
+                    if foundDistance is None or distance < foundDistance:
+                        foundSnapData = snapData
+                        foundDistance = distance
  
-            if foundSnapData is None:
-                self.editorPart.snapData = None
+            self.editorPart.snapData = foundSnapData
             if oldSnapData is not None:
                 self.editorPart.RedrawRect(
                     wx.Rect(oldSnapData.p2d[0]-10, oldSnapData.p2d[1]-10, 20, 20))
@@ -1067,15 +1217,10 @@ class TrackClosurer:
             return # Return immediately
 
         point = self.__editor.CalcUnscrolledPosition(event.GetPosition())
-        rect = self.__editor.bounds.GetHighlightRect(point)
-        viewport = sptial.Cuboid.fromEndpoints(rect)
 
         startTime = datetime.datetime.now()
         try:
-            scenery = self.__editor.GetParent().GetScenery()
-            
-            elements = scenery.Query(viewport)
-            selectedElement = next((e for e in elements if self.IsSelectionPossible(e, point)), None)
+            selectedElement = self.__editor.GetElementAt(point)
             
             if selectedElement is None:
                 # Reset mode to default
@@ -1102,10 +1247,6 @@ class TrackClosurer:
             idelta = delta.days * 86400 + delta.seconds * 1000000 \
                 + delta.microseconds
             self.__editor.logger.debug(u"Create closure track lasted %d \u00b5s" % idelta)
-            
-            
-    def IsSelectionPossible(self, element, point):
-        return ui.views.GetViewer(element).IsSelectionPossible(self.__editor.bounds, point)
 
 
 
@@ -1153,24 +1294,15 @@ class Highlighter:
     def OnMouseClick(self, event):
         if self.__enabled and not self.editorPart.basePointMover.pressed:
             point = self.editorPart.CalcUnscrolledPosition(event.GetPosition())
-            rect = self.editorPart.bounds.GetHighlightRect(point)
-            viewport = sptial.Cuboid.fromEndpoints(rect)
 
             startTime = datetime.datetime.now()
             try:
-                scenery = self.editorPart.GetScenery()
-                elements = scenery.Query(viewport)
-                selectedElement = next((e for e in elements if self.IsSelectionPossible(e, point)), None)
+                selectedElement = self.editorPart.GetElementAt(point)
                 self.editorPart.GetParent().SetSelection(selectedElement)
             finally:
                 delta = datetime.datetime.now() - startTime
                 idelta = delta.days * 86400 + delta.seconds * 1000000 + delta.microseconds
                 self.editorPart.logger.debug(u"Selection lasted %d \u00b5s" % idelta)
-                
-                
-    def IsSelectionPossible(self, element, point):
-        return ui.views.GetViewer(element).IsSelectionPossible(self.editorPart.bounds, point)
-    
 
 
 
@@ -1221,8 +1353,14 @@ class SceneryListener(model.scenery.SceneryListener):
     def Add(self, scenery, element):
         self.__refresh(scenery, element)
 
+    def Unload(self, scenery, element):
+        if element == self.editor.GetSelection():
+            self.editor.SetSelection(None)
+        self.editor.parts[0].UnloadElement(element)
+
     def __refresh(self, scenery, element):
         part = self.editor.parts[0]
+        part.InvalidateElement(element)
         
         mbc = scenery.GetMbc()
         resizeNeeded = part.bounds.Update(mbc.min(), mbc.max())
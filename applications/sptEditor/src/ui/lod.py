@@ -0,0 +1,302 @@
+"""
+Module containing level of detail geometry of scenery for zoomed-out
+views of editor, the ones at large scales.
+
+Geometry of rail trackings is aggregated in sectors. Segments between
+end points of tracks and switch legs are joined into polylines, which
+are simplified for each scale, so a zoomed-out view draws a few
+polylines per sector instead of every rail tracking.
+"""
+
+import math
+import collections
+
+import wx
+
+import sptial
+import model.tracks
+import model.groups
+import db.sctwriter
+
+# Size of sector in meters, the same as of exported sectors
+LOD_SECTOR_SIZE = db.sctwriter.SECTOR_SIZE
+# Maximal distance of simplified polyline from geometry in pixels
+LOD_TOLERANCE = 0.5
+
+# Kinds of polylines
+KIND_TRACK = 0
+KIND_SWITCH = 1
+
+_Point = collections.namedtuple("_Point", "x y")
+
+
+def simplify(points, tolerance):
+    """
+    Simplifies polyline with Douglas-Peucker algorithm, so it
+    doesn't deviate from the original by more than tolerance.
+
+    Example:
+    >>> simplify([(0.0, 0.0), (1.0, 0.1), (2.0, 0.0), (3.0, 5.0)], 0.5)
+    [(0.0, 0.0), (2.0, 0.0), (3.0, 5.0)]
+    """
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    sqTolerance = tolerance * tolerance
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        (first, last) = stack.pop()
+        (ax, ay) = points[first]
+        (bx, by) = points[last]
+        dx = bx - ax
+        dy = by - ay
+        sqLength = dx * dx + dy * dy
+
+        index = None
+        maxSq = sqTolerance
+        for i in xrange(first + 1, last):
+            (px, py) = points[i]
+            if sqLength == 0.0:
+                sq = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                cross = (px - ax) * dy - (py - ay) * dx
+                sq = cross * cross / sqLength
+            if sq > maxSq:
+                index = i
+                maxSq = sq
+
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [p for (p, k) in zip(points, keep) if k]
+
+
+def chain(segments):
+    """
+    Joins segments sharing end points into polylines. Polylines
+    end at points where other number than two segments meet.
+
+    Example:
+    >>> chain([((1, 0), (2, 0)), ((0, 0), (1, 0)), ((1, 0), (1, 1)), ((5, 5), (6, 6))])
+    [[(1, 0), (2, 0)], [(0, 0), (1, 0)], [(1, 0), (1, 1)], [(5, 5), (6, 6)]]
+    >>> chain([((0, 0), (1, 0)), ((1, 0), (2, 0)), ((2, 0), (3, 1))])
+    [[(0, 0), (1, 0), (2, 0), (3, 1)]]
+    """
+    ends = {}
+    for (i, (a, b)) in enumerate(segments):
+        ends.setdefault(a, []).append(i)
+        ends.setdefault(b, []).append(i)
+
+    used = [False] * len(segments)
+
+    def follow(point, i):
+        polyline = [point]
+        while True:
+            used[i] = True
+            (a, b) = segments[i]
+            point = b if a == point else a
+            polyline.append(point)
+            following = [j for j in ends[point] if not used[j]]
+            if len(ends[point]) != 2 or not following:
+                return polyline
+            i = following[0]
+
+    result = []
+    # polylines starting at loose ends and junctions
+    for (i, (a, b)) in enumerate(segments):
+        if used[i]:
+            continue
+        if len(ends[a]) != 2:
+            result.append(follow(a, i))
+        elif len(ends[b]) != 2:
+            result.append(follow(b, i))
+    # closed loops
+    for (i, (a, b)) in enumerate(segments):
+        if not used[i]:
+            result.append(follow(a, i))
+    return result
+
+
+def leaves(element):
+    """
+    Returns tracks and switches of the scenery element.
+    """
+    if isinstance(element, model.groups.RailContainer):
+        return list(element.tracks()) + list(element.switches())
+    return [element]
+
+
+
+
+class Sector:
+    """
+    Segments of rail trackings having p1 point in the sector
+    and their polylines simplified for scales.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.tracks = []
+        self.switches = []
+        self.bounds = None
+        # Scales and lists of (kind, polyline) pairs
+        self.levels = {}
+
+
+    def Add(self, tracking):
+        if isinstance(tracking, model.tracks.Switch):
+            pc = _point(tracking.pc)
+            segments = [(pc, _point(tracking.p1)), (pc, _point(tracking.p2))]
+            self.switches.extend(segments)
+        else:
+            segments = [(_point(tracking.p1), _point(tracking.p2))]
+            self.tracks.extend(segments)
+
+        xs = [p[0] for s in segments for p in s]
+        ys = [p[1] for s in segments for p in s]
+        if self.bounds is not None:
+            xs.extend(self.bounds[0::2])
+            ys.extend(self.bounds[1::2])
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+
+    def GetPolylines(self, scale):
+        """
+        Returns list of (kind, polyline) pairs simplified for scale.
+        """
+        if scale not in self.levels:
+            tolerance = LOD_TOLERANCE / scale
+            self.levels[scale] = \
+                [(KIND_TRACK, simplify(p, tolerance)) for p in chain(self.tracks)] \
+                + [(KIND_SWITCH, list(s)) for s in self.switches]
+        return self.levels[scale]
+
+
+
+
+class LodCache:
+    """
+    Level of detail geometry of scenery. Sectors are indexed when
+    geometry is requested for the first time and the changed ones
+    are indexed again on request after being invalidated.
+    """
+
+    def __init__(self, scenery, size = LOD_SECTOR_SIZE):
+        self.scenery = scenery
+        self.size = size
+        # Sector keys and sectors, None until indexed
+        self.sectors = None
+        # Keys of sectors changed since indexed
+        self.stale = set()
+
+
+    def GetKey(self, tracking):
+        """
+        Returns key of sector containing p1 point of rail tracking,
+        as in db.export.sectorPosition.
+        """
+        p = tracking.p1
+        return (int(math.floor(float(p.x) / self.size)), int(math.floor(float(p.y) / self.size)))
+
+
+    def GetPolylines(self, scale, minX, minY, maxX, maxY):
+        """
+        Returns list of (kind, polyline) pairs simplified for scale
+        of sectors overlapping the rectangle in scenery coordinates.
+        Points of polylines are (x, y) tuples of floats.
+        """
+        self.__index()
+
+        result = []
+        for sector in self.sectors.itervalues():
+            (sx1, sy1, sx2, sy2) = sector.bounds
+            if sx1 <= maxX and minX <= sx2 and sy1 <= maxY and minY <= sy2:
+                result.extend(sector.GetPolylines(scale))
+        return result
+
+
+    def Invalidate(self, element):
+        """
+        Marks sectors of the scenery element changed and returns
+        list of their bounds as (minX, minY, maxX, maxY) tuples
+        before the change.
+        """
+        result = []
+        for tracking in leaves(element):
+            key = self.GetKey(tracking)
+            if self.sectors is not None and key in self.sectors:
+                result.append(self.sectors[key].bounds)
+            self.stale.add(key)
+        return result
+
+
+    def __index(self):
+        if self.sectors is None:
+            self.sectors = {}
+            self.stale = set()
+            for element in self.scenery.RailTrackingIterator():
+                self.__add(element)
+
+        if self.stale:
+            for key in self.stale:
+                self.sectors.pop(key, None)
+                (x, y) = key
+                cuboid = sptial.Cuboid((x * self.size, y * self.size, 0),
+                    ((x + 1) * self.size, (y + 1) * self.size, 0))
+                for element in self.scenery.Query(cuboid):
+                    self.__add(element, key)
+            self.stale = set()
+
+
+    def __add(self, element, only = None):
+        for tracking in leaves(element):
+            key = self.GetKey(tracking)
+            if only is None or key == only:
+                if key not in self.sectors:
+                    self.sectors[key] = Sector(key)
+                self.sectors[key].Add(tracking)
+
+
+
+
+class SectorViewer:
+    """
+    Viewer of sector bounds in views drawn with level of detail
+    geometry, used for dropping tiles of changed sectors.
+    """
+
+    def __init__(self, bounds):
+        (minX, minY, maxX, maxY) = bounds
+        self.min = _Point(minX, minY)
+        self.max = _Point(maxX, maxY)
+
+
+    def GetBox(self, bounds):
+        """
+        Gets the rectangle of sector, or None if view at scale
+        of bounds doesn't use level of detail geometry.
+
+        Examples:
+        >>> from ui.editor import EditorBounds, Scale
+        >>> bounds = EditorBounds()
+        >>> SectorViewer((-10.0, 0.0, 20.0, 40.0)).GetBox(bounds)
+        >>> bounds.scale = Scale(0.4)
+        >>> SectorViewer((-10.0, 0.0, 20.0, 40.0)).GetBox(bounds)
+        wx.Rect(496, 484, 13, 17)
+        """
+        if not bounds.scale.isLargeScale():
+            return None
+        (left, top) = bounds.ModelToView(_Point(self.min.x, self.max.y))
+        (right, bottom) = bounds.ModelToView(_Point(self.max.x, self.min.y))
+        return wx.Rect(left, top, right - left + 1, bottom - top + 1)
+
+
+
+
+def _point(p):
+    return (float(p.x), float(p.y))
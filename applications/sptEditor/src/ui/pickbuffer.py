@@ -0,0 +1,100 @@
+"""
+Module containing pick buffer of editor view.
+"""
+
+import wx
+
+import ui.views
+import ui.tilecache
+
+
+
+
+def encode(index):
+    """
+    Encodes index of element as RGB colour. Black is background.
+
+    Example:
+    >>> encode(1)
+    (1, 0, 0)
+    >>> encode(70000)
+    (112, 17, 1)
+    """
+    return (index & 0xff, (index >> 8) & 0xff, (index >> 16) & 0xff)
+
+
+def decode(red, green, blue):
+    """
+    Decodes index of element from RGB colour.
+
+    Example:
+    >>> decode(*encode(70000))
+    70000
+    """
+    return red | (green << 8) | (blue << 16)
+
+
+
+
+class PickBuffer(ui.tilecache.TileCache):
+    """
+    Offscreen buffer of scenery elements rendered in tiles of tile
+    cache. Each pixel within highlight distance of rail trackings
+    encodes index of the closest one, so picking an element is
+    a pixel lookup.
+
+    Lines of elements are drawn from the widest pen covering the
+    highlight distance to the narrowest one, each narrower pass
+    overwriting pixels closer to the lines.
+    """
+
+    def __init__(self, size = ui.tilecache.TILE_SIZE, capacity = ui.tilecache.TILE_CAPACITY):
+        ui.tilecache.TileCache.__init__(self, size, capacity)
+        self.margin = ui.views.HIGHLIGHT_DISTANCE + 1
+
+
+    def Render(self, key, bounds, elements):
+        """
+        Renders tile of scenery elements and returns it as
+        (image, elements) pair.
+        """
+        context = ui.views.DrawContext(None, bounds)
+        lines = []
+        for element in elements:
+            batch = ui.views.DrawBatch(context)
+            ui.views.GetViewer(element).AddTo(batch)
+            lines.append(sum(batch.groups.itervalues(), []))
+
+        rect = self.GetRect(key)
+        bitmap = wx.EmptyBitmap(rect.width, rect.height, 24)
+        dc = wx.MemoryDC()
+        dc.SelectObject(bitmap)
+        try:
+            dc.SetBackground(wx.BLACK_BRUSH)
+            dc.Clear()
+            dc.SetDeviceOrigin(-rect.x, -rect.y)
+
+            for width in xrange(2 * ui.views.HIGHLIGHT_DISTANCE + 1, 0, -2):
+                for (index, l) in enumerate(lines):
+                    dc.DrawLineList(l, wx.Pen(wx.Colour(*encode(index + 1)), width))
+        finally:
+            dc.SelectObject(wx.NullBitmap)
+        return (bitmap.ConvertToImage(), elements)
+
+
+    def Pick(self, bounds, point, find):
+        """
+        Returns scenery element at the point in view or None.
+        If the tile of the point isn't rendered for bounds, the
+        element is found by calling find with the point.
+        """
+        self.Validate(bounds)
+        (key,) = self.GetKeys(bounds.scale.get(), wx.Rect(point[0], point[1], 1, 1))
+        if key not in self.tiles:
+            return find(point)
+
+        (image, elements) = self.tiles[key]
+        rect = self.GetRect(key)
+        (x, y) = (point[0] - rect.x, point[1] - rect.y)
+        index = decode(image.GetRed(x, y), image.GetGreen(x, y), image.GetBlue(x, y))
+        return elements[index - 1] if index > 0 else None
@@ -0,0 +1,125 @@
+"""
+Module containing cache of pre-rendered tiles of editor view.
+"""
+
+import copy
+import collections
+
+import wx
+
+# Size of tile in pixels
+TILE_SIZE = 256
+# Number of tiles kept in cache
+TILE_CAPACITY = 96
+# Margin in pixels of drawn elements outside their boxes
+TILE_MARGIN = 3
+
+
+
+
+class TileCache:
+    """
+    Cache of bitmaps with static layer of editor view rendered
+    in square tiles. Tiles are keyed by (scale, tile x, tile y) in
+    view coordinates and the least recently used ones are dropped
+    when more than capacity tiles are cached.
+
+    All tiles are dropped when geometry of editor bounds changes,
+    as view coordinates are shifted then.
+    """
+
+    def __init__(self, size = TILE_SIZE, capacity = TILE_CAPACITY):
+        self.size = size
+        self.capacity = capacity
+        # Margin in pixels of drawn elements outside their boxes
+        self.margin = TILE_MARGIN
+        # Tile keys and bitmaps in order of use
+        self.tiles = collections.OrderedDict()
+        # Geometry of bounds the tiles were rendered with
+        self.geometry = None
+
+
+    def __len__(self):
+        return len(self.tiles)
+
+
+    def Validate(self, bounds):
+        """
+        Drops all tiles if geometry of bounds changed since tiles
+        were rendered.
+        """
+        geometry = (bounds.minX, bounds.maxX, bounds.minY, bounds.maxY,
+            bounds.extentX, bounds.extentY)
+        if geometry != self.geometry:
+            self.Clear()
+            self.geometry = geometry
+
+
+    def Clear(self):
+        """
+        Drops all tiles.
+        """
+        self.tiles.clear()
+
+
+    def GetKeys(self, scale, rect):
+        """
+        Returns keys of tiles covering the rectangle in view.
+
+        Example:
+        >>> cache = TileCache(100)
+        >>> cache.GetKeys(1.0, wx.Rect(-10, 50, 120, 50))
+        [(1.0, -1, 0), (1.0, 0, 0), (1.0, 1, 0)]
+        """
+        return [(scale, x, y)
+            for y in xrange(rect.y // self.size, (rect.y + rect.height - 1) // self.size + 1)
+            for x in xrange(rect.x // self.size, (rect.x + rect.width - 1) // self.size + 1)]
+
+
+    def GetRect(self, key):
+        """
+        Returns rectangle of tile in view.
+
+        Example:
+        >>> TileCache(100).GetRect((1.0, -1, 2))
+        wx.Rect(-100, 200, 100, 100)
+        """
+        (scale, x, y) = key
+        return wx.Rect(x * self.size, y * self.size, self.size, self.size)
+
+
+    def Get(self, key, render):
+        """
+        Returns bitmap of tile. Missing tile is rendered by calling
+        render with the key.
+        """
+        if key in self.tiles:
+            bitmap = self.tiles.pop(key)
+        else:
+            bitmap = render(key)
+        self.tiles[key] = bitmap
+
+        while len(self.tiles) > self.capacity:
+            self.tiles.popitem(last = False)
+        return bitmap
+
+
+    def Invalidate(self, bounds, getBox):
+        """
+        Drops tiles showing an element at any cached scale.
+
+        :param bounds: editor bounds.
+        :param getBox: function returning rectangle of the element
+            in view for bounds, as GetBox of viewers, or None
+            if the element isn't shown at scale of bounds.
+        """
+        for scale in set(key[0] for key in self.tiles):
+            scaled = copy.copy(bounds)
+            scaled.scale = bounds.scale.__class__(scale)
+            box = getBox(scaled)
+            if box is None:
+                continue
+            rect = wx.Rect(box.x - self.margin, box.y - self.margin,
+                box.width + 2 * self.margin, box.height + 2 * self.margin)
+            for key in self.GetKeys(scale, rect):
+                self.tiles.pop(key, None)
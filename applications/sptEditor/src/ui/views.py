@@ -6,10 +6,12 @@ Module containing views of scenery elements.
 
 import math
 import os.path
+import collections
 import wx
 from sptmath import Decimal
 
 import model.tracks
+import model.groups
 import ui.editor
 import sptmath
 
@@ -75,6 +77,96 @@ COLOR_TRACK = (34, 139, 34)
 COLOR_SWITCH = (173, 255, 47)
 COLOR_HIGHLIGHT = (255, 0, 0)
 
+# Number of rail trackings kept in geometry cache
+GEOMETRY_CAPACITY = 20000
+
+
+
+
+class GeometryCache:
+    """
+    Cache of polylines of rail trackings in view, flattened from
+    bezier curves. Polylines of a tracking are keyed by flatness
+    factor of editor bounds together with geometry of bounds they
+    were computed for. The least recently used trackings are dropped
+    when more than capacity trackings are cached.
+    """
+
+    def __init__(self, capacity = GEOMETRY_CAPACITY):
+        self.capacity = capacity
+        # Ids of trackings and (tracking, {key: polylines}) pairs in order of use
+        self.entries = collections.OrderedDict()
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def Get(self, tracking, bounds, flatten):
+        """
+        Returns polylines of the rail tracking for bounds. Missing
+        polylines are computed by calling flatten with bounds.
+
+        Example:
+        >>> from editor import EditorBounds
+        >>> from model.tracks import Track
+        >>> cache = GeometryCache()
+        >>> t = Track()
+        >>> cache.Get(t, EditorBounds(), lambda bounds: ["computed"])
+        ['computed']
+        >>> cache.Get(t, EditorBounds(), lambda bounds: ["again"])
+        ['computed']
+        """
+        key = (bounds.GetBezierFlatnessFactor(), bounds.scale.get(),
+            bounds.minX, bounds.maxY, bounds.extentX, bounds.extentY)
+
+        entry = self.entries.pop(id(tracking), None)
+        if entry is None:
+            entry = (tracking, {})
+        self.entries[id(tracking)] = entry
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
+
+        levels = entry[1]
+        if key not in levels:
+            levels[key] = flatten(bounds)
+        return levels[key]
+
+
+    def Invalidate(self, element):
+        """
+        Drops polylines of the scenery element.
+        """
+        if isinstance(element, model.groups.RailContainer):
+            for tracking in element.tracks():
+                self.entries.pop(id(tracking), None)
+            for tracking in element.switches():
+                self.entries.pop(id(tracking), None)
+        else:
+            self.entries.pop(id(element), None)
+
+
+    def Clear(self):
+        """
+        Drops all polylines.
+        """
+        self.entries.clear()
+
+
+
+
+GEOMETRY_CACHE = None
+
+
+def GetGeometryCache():
+    """
+    Gets geometry cache shared by viewers of rail trackings.
+    """
+    global GEOMETRY_CACHE
+    if GEOMETRY_CACHE is None:
+        GEOMETRY_CACHE = GeometryCache()
+    return GEOMETRY_CACHE
+
 
 
 
@@ -106,6 +198,56 @@ class DrawContext:
 
 
 
+
+class DrawBatch:
+    """
+    Collects lines of scenery elements in view grouped by colour,
+    so each group is drawn with a single call of DrawLineList
+    instead of setting pen and drawing every element.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        # Colours and lists of (x1, y1, x2, y2) lines
+        self.groups = {}
+
+
+    def Add(self, colour, polylines):
+        """
+        Adds polylines in view drawn with the colour, or with
+        highlight colour if elements are selected in context.
+
+        Example:
+        >>> from editor import EditorBounds
+        >>> batch = DrawBatch(DrawContext(None, EditorBounds()))
+        >>> batch.Add(COLOR_TRACK, [[(0, 0), (5, 0), (5, 5)]])
+        >>> batch.Add(COLOR_TRACK, [[(1, 1), (2, 2)]])
+        >>> batch.groups
+        {(34, 139, 34): [(0, 0, 5, 0), (5, 0, 5, 5), (1, 1, 2, 2)]}
+        """
+        if self.context.selected:
+            colour = COLOR_HIGHLIGHT
+
+        lines = self.groups.setdefault(colour, [])
+        for polyline in polylines:
+            lines.extend((a[0], a[1], b[0], b[1]) for (a, b) in zip(polyline, polyline[1:]))
+
+
+    def Draw(self):
+        """
+        Draws collected lines on the device context and empties the batch.
+        """
+        dc = self.context.dc
+        oldPen = dc.GetPen()
+        try:
+            for (colour, lines) in self.groups.iteritems():
+                dc.DrawLineList(lines, wx.Pen(colour, 1))
+        finally:
+            dc.SetPen(oldPen)
+        self.groups.clear()
+
+
+
 class TrackViewer:
     
     def __init__(self, track):
@@ -116,28 +258,52 @@ class TrackViewer:
         """
         Draws the track on the device context.
         """
-        
-        oldPen = context.dc.GetPen()
-        try:
-            context.dc.SetPen(wx.Pen(COLOR_TRACK if not context.selected else COLOR_HIGHLIGHT,
-                3 if context.bounds.scale > 1.0 else 1))
-        
-            if (context.bounds.scale.isLargeScale()):
-                p1 = context.bounds.ModelToView(self.track.p1)
-                p2 = context.bounds.ModelToView(self.track.p2)
-                
-                context.dc.DrawLine(p1[0], p1[1], p2[0], p2[1])
-            else:
-                spline = (context.bounds.ModelToView(self.track.p1),
-                          context.bounds.ModelToView(self.track.p1 + self.track.v1),
-                          context.bounds.ModelToView(self.track.p2 + self.track.v2),
-                          context.bounds.ModelToView(self.track.p2))
-            
-                context.dc.DrawSpline(spline)
-        finally:
-            context.dc.SetPen(oldPen)
-            
-            
+        batch = DrawBatch(context)
+        self.AddTo(batch)
+        batch.Draw()
+
+
+    def AddTo(self, batch):
+        """
+        Adds lines of the track to the draw batch.
+        """
+        batch.Add(COLOR_TRACK, self.GetPolylines(batch.context.bounds))
+
+
+    def GetPolylines(self, bounds):
+        """
+        Gets the polylines of the track in view. At large scales
+        the track is a straight line between its end points.
+
+        Examples:
+        >>> from model.tracks import Track
+        >>> from editor import EditorBounds, Scale
+        >>> from sptmath import Vec3
+        >>> t = Track(p1 = Vec3("0", "0", "0"), p2 = Vec3("0", "20", "0"))
+        >>> bounds = EditorBounds()
+        >>> bounds.scale = Scale(0.4)
+        >>> [[tuple(p) for p in l] for l in TrackViewer(t).GetPolylines(bounds)]
+        [[(500, 500), (500, 492)]]
+        >>> bounds.scale = Scale(1.0)
+        >>> [[tuple(p) for p in l] for l in TrackViewer(t).GetPolylines(bounds)]
+        [[(1100, 1100), (1100, 1090), (1100, 1080)]]
+        """
+        if bounds.scale.isLargeScale():
+            return [(bounds.ModelToView(self.track.p1), bounds.ModelToView(self.track.p2))]
+        return GetGeometryCache().Get(self.track, bounds, self.Flatten)
+
+
+    def Flatten(self, bounds):
+        """
+        Returns the track flattened into polyline in view.
+        """
+        p1 = bounds.ModelToView(self.track.p1)
+        v1 = bounds.ModelToView(self.track.p1 + self.track.v1)
+        v2 = bounds.ModelToView(self.track.p2 + self.track.v2)
+        p2 = bounds.ModelToView(self.track.p2)
+        return [sptmath.toLineSegments((p1, v1, v2, p2), bounds.GetBezierFlatnessFactor())]
+
+
     def GetBox(self, bounds):
         """
         Gets the rectangle for the track.
@@ -210,32 +376,17 @@ class TrackViewer:
         >>> tv.GetSnapData(bounds, wx.Point(0, 0))
         
         """
-        p1 = bounds.ModelToView(self.track.p1)
-        p2 = bounds.ModelToView(self.track.p2)
-        
-        p1x = p1[0] - point.x
-        p1y = p1[1] - point.y
-        p2x = p2[0] - point.x
-        p2y = p2[1] - point.y
-        if (p1x * p1x + p1y * p1y <= SNAP_DISTANCE_SQ
-                and self.track.point2tracking(self.track.p1) == None):
-
-            data = ui.editor.SnapData()
-            data.p2d = p1
-            data.p3d = self.track.p1
-            data.Complete(self.track)
-            return data
-        elif (p2x * p2x + p2y * p2y <= SNAP_DISTANCE_SQ
-                and self.track.point2tracking(self.track.p2) == None):
-            data = ui.editor.SnapData()
-            data.p2d = p2
-            data.p3d = self.track.p2
-            data.Complete(self.track)
-            return data
-        else:
-            return None
+        return GetClosestSnapData(self.track, (self.track.p1, self.track.p2), bounds, point)
         
         
+    def GetDistance(self, bounds, point):
+        """
+        Gets the distance between the track and the point in view.
+        """
+        (lines,) = GetGeometryCache().Get(self.track, bounds, self.Flatten)
+        return GetLinesDistance(lines, point)
+
+
     def IsSelectionPossible(self, bounds, point):
         """
         Returns True if selection is possible.
@@ -261,19 +412,7 @@ class TrackViewer:
         >>> tv.IsSelectionPossible(bounds, wx.Point(35950, 32048))
         False
         """
-        p1 = bounds.ModelToView(self.track.p1)
-        v1 = bounds.ModelToView(self.track.p1 + self.track.v1)
-        v2 = bounds.ModelToView(self.track.p2 + self.track.v2)
-        p2 = bounds.ModelToView(self.track.p2)
-
-        lines = sptmath.toLineSegments((p1, v1, v2, p2), bounds.GetBezierFlatnessFactor())
-        i = 1
-        while i < len(lines):
-            l = lines[i-1:i+1]
-            if sptmath.sqDistanceTo(l, point) <= HIGHLIGHT_DISTANCE_SQ:
-                return True
-            i += 1
-        return False
+        return self.GetDistance(bounds, point) <= HIGHLIGHT_DISTANCE
             
         
         
@@ -288,35 +427,46 @@ class SwitchViewer:
         """
         Draws the switch on the device context.
         """
-        
-        oldPen = context.dc.GetPen()
-        try:
-            context.dc.SetPen(wx.Pen(COLOR_SWITCH if not context.selected else COLOR_HIGHLIGHT,
-                3 if context.bounds.scale > 1.0 else 1))
-            
-            if (context.bounds.scale.isLargeScale()):
-                pc = context.bounds.ModelToView(self.switch.pc)
-                p1 = context.bounds.ModelToView(self.switch.p1)
-                p2 = context.bounds.ModelToView(self.switch.p2)
-                
-                context.dc.DrawLine(pc[0], pc[1], p1[0], p1[1])
-                context.dc.DrawLine(pc[0], pc[1], p2[0], p2[1])
-            else:
-                s = (context.bounds.ModelToView(self.switch.pc),
-                     context.bounds.ModelToView(self.switch.pc + self.switch.vc1),
-                     context.bounds.ModelToView(self.switch.p1 + self.switch.v1),
-                     context.bounds.ModelToView(self.switch.p1))
-                d = (context.bounds.ModelToView(self.switch.pc),
-                     context.bounds.ModelToView(self.switch.pc + self.switch.vc2),
-                     context.bounds.ModelToView(self.switch.p2 + self.switch.v2),
-                     context.bounds.ModelToView(self.switch.p2))
-            
-                context.dc.DrawSpline(s)
-                context.dc.DrawSpline(d)
-        finally:
-            context.dc.SetPen(oldPen)
-            
-    
+        batch = DrawBatch(context)
+        self.AddTo(batch)
+        batch.Draw()
+
+
+    def AddTo(self, batch):
+        """
+        Adds lines of the switch to the draw batch.
+        """
+        batch.Add(COLOR_SWITCH, self.GetPolylines(batch.context.bounds))
+
+
+    def GetPolylines(self, bounds):
+        """
+        Gets the polylines of both switch tracks in view. At large
+        scales the tracks are straight lines between end points.
+        """
+        if bounds.scale.isLargeScale():
+            pc = bounds.ModelToView(self.switch.pc)
+            return [(pc, bounds.ModelToView(self.switch.p1)), (pc, bounds.ModelToView(self.switch.p2))]
+        return GetGeometryCache().Get(self.switch, bounds, self.Flatten)
+
+
+    def Flatten(self, bounds):
+        """
+        Returns both switch tracks flattened into polylines in view.
+        """
+        pc = bounds.ModelToView(self.switch.pc)
+        vc1 = bounds.ModelToView(self.switch.pc + self.switch.vc1)
+        v1 = bounds.ModelToView(self.switch.p1 + self.switch.v1)
+        p1 = bounds.ModelToView(self.switch.p1)
+        vc2 = bounds.ModelToView(self.switch.pc + self.switch.vc2)
+        v2 = bounds.ModelToView(self.switch.p2 + self.switch.v2)
+        p2 = bounds.ModelToView(self.switch.p2)
+
+        flatnessFactor = bounds.GetBezierFlatnessFactor()
+        return [sptmath.toLineSegments((pc, vc1, v1, p1), flatnessFactor),
+            sptmath.toLineSegments((pc, vc2, v2, p2), flatnessFactor)]
+
+
     def GetBox(self, bounds):
         """
         Gets the rectangle for the switch.
@@ -397,44 +547,18 @@ class SwitchViewer:
         >>> tv.GetSnapData(bounds, wx.Point(0, 0))
         
         """
-        pc = bounds.ModelToView(self.switch.pc)
-        p1 = bounds.ModelToView(self.switch.p1)
-        p2 = bounds.ModelToView(self.switch.p2)        
-        
-        pcx = pc[0] - point.x
-        pcy = pc[1] - point.y
-        p1x = p1[0] - point.x
-        p1y = p1[1] - point.y
-        p2x = p2[0] - point.x
-        p2y = p2[1] - point.y
-        if (pcx * pcx + pcy * pcy <= SNAP_DISTANCE_SQ
-            and self.switch.point2tracking(self.switch.pc) is None):
-            
-            data = ui.editor.SnapData()
-            data.p2d = pc
-            data.p3d = self.switch.pc
-            data.Complete(self.switch)
-            return data
-        elif (p1x * p1x + p1y * p1y <= SNAP_DISTANCE_SQ
-                and self.switch.point2tracking(self.switch.p1) is None):
-
-            data = ui.editor.SnapData()
-            data.p2d = p1
-            data.p3d = self.switch.p1
-            data.Complete(self.switch)
-            return data
-        elif (p2x * p2x + p2y * p2y <= SNAP_DISTANCE_SQ
-                and self.switch.point2tracking(self.switch.p2) is None):
-            data = ui.editor.SnapData()
-            data.p2d = p2
-            data.p3d = self.switch.p2
-            data.Complete(self.switch)
-            return data
-        else:
-            return None
-        
+        return GetClosestSnapData(self.switch,
+            (self.switch.pc, self.switch.p1, self.switch.p2), bounds, point)
         
         
+    def GetDistance(self, bounds, point):
+        """
+        Gets the distance between the switch and the point in view.
+        """
+        return min(GetLinesDistance(lines, point)
+            for lines in GetGeometryCache().Get(self.switch, bounds, self.Flatten))
+
+
     def IsSelectionPossible(self, bounds, point):
         """
         Returns True if selection is possible
@@ -461,33 +585,7 @@ class SwitchViewer:
         >>> tv.IsSelectionPossible(bounds, wx.Point(35935, 33030))
         False
         """
-        pc = bounds.ModelToView(self.switch.pc)
-        vc1 = bounds.ModelToView(self.switch.pc + self.switch.vc1)
-        v1 = bounds.ModelToView(self.switch.p1 + self.switch.v1)
-        p1 = bounds.ModelToView(self.switch.p1)
-        vc2 = bounds.ModelToView(self.switch.pc + self.switch.vc2)
-        v2 = bounds.ModelToView(self.switch.p2 + self.switch.v2)
-        p2 = bounds.ModelToView(self.switch.p2)
-
-        flatnessFactor = bounds.GetBezierFlatnessFactor()
-
-        lines = sptmath.toLineSegments((pc, vc1, v1, p1), flatnessFactor)
-        i = 1
-        while i < len(lines):
-            l = lines[i-1:i+1]
-            if sptmath.sqDistanceTo(l, point) <= HIGHLIGHT_DISTANCE_SQ:
-                return True
-            i += 1
-        
-        lines = sptmath.toLineSegments((pc, vc2, v2, p2), flatnessFactor)
-        i = 1
-        while i < len(lines):
-            l = lines[i-1:i+1]
-            if sptmath.sqDistanceTo(l, point) <= HIGHLIGHT_DISTANCE_SQ:
-                return True
-            i += 1
-
-        return False;
+        return self.GetDistance(bounds, point) <= HIGHLIGHT_DISTANCE
 
 
 
@@ -502,8 +600,17 @@ class GroupViewer:
         """
         Draw the rail container.
         """
+        batch = DrawBatch(context)
+        self.AddTo(batch)
+        batch.Draw()
+
+
+    def AddTo(self, batch):
+        """
+        Adds lines of the children to the draw batch.
+        """
         for c in self.group.children:
-            GetViewer(c).Draw(context)
+            GetViewer(c).AddTo(batch)
             
             
     def GetBox(self, bounds):
@@ -559,6 +666,13 @@ class GroupViewer:
             if sd is not None:
                 return sd
         return None
+
+
+    def GetDistance(self, bounds, point):
+        """
+        Gets the distance between the closest child and the point in view.
+        """
+        return min(GetViewer(c).GetDistance(bounds, point) for c in self.group.children)
     
     
     def IsSelectionPossible(self, bounds, point):
@@ -624,6 +738,46 @@ class BasePointView:
 
 
 
+def GetLinesDistance(lines, point):
+    """
+    Returns the distance of the point from polyline.
+
+    Example:
+    >>> GetLinesDistance([(3, 3), (3, -3), (-3, -3)], (0, -1))
+    2.0
+    """
+    sqDistance = min(sptmath.sqDistanceTo(lines[i-1:i+1], point) \
+        for i in xrange(1, len(lines)))
+    return math.sqrt(sqDistance)
+
+
+def GetClosestSnapData(railTracking, points, bounds, point):
+    """
+    Returns the snap data for the unconnected geometry point
+    of rail tracking closest to the point in view or None if no point
+    is within snap distance.
+    """
+    closest = None
+    closestSq = None
+    for p in points:
+        p2d = bounds.ModelToView(p)
+        dx = p2d[0] - point.x
+        dy = p2d[1] - point.y
+        sq = dx * dx + dy * dy
+        if sq <= SNAP_DISTANCE_SQ and (closest is None or sq < closestSq) \
+                and railTracking.point2tracking(p) is None:
+            closest = (p2d, p)
+            closestSq = sq
+
+    if closest is None:
+        return None
+
+    data = ui.editor.SnapData()
+    data.p2d, data.p3d = closest
+    data.Complete(railTracking)
+    return data
+
+
 def GetViewer(element):
     """
     Factory for viewers.
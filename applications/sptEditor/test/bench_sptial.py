@@ -0,0 +1,108 @@
+"""
+Benchmark comparing RTree insertion strategies on railway corridor.
+
+Generates long corridor of parallel tracks split into short segments
+and counts nodes visited by queryView for a set of viewports.
+
+Usage: python bench_sptial.py [segments]
+"""
+
+import math
+import random
+import sys
+import time
+
+import sptial
+
+
+def corridor(segments, tracks = 4, length = 50, spacing = 5):
+    """
+    Returns list of (cuboid, obj) entries of slightly curving corridor.
+    """
+    entries = []
+    x, y, angle = 0.0, 0.0, 0.0
+    rnd = random.Random(0)
+    for s in xrange(segments):
+        angle += rnd.uniform(-0.02, 0.02)
+        nx = x + length * math.cos(angle)
+        ny = y + length * math.sin(angle)
+        ox = -math.sin(angle) * spacing
+        oy = math.cos(angle) * spacing
+        for t in xrange(tracks):
+            p1 = (int(x + ox * t), int(y + oy * t), 0)
+            p2 = (int(nx + ox * t), int(ny + oy * t), 0)
+            cuboid = sptial.Cuboid(
+                tuple(map(min, p1, p2)), tuple(map(max, p1, p2)))
+            entries.append((cuboid, (s, t)))
+        x, y = nx, ny
+    return entries
+
+
+def viewports(entries, count = 200, size = 400):
+    """
+    Returns viewports centered at random corridor segments.
+    """
+    rnd = random.Random(1)
+    result = []
+    for i in xrange(count):
+        c = rnd.choice(entries)[0]
+        x = (c.minX + c.maxX) / 2
+        y = (c.minY + c.maxY) / 2
+        result.append(sptial.Cuboid((x - size, y - size, 0), (x + size, y + size, 0)))
+    return result
+
+
+def visits(tree, viewport):
+    """
+    Counts nodes visited by queryView for given viewport.
+    """
+    count = 0
+    stack = [tree.getRoot()]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if not node.isLeaf():
+            stack.extend(c.index for c in node.children \
+                if viewport.viewIntersects(c.cuboid))
+    return count
+
+
+def build(entries, mode):
+    tree = sptial.RTree(mode = mode)
+    for (cuboid, obj) in entries:
+        tree.insert(cuboid, obj)
+    return tree
+
+
+def main(segments = 1000):
+    entries = corridor(segments)
+    views = viewports(entries)
+
+    builders = [
+        ("quadratic", lambda: build(entries, sptial.RTree.QUADRATIC)),
+        ("rstar", lambda: build(entries, sptial.RTree.RSTAR)),
+        ("bulk", lambda: sptial.RTree.bulkLoad(entries))]
+
+    print "%d entries, %d viewports" % (len(entries), len(views))
+    print "%-10s %8s %6s %10s %10s" % ("mode", "build[s]", "level", "visits", "query[s]")
+    for (name, builder) in builders:
+        start = time.time()
+        tree = builder()
+        buildTime = time.time() - start
+
+        nodes = sum(visits(tree, v) for v in views)
+
+        start = time.time()
+        for v in views:
+            for o in tree.queryView(v):
+                pass
+        queryTime = time.time() - start
+
+        print "%-10s %8.2f %6d %10d %10.3f" % (name, buildTime, tree.level(), nodes, queryTime)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
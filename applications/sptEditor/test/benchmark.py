@@ -0,0 +1,227 @@
+"""
+Benchmark suite of the spatial index and scenery model.
+
+Generates synthetic sceneries of parallel lines of connected tracks
+and measures the hot paths: RTree insert/delete/query/queryView,
+RailContainer insert/remove, YAML dump/load, sector export and
+writing of packed sectors.
+Results are printed or written as JSON so they can be compared
+between revisions.
+
+Usage: python benchmark.py [-s 1000,10000,100000] [-r 3] [-o results.json]
+"""
+
+import json
+import optparse
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+import sptial
+import sptyaml
+from sptmath import Vec3
+from model.tracks import Track
+from model.groups import RailContainer
+from model.scenery import Scenery
+from db.export import exportScenery, sectorPosition, SectorBuffer
+from db.sctwriter import packSector, writePackedSector
+
+
+# Length of generated tracks and distance between lines in meters
+TRACK_LENGTH = 50
+LINE_SPACING = 10
+# Number of tracks in generated line, lines are kept within single
+# sector as export doesn't resolve connections across sectors yet
+LINE_LENGTH = 30
+
+QUERY_COUNT = 1000
+QUERY_SIZE = 500
+
+
+def generateTrackings(count):
+    """
+    Generates disconnected tracks making lines of LINE_LENGTH tracks.
+    Tracks in a line share end points so they get connected
+    in a rail container.
+    """
+    zero = Vec3("0", "0", "0")
+    trackings = []
+    for i in xrange(count):
+        line, n = divmod(i, LINE_LENGTH)
+        x = str(line * LINE_SPACING)
+        trackings.append(Track(
+            Vec3(x, str(n * TRACK_LENGTH), "0"), zero, zero,
+            Vec3(x, str((n + 1) * TRACK_LENGTH), "0")))
+    return trackings
+
+
+def generateViewports(count, rnd):
+    lines = (count + LINE_LENGTH - 1) / LINE_LENGTH
+    maxX = lines * LINE_SPACING
+    maxY = LINE_LENGTH * TRACK_LENGTH
+    viewports = []
+    for i in xrange(QUERY_COUNT):
+        x = rnd.randint(-QUERY_SIZE, maxX)
+        y = rnd.randint(-QUERY_SIZE, maxY)
+        viewports.append(sptial.Cuboid((x, y, 0), (x + QUERY_SIZE, y + QUERY_SIZE, 0)))
+    return viewports
+
+
+class Benchmark:
+    """
+    Runs benchmarks for one scenery size.
+    """
+
+    def __init__(self, size, repeat):
+        self.size = size
+        self.repeat = repeat
+        self.results = []
+
+
+    def measure(self, name, ops, setup, run):
+        """
+        Measures run(setup()) repeat times and records the best time.
+        """
+        best = None
+        for i in xrange(self.repeat):
+            state = setup()
+            start = time.time()
+            run(state)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        self.results.append({
+            "name": name,
+            "size": self.size,
+            "ops": ops,
+            "seconds": best,
+            "usPerOp": best * 1e6 / ops})
+        sys.stderr.write("%-20s %8d %10.3f s %12.1f us/op\n" \
+            % (name, self.size, best, best * 1e6 / ops))
+
+
+    def run(self):
+        rnd = random.Random(self.size)
+        entries = [(sptial.Cuboid.fromEndpoints(t.getEndPoints()), t) \
+            for t in generateTrackings(self.size)]
+        viewports = generateViewports(self.size, rnd)
+        removed = rnd.sample(entries, max(1, self.size / 10))
+
+        def buildTree():
+            tree = sptial.RTree()
+            for (cuboid, obj) in entries:
+                tree.insert(cuboid, obj)
+            return tree
+
+        def deleteAll(tree):
+            for (cuboid, obj) in removed:
+                tree.delete(cuboid, obj)
+
+        def queryAll(tree):
+            for v in viewports:
+                for o in tree.query(v):
+                    pass
+
+        def queryViewAll(tree):
+            for v in viewports:
+                for o in tree.queryView(v):
+                    pass
+
+        tree = buildTree()
+        self.measure("rtree.insert", self.size, lambda: None, lambda s: buildTree())
+        self.measure("rtree.bulkLoad", self.size, lambda: None,
+            lambda s: sptial.RTree.bulkLoad(entries))
+        self.measure("rtree.query", QUERY_COUNT, lambda: tree, queryAll)
+        self.measure("rtree.queryView", QUERY_COUNT, lambda: tree, queryViewAll)
+        self.measure("rtree.delete", len(removed), buildTree, deleteAll)
+
+        def buildGroup(trackings):
+            group = RailContainer()
+            for t in trackings:
+                group.insert(t)
+            return group
+
+        def removeAll((group, trackings)):
+            for t in trackings:
+                group.remove(t)
+
+        def setupRemove():
+            trackings = generateTrackings(self.size)
+            return (buildGroup(trackings), rnd.sample(trackings, len(removed)))
+
+        self.measure("group.insert", self.size, lambda: generateTrackings(self.size), buildGroup)
+        self.measure("group.remove", len(removed), setupRemove, removeAll)
+
+        scenery = Scenery()
+        scenery.AddRailTrackings(generateTrackings(self.size))
+        document = yaml.dump(scenery)
+
+        self.measure("yaml.dump", self.size, lambda: scenery, yaml.dump)
+        self.measure("yaml.load", self.size, lambda: document,
+            lambda d: yaml.load(d, sptyaml.SptLoader))
+        self.measure("yaml.cdump", self.size, lambda: scenery,
+            lambda s: yaml.dump(s, Dumper = sptyaml.SptCDumper))
+        self.measure("yaml.cload", self.size, lambda: document,
+            lambda d: yaml.load(d, sptyaml.SptCLoader))
+        self.measure("yaml.stream", self.size, lambda: document, sptyaml.loadScenery)
+
+        def export(path):
+            try:
+                exportScenery(path, list(scenery.tracks.tracks()),
+                    list(scenery.tracks.switches()), lambda percent: None)
+            finally:
+                shutil.rmtree(path)
+
+        self.measure("export", self.size, tempfile.mkdtemp, export)
+
+        def packAll():
+            sectors = {}
+            for t in scenery.tracks.tracks():
+                sectors.setdefault(sectorPosition(t), []).append(t)
+            return [packSector(Vec3(str(x * 2000), str(y * 2000), "0"), tracks, []) \
+                for ((x, y), tracks) in sectors.iteritems()]
+
+        def writeAll(packed):
+            for p in packed:
+                writePackedSector(SectorBuffer(), p)
+
+        self.measure("export.write", self.size, packAll, writeAll)
+
+        return self.results
+
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-s", "--sizes", default = "1000,10000,100000",
+        help = "comma separated numbers of trackings [default: %default]")
+    parser.add_option("-r", "--repeat", type = "int", default = 3,
+        help = "number of runs, the best one is reported [default: %default]")
+    parser.add_option("-o", "--output",
+        help = "JSON file for results, standard output if not given")
+    (options, args) = parser.parse_args()
+
+    results = []
+    for size in [int(s) for s in options.sizes.split(",")]:
+        results += Benchmark(size, options.repeat).run()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results}
+
+    if options.output:
+        with open(options.output, "w") as fout:
+            json.dump(report, fout, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
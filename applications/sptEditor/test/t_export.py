@@ -0,0 +1,151 @@
+"""
+Test case for scenery export.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import model.scenery
+import model.tracks
+from db import export
+from db import sctwriter
+from sptmath import Vec3
+
+
+def trackings():
+    zero = Vec3("0", "0", "0")
+    result = []
+    # lines of tracks in four sectors
+    for (x, y) in [(0, 0), (2500, 0), (0, -1500), (-4000, 3000)]:
+        result += [model.tracks.Track(Vec3(str(x + i * 50), str(y), "0"), zero, zero, \
+            Vec3(str(x + i * 50 + 50), str(y), "0")) for i in xrange(20)]
+    result[0].name = "T1"
+    result.append(model.tracks.Switch(pc = Vec3('1000', '0', '0'), \
+        p1 = Vec3('1040', '0', '0'), p2 = Vec3('1040', '4', '0'), \
+        vc2 = Vec3('10', '0', '0'), v2 = Vec3('-10', '-1', '0')))
+    return result
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.scenery = model.scenery.Scenery()
+        self.scenery.AddRailTrackings(trackings())
+        self.tracks = self.scenery.tracks
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def export(self, name, processes):
+        path = os.path.join(self.dir, name)
+        os.mkdir(path)
+        progress = []
+        export.exportScenery(path, self.tracks.tracks(), self.tracks.switches(), \
+            progress.append, processes)
+        files = {}
+        for f in os.listdir(path):
+            with open(os.path.join(path, f), "rb") as fin:
+                files[f] = fin.read()
+        return (files, progress)
+
+
+    def testParallel(self):
+        (serial, serialProgress) = self.export("serial", 1)
+        (parallel, parallelProgress) = self.export("parallel", 3)
+
+        self.assertEquals(6, len(serial))
+        self.assertTrue(export.MANIFEST_FILE_NAME in serial)
+        self.assertTrue("default.scv" in serial)
+        self.assertEquals(serial, parallel)
+
+        self.assertEquals([0, 25, 50, 75, 100], serialProgress)
+        self.assertEquals(serialProgress, parallelProgress)
+
+
+    def testTrackArrays(self):
+        if sctwriter.numpy is None:
+            return
+        # bezier tracks between straight ones
+        self.scenery.AddRailTrackings([model.tracks.Track(Vec3(str(i * 10), "500.5", "0"), \
+            Vec3("3", "1", "0"), Vec3("-3", "-1", "0.25"), Vec3(str(i * 10 + 10), "500.5", "0")) \
+            for i in xrange(10)])
+
+        (vector, progress) = self.export("vector", 1)
+        numpy = sctwriter.numpy
+        sctwriter.numpy = None
+        try:
+            (scalar, progress) = self.export("scalar", 1)
+        finally:
+            sctwriter.numpy = numpy
+
+        self.assertEquals(scalar, vector)
+
+
+    def testIncremental(self):
+        tracker = export.SectorTracker(self.scenery)
+        self.scenery.RegisterListener(tracker)
+        path = os.path.join(self.dir, "scenery")
+        os.mkdir(path)
+
+        def run():
+            written = export.exportScenery(path, self.tracks.tracks(), \
+                self.tracks.switches(), lambda percent: None, 1, tracker.dirty(path))
+            tracker.exported(path)
+            return sorted(written)
+
+        self.assertEquals(None, tracker.dirty(path))
+        self.assertEquals(5, len(run()))
+        self.assertEquals([], run())
+
+        # track appended to line in sector (1, 0)
+        zero = Vec3("0", "0", "0")
+        track = model.tracks.Track(Vec3("3500", "0", "0"), zero, zero, Vec3("3550", "0", "0"))
+        self.scenery.AddRailTracking(track)
+        self.assertEquals(set([(1.0, 0.0)]), tracker.dirty(path))
+        self.assertEquals(["+0001+0000.sct"], run())
+
+        # new sector changes variant
+        other = model.tracks.Track(Vec3("9000", "9000", "0"), zero, zero, Vec3("9050", "9000", "0"))
+        self.scenery.AddRailTracking(other)
+        self.assertEquals(["+0004+0004.sct", export.VARIANT_FILE_NAME], run())
+
+        self.scenery.RemoveRailTracking(other)
+        self.assertEquals([export.VARIANT_FILE_NAME], run())
+        self.assertFalse(os.path.exists(os.path.join(path, "+0004+0004.sct")))
+
+        # without tracker sectors are compared by digests
+        self.scenery.RemoveRailTracking(track)
+        self.assertEquals(["+0001+0000.sct"], sorted(export.exportScenery(path, \
+            self.tracks.tracks(), self.tracks.switches(), lambda percent: None)))
+
+        (full, progress) = self.export("full", 1)
+        with open(os.path.join(path, export.MANIFEST_FILE_NAME), "rb") as fin:
+            self.assertEquals(full[export.MANIFEST_FILE_NAME], fin.read())
+
+
+    def testTrackerNeighbours(self):
+        zero = Vec3("0", "0", "0")
+        # track crossing sector border connected to track in the next sector
+        first = model.tracks.Track(Vec3("1990", "0", "0"), zero, zero, Vec3("2010", "0", "0"))
+        second = model.tracks.Track(Vec3("2010", "0", "0"), zero, zero, Vec3("2050", "0", "0"))
+        self.scenery.AddRailTrackings([first, second])
+
+        tracker = export.SectorTracker(self.scenery)
+        self.scenery.RegisterListener(tracker)
+        tracker.exported(self.dir)
+
+        self.scenery.RemoveRailTracking(second)
+        self.assertEquals(set([(0.0, 0.0), (1.0, 0.0)]), tracker.dirty(self.dir))
+
+        tracker.invalidate(self.dir)
+        self.assertEquals(None, tracker.dirty(self.dir))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
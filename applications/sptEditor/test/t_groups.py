@@ -4,6 +4,7 @@ Test module containing test cases for RailGroup.
 @author Adammo
 """
 
+import random
 import unittest
 import logging.config
 import sys
@@ -433,6 +434,99 @@ class RailContainerTest(unittest.TestCase):
 
 
 
+    def testRebuild(self):
+        trackings = [Track(Vec3(str(x), "0", "0"), Vec3("0", "0", "0"), \
+            Vec3("0", "0", "0"), Vec3(str(x), "10.0", "0")) for x in xrange(0, 50, 5)]
+
+        group = RailGroup()
+        for t in trackings:
+            group.insert(t)
+
+        moved = trackings[3]
+        for p in moved.getEndPoints():
+            p.moveBy(Vec3("100.0", "0", "0"))
+        group.rebuild()
+
+        self.assertEquals(10, group.size())
+        self.assertTrue(group.contains(moved))
+        self.assertEquals([moved], list(group.children.queryPoint(115, 5, 0)))
+        self.assertEquals([], list(group.children.queryPoint(15, 5, 0)))
+        self.assertTrue(group.containsPoint(Vec3("115.0", "10.0", "0")))
+
+
+    def testChain(self):
+        points = [Vec3("0", str(10 * i) + ".0", "0") for i in xrange(101)]
+        trackings = [Track(points[i], Vec3("0", "0", "0"), Vec3("0", "0", "0"), \
+            points[i+1]) for i in xrange(100)]
+
+        group = RailGroup()
+        # Insert in interleaved order to connect at both ends
+        for t in trackings[::2] + trackings[1::2]:
+            group.insert(t)
+
+        self.assertEquals(100, group.size())
+        self.assertEquals(set([points[0], points[100]]), set(group.connections.keys()))
+        self.assertEquals(points[100], group.nextPoint(points[0]))
+
+        group.remove(trackings[50])
+        self.assertEquals(set([points[0], points[50], points[51], points[100]]), \
+            set(group.connections.keys()))
+        self.assertEquals(points[50], group.nextPoint(points[0]))
+        self.assertEquals(points[51], group.nextPoint(points[100]))
+
+
+    def testInsertAll(self):
+        def network():
+            # grid of tracks crossing at nodes, slip switches and a group
+            zero = Vec3("0", "0", "0")
+            trackings = []
+            for i in xrange(6):
+                for j in xrange(5):
+                    trackings.append(Track(Vec3(str(10 * j), str(10 * i), "0"), zero, zero, \
+                        Vec3(str(10 * j + 10), str(10 * i), "0")))
+                    trackings.append(Track(Vec3(str(10 * i), str(10 * j), "0"), zero, zero, \
+                        Vec3(str(10 * i), str(10 * j + 10), "0")))
+            trackings.append(Switch( \
+                pc = Vec3("100.0", "0.0", "0.0"), \
+                p1 = Vec3("100.0", "10.423", "0.0"), \
+                p2 = Vec3("100.285", "10.418", "0.0"), \
+                vc2 = Vec3("0.0", "3.476", "0.0"), \
+                v2 = Vec3("-0.19", "-3.469", "0.0")))
+            trackings.append(Track(Vec3("100.0", "10.423", "0"), zero, zero, \
+                Vec3("100.0", "20.0", "0")))
+            group = RailGroup()
+            group.insert(Track(Vec3("100.0", "20.0", "0"), zero, zero, Vec3("100.0", "30.0", "0")))
+            group.insert(Track(Vec3("100.0", "30.0", "0"), zero, zero, Vec3("100.0", "40.0", "0")))
+            trackings.append(group)
+            random.Random(3).shuffle(trackings)
+            return trackings
+
+        def state(group, trackings):
+            number = lambda t: None if t is None else trackings.index(t)
+            links = [[number(t.point2tracking(p)) for p in t.getEndPoints()] for t in trackings]
+            connections = dict((p, number(t)) for (p, t) in group.connections.items())
+            outlines = dict((p, [number(t) for t in l]) for (p, l) in group.outline_trackings.items())
+            return (links, connections, outlines)
+
+        sequential = network()
+        group = RailGroup()
+        for t in sequential:
+            group.insert(t)
+        expected = state(group, sequential)
+
+        batch = network()
+        group = RailGroup()
+        group.insertAll(batch)
+        self.assertEquals(expected, state(group, batch))
+
+        # into a group having trackings already
+        batch = network()
+        group = RailGroup()
+        for t in batch[:20]:
+            group.insert(t)
+        group.insertAll(batch[20:])
+        self.assertEquals(expected, state(group, batch))
+
 
 if __name__ == "__main__":
      # Optionally specify logging configuration by an argument in command line
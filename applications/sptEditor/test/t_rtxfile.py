@@ -0,0 +1,96 @@
+"""
+Test case for spatial index sidecar file.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+import sptyaml
+import sptial
+import model.scenery
+import model.tracks
+from db import rtxfile
+from sptmath import Vec3
+
+
+def trackings(count):
+    zero = Vec3("0", "0", "0")
+    return [model.tracks.Track(Vec3(str(i % 10 * 5), str(i / 10 * 50), "0"), zero, zero, \
+        Vec3(str(i % 10 * 5), str(i / 10 * 50 + 50), "0")) for i in xrange(count)]
+
+
+class IndexFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "scenery")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def load(self, data, snapshot):
+        loader = sptyaml.SptLoader(data)
+        loader.snapshot = snapshot
+        try:
+            return loader.get_single_data()
+        finally:
+            loader.dispose()
+
+
+    def testReadWrite(self):
+        tracks = trackings(500)
+        tree = sptial.RTree.bulkLoad([(sptial.Cuboid.fromEndpoints(t.getEndPoints()), t) \
+            for t in tracks])
+        digest = rtxfile.sceneryDigest("scenery")
+
+        rtxfile.writeIndex(self.path, digest, tree, tracks)
+        restored = rtxfile.readIndex(self.path, digest, tracks)
+
+        self.assertEquals(len(tree), len(restored))
+        self.assertEquals(tree.level(), restored.level())
+        self.assertEquals(tree.pack(id), restored.pack(id))
+        restored.checkParents()
+
+        # scenery changed
+        self.assertEquals(None, rtxfile.readIndex(self.path, rtxfile.sceneryDigest("other"), tracks))
+        self.assertEquals(None, rtxfile.readIndex(self.path, digest, tracks[1:]))
+
+
+    def testSnapshot(self):
+        scenery = model.scenery.Scenery()
+        scenery.AddRailTrackings(trackings(100))
+        data = yaml.dump(scenery)
+        digest = rtxfile.sceneryDigest(data)
+
+        # no sidecar yet, index is built and stored
+        snapshot = rtxfile.IndexSnapshot(self.path, digest)
+        first = self.load(data, snapshot)
+        self.assertFalse(snapshot.restored)
+        snapshot.store(first.tracks.children)
+
+        snapshot = rtxfile.IndexSnapshot(self.path, digest)
+        second = self.load(data, snapshot)
+        self.assertTrue(snapshot.restored)
+
+        second.tracks.children.checkParents()
+        self.assertEquals(list(first.tracks.children), list(second.tracks.children))
+        self.assertEquals(first.tracks.connections, second.tracks.connections)
+
+        # malformed sidecar is rebuilt
+        with open(rtxfile.indexPath(self.path), "wb") as f:
+            f.write("RTIX")
+        snapshot = rtxfile.IndexSnapshot(self.path, digest)
+        third = self.load(data, snapshot)
+        self.assertFalse(snapshot.restored)
+        self.assertEquals(len(first.tracks.children), len(third.tracks.children))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
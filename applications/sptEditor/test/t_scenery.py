@@ -94,6 +94,212 @@ class SceneryTest(unittest.TestCase):
                 p2 = Vec3('54.649', '15.368', '0.000')) in l)
 
 
+    def testCLoaderDumper(self):
+        scenery = model.scenery.Scenery()
+
+        group = model.groups.RailContainer("group")
+        group.insert(model.tracks.Track(p1 = Vec3('26.250', '-51.250', '0.000'), \
+            p2 = Vec3('28.880', '-45.857', '0.000') ))
+        group.insert(model.tracks.Switch(pc = Vec3('28.880', '-45.857', '0.000'), \
+            p1 = Vec3('43.446', '-15.989', '0.000'), \
+            p2 = Vec3('45.068', '-16.856', '0.000'), \
+            vc2 = Vec3('4.856', '9.958', '0.000'), \
+            v2 = Vec3('-5.928', '-9.361', '0.000')))
+        scenery.AddRailTracking(group)
+
+        zero = Vec3('0', '0', '0')
+        tracks = [model.tracks.Track(Vec3(str(i * 5), str(i % 7), '0'), zero, zero, \
+            Vec3(str(i * 5 + 5), str((i + 1) % 7), '0.001')) for i in xrange(200)]
+        tracks[0].name = "first"
+        scenery.AddRailTrackings(tracks)
+
+        text = yaml.dump(scenery)
+        ctext = yaml.dump(scenery, Dumper = sptyaml.SptCDumper)
+
+        results = [yaml.load(text, sptyaml.SptLoader), \
+            yaml.load(text, sptyaml.SptCLoader), \
+            yaml.load(ctext, sptyaml.SptLoader), \
+            yaml.load(ctext, sptyaml.SptCLoader)]
+
+        for result in results:
+            self.assertEquals(scenery.tracks, result.tracks)
+            self.assertEquals(scenery.tracks.connections, result.tracks.connections)
+            self.assertEquals(set(scenery.tracks.outline_trackings.keys()), \
+                set(result.tracks.outline_trackings.keys()))
+            self.assertEquals(sorted(c.name for c in scenery.tracks.children), \
+                sorted(c.name for c in result.tracks.children))
+            self.assertEquals(list(scenery.tracks.children), list(result.tracks.children))
+
+
+    def testLoadScenery(self):
+        scenery = model.scenery.Scenery()
+
+        group = model.groups.RailContainer("group")
+        inner = model.groups.RailContainer()
+        inner.insert(model.tracks.Track(p1 = Vec3('26.250', '-51.250', '0.000'), \
+            p2 = Vec3('28.880', '-45.857', '0.000') ))
+        group.insert(inner)
+        group.insert(model.tracks.Switch(pc = Vec3('28.880', '-45.857', '0.000'), \
+            p1 = Vec3('43.446', '-15.989', '0.000'), \
+            p2 = Vec3('45.068', '-16.856', '0.000'), \
+            vc2 = Vec3('4.856', '9.958', '0.000'), \
+            v2 = Vec3('-5.928', '-9.361', '0.000')))
+        scenery.AddRailTracking(group)
+
+        # shared points are dumped as aliases
+        zero = Vec3('0', '0', '0')
+        tracks = [model.tracks.Track(Vec3(str(i * 5), '100', '0'), zero, zero, \
+            Vec3(str(i * 5 + 5), '100', '0')) for i in xrange(400)]
+        tracks[0].name = u"pierwszy \u0142uk"
+        scenery.AddRailTrackings(tracks)
+
+        # progress is reported in bytes of non-ASCII text too
+        text = yaml.dump(scenery, allow_unicode = True, encoding = "utf-8")
+        self.assertTrue(len(text) > len(text.decode("utf-8")))
+        expected = yaml.load(text, sptyaml.SptLoader)
+
+        for loader in (sptyaml.SptLoader, sptyaml.SptCLoader):
+            positions = []
+            result = sptyaml.loadScenery(text, positions.append, Loader = loader)
+
+            self.assertTrue(isinstance(result, model.scenery.Scenery))
+            self.assertEquals(expected.tracks, result.tracks)
+            self.assertEquals(expected.tracks.connections, result.tracks.connections)
+            self.assertEquals(sorted(c.name for c in expected.tracks.children), \
+                sorted(c.name for c in result.tracks.children))
+            (rgroup,) = [c for c in result.tracks.children if c == group]
+            self.assertEquals("group", rgroup.name)
+
+            self.assertTrue(len(positions) > 1)
+            self.assertEquals(sorted(positions), positions)
+            self.assertEquals(len(text), positions[-1])
+
+        # documents other than scenery are constructed as usual
+        self.assertEquals([1, "a"], sptyaml.loadScenery("[1, a]"))
+        self.assertEquals(None, sptyaml.loadScenery(""))
+
+
+    def testPaging(self):
+        zero = Vec3('0', '0', '0')
+        # straight line over five tiles and a parallel one in the first tile
+        line = [model.tracks.Track(Vec3(str(i * 100), '10', '0'), zero, zero, \
+            Vec3(str(i * 100 + 100), '10', '0')) for i in xrange(100)]
+        other = [model.tracks.Track(Vec3(str(i * 100), '50', '0'), zero, zero, \
+            Vec3(str(i * 100 + 100), '50', '0')) for i in xrange(10)]
+
+        scenery = model.scenery.Scenery()
+        scenery.AddRailTrackings(line + other)
+        mbc = scenery.GetMbc()
+
+        scenery.EnablePaging(2)
+        unloaded = []
+        class Listener(model.scenery.SceneryListener):
+            def Unload(self, scenery, element):
+                unloaded.append(element)
+        scenery.RegisterListener(Listener())
+        self.assertEquals(0, len(scenery.tracks.children))
+        self.assertEquals(mbc, scenery.GetMbc())
+        self.assertEquals(110, len(list(scenery.RailTrackingIterator())))
+
+        # only the first tile is loaded, the line leaves it by a stub
+        found = list(scenery.Query(sptial.Cuboid((100, 0, 0), (300, 100, 0))))
+        self.assertEquals(4, len(found))
+        self.assertEquals(30, len(scenery.tracks.children))
+        self.assertEquals({Vec3('2000', '10', '0'): [(1, 0)]}, scenery.GetStubs())
+        self.assertEquals(None, line[19].n2)
+
+        # the next tile gets connected at the border
+        p = Vec3('2050', '10', '0')
+        self.assertEquals([line[20]], list(scenery.QueryPoint(p)))
+        self.assertTrue(line[19].n2 is line[20])
+        self.assertEquals([Vec3('4000', '10', '0')], scenery.GetStubs().keys())
+
+        # the least recently used tile is evicted
+        list(scenery.Query(sptial.Cuboid((4100, 0, 0), (4200, 20, 0))))
+        self.assertEquals(set([(1, 0), (2, 0)]), set(scenery.loaded.keys()))
+        self.assertEquals(None, line[20].n1)
+        self.assertEquals(None, line[0].n2)
+        self.assertEquals(set([Vec3('2000', '10', '0'), Vec3('6000', '10', '0')]), \
+            set(scenery.GetStubs().keys()))
+        self.assertEquals(set(line[:20] + other), set(unloaded))
+        self.assertTrue(scenery.IsStub(Vec3('2000', '10', '0')))
+        self.assertFalse(scenery.IsStub(Vec3('4100', '10', '0')))
+
+        self.assertEquals([(0.0, line[0])], list(scenery.Nearest(Vec3('50', '10', '0'), 1, 5)))
+
+        # trackings added and removed while paging
+        added = model.tracks.Track(Vec3('10000', '10', '0'), zero, zero, Vec3('10100', '10', '0'))
+        scenery.AddRailTracking(added)
+        self.assertEquals([(4, 0)], scenery.GetStubs()[Vec3('10000', '10', '0')])
+        scenery.RemoveRailTracking(line[50])
+        self.assertEquals(110, len(list(scenery.RailTrackingIterator())))
+
+        scenery.LoadAll()
+        self.assertEquals(110, len(scenery.tracks.children))
+        self.assertEquals({}, scenery.GetStubs())
+        self.assertTrue(line[0].n2 is line[1])
+        self.assertTrue(line[19].n2 is line[20])
+        self.assertEquals(None, line[49].n2)
+        self.assertTrue(added.n1 is line[99])
+
+
+    def testPagingChurn(self):
+        zero = Vec3('0', '0', '0')
+        # a line of tracks over twenty tiles
+        line = [model.tracks.Track(Vec3(str(i * 500), '10', '0'), zero, zero, \
+            Vec3(str(i * 500 + 500), '10', '0')) for i in xrange(80)]
+
+        scenery = model.scenery.Scenery()
+        scenery.AddRailTrackings(line)
+        scenery.EnablePaging(4)
+
+        packed = []
+        bulkLoad = sptial.RTree.bulkLoad
+        def countingBulkLoad(entries, *args, **kwargs):
+            packed.append(len(entries))
+            return bulkLoad(entries, *args, **kwargs)
+
+        sptial.RTree.bulkLoad = staticmethod(countingBulkLoad)
+        try:
+            # pan forth and back a tile at a time
+            for x in range(20) + range(19, -1, -1):
+                list(scenery.Query(sptial.Cuboid((x * 2000 + 100, 0, 0), \
+                    (x * 2000 + 200, 20, 0))))
+                self.assertEquals(4 * len(scenery.loaded), len(scenery.tracks.children))
+                self.assertTrue(len(scenery.loaded) <= 4)
+        finally:
+            sptial.RTree.bulkLoad = bulkLoad
+
+        # tiles are inserted into the loaded index, not packed with it
+        self.assertTrue(all(n <= 4 for n in packed))
+        scenery.LoadAll()
+        self.assertEquals(80, len(scenery.tracks.children))
+        self.assertTrue(all(line[i].n2 is line[i + 1] for i in xrange(79)))
+
+
+    def testListener(self):
+        class Listener(model.scenery.SceneryListener):
+            def __init__(self):
+                model.scenery.SceneryListener.__init__(self)
+                self.events = []
+            def Add(self, scenery, element):
+                self.events.append(("add", element))
+            def Remove(self, scenery, element):
+                self.events.append(("remove", element))
+
+        scenery = model.scenery.Scenery()
+        listener = Listener()
+        scenery.RegisterListener(listener)
+
+        track = model.tracks.Track(Vec3('0', '0', '0'), Vec3(), Vec3(), Vec3('100', '0', '0'))
+        scenery.AddRailTracking(track)
+        scenery.RemoveRailTracking(track)
+        scenery.UnregisterListener(listener)
+        scenery.AddRailTracking(track)
+
+        self.assertEquals([("add", track), ("remove", track)], listener.events)
+
+
 
 if __name__ == '__main__':
      unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Test case for native binary scenery format.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+import sptyaml
+import model.scenery
+import model.tracks
+import model.groups
+from db import sptfile
+from sptmath import Vec3
+
+
+class SceneryFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "scenery" + sptfile.SCENERY_FILE_EXTENSION)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def roundTrip(self, scenery):
+        sptfile.writeScenery(open(self.path, "wb"), scenery)
+        with open(self.path, "rb") as fin:
+            return sptfile.readScenery(fin.read())
+
+
+    def testReadWrite(self):
+        scenery = model.scenery.Scenery()
+
+        group = model.groups.RailGroup(u"Stacja Łódź")
+        group.insert(model.tracks.Track(p1 = Vec3('26.250', '-51.250', '0.000'), \
+            p2 = Vec3('28.880', '-45.857', '0.000') ))
+        group.insert(model.tracks.Switch(pc = Vec3('28.880', '-45.857', '0.000'), \
+            p1 = Vec3('43.446', '-15.989', '0.000'), \
+            p2 = Vec3('45.068', '-16.856', '0.000'), \
+            vc2 = Vec3('4.856', '9.958', '0.000'), \
+            v2 = Vec3('-5.928', '-9.361', '0.000')))
+
+        track = model.tracks.Track(p1 = Vec3('43.446', '-15.989', '0.000'), \
+            v1 = Vec3('4.856', '9.958', '0.000'), \
+            v2 = Vec3('-3.726', '-10.435', '-0.001'), \
+            p2 = Vec3('56.330', '14.623', '1.500'))
+        track.name = "T1"
+
+        scenery.AddRailTracking(group)
+        scenery.AddRailTracking(track)
+
+        result = self.roundTrip(scenery)
+
+        self.assertEquals(scenery.tracks, result.tracks)
+        self.assertEquals(set(scenery.tracks.connections.keys()), \
+            set(result.tracks.connections.keys()))
+
+        (rgroup,) = [c for c in result.tracks.children if isinstance(c, model.groups.RailContainer)]
+        self.assertTrue(isinstance(rgroup, model.groups.RailGroup))
+        self.assertEquals(group.name, rgroup.name)
+        self.assertEquals(group, rgroup)
+
+        (rtrack,) = [c for c in result.tracks.children if c == track]
+        self.assertEquals("T1", rtrack.name)
+        self.assertEquals(Vec3('-3.726', '-10.435', '-0.001'), rtrack.v2)
+        self.assertEquals(Vec3('56.330', '14.623', '1.500'), rtrack.p2)
+
+        # connected to the switch within group
+        self.assertTrue(rtrack.n1 is rgroup)
+
+
+    def testSameAsYaml(self):
+        scenery = model.scenery.Scenery()
+        zero = Vec3("0", "0", "0")
+        scenery.AddRailTrackings([model.tracks.Track(Vec3(str(i * 5 - 100), "0.125", "0"), \
+            zero, zero, Vec3(str(i * 5 - 95), "0.125", "0")) for i in xrange(100)])
+
+        fromYaml = yaml.load(yaml.dump(scenery), sptyaml.SptLoader)
+        fromBinary = self.roundTrip(scenery)
+
+        self.assertEquals(fromYaml.tracks, fromBinary.tracks)
+        self.assertEquals(fromYaml.tracks.connections, fromBinary.tracks.connections)
+
+
+    def testInvalid(self):
+        self.assertRaises(sptfile.SceneryReadError, sptfile.readScenery, "SPTS")
+        self.assertRaises(sptfile.SceneryReadError, sptfile.readScenery, "")
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@
 Test module for testing sptial library.
 """
 
+import math
 import unittest
+from copy import deepcopy
 
 import sptial
 
@@ -151,6 +153,176 @@ class RTreeTest(unittest.TestCase):
         self.assertEquals(2, tree.level())
 
 
+    def testBulkLoad(self):
+        """
+        Tests the RTree packed from a list of entries.
+        Configuration minSize=2, pageSize=4
+        """
+
+        entries = [(sptial.Cuboid((x, y, 0), (x+1, y+1, 0)), (x, y)) \
+            for x in xrange(0, 20, 2) for y in xrange(0, 20, 2)]
+        tree = sptial.RTree.bulkLoad(entries, minSize = 2, pageSize = 4)
+        tree.checkParents()
+
+        self.assertEquals(100, len(tree))
+        self.assertEquals(4, tree.level())
+
+        l = list(tree.query(sptial.Cuboid((3, 3, 0), (7, 5, 0))))
+        self.assertEquals(5, len(l))
+        self.assertTrue((4, 4) in l)
+        self.assertTrue((6, 2) in l)
+        self.assertFalse((2, 2) in l)
+        self.assertFalse((8, 4) in l)
+
+        tree.insert(sptial.Cuboid((1, 1, 0), (3, 3, 0)), 'a')
+        tree.checkParents()
+        self.assertTrue('a' in tree.queryPoint(2, 2, 0))
+
+        for (cuboid, obj) in entries:
+            tree.delete(cuboid, obj)
+        tree.checkParents()
+
+        self.assertEquals(['a'], list(tree))
+
+
+    def testCachedBounds(self):
+        """
+        Tests bounding cuboids of nodes following inserts and deletes.
+        Configuration minSize=1, pageSize=3
+        """
+
+        tree = sptial.RTree(minSize = 1, pageSize = 3)
+        for x in xrange(10):
+            tree.insert(sptial.Cuboid((x, 0, 0), (x+1, 1, 0)), x)
+        tree.insert(sptial.Cuboid((50, 50, 0), (60, 60, 0)), 'far')
+        tree.checkParents()
+        self.assertEquals(sptial.Cuboid((0, 0, 0), (60, 60, 0)), tree.getMbc())
+
+        tree.delete(sptial.Cuboid((50, 50, 0), (60, 60, 0)), 'far')
+        tree.checkParents()
+        self.assertEquals(sptial.Cuboid((0, 0, 0), (10, 1, 0)), tree.getMbc())
+
+
+    def testVectorizedQuery(self):
+        """
+        Tests queries scanning nodes with numpy give the same results
+        as the scans with predicates.
+        """
+
+        entries = [(sptial.Cuboid((x, y, 0), (x+3, y, 0)), (x, y)) \
+            for x in xrange(0, 40, 2) for y in xrange(0, 40, 4)]
+        tree = sptial.RTree.bulkLoad(entries)
+        queries = [sptial.Cuboid((x, 5, 0), (x+7, 12, 0)) for x in xrange(-5, 45, 3)] \
+            + [entries[7][0], sptial.NullCuboid]
+
+        threshold = sptial.RTree.VECTOR_THRESHOLD
+        try:
+            results = []
+            for t in (1, 1000):
+                sptial.RTree.VECTOR_THRESHOLD = t
+                results.append(([list(tree.query(q)) for q in queries],
+                    [list(tree.queryView(q)) for q in queries],
+                    [list(tree.queryPoint(x, 4, 0)) for x in xrange(40)]))
+        finally:
+            sptial.RTree.VECTOR_THRESHOLD = threshold
+
+        self.assertEquals(results[1], results[0])
+        self.assertTrue(entries[7][1] in results[0][0][-2])
+
+
+    def testObjectMap(self):
+        """
+        Tests lookups of entries by identity of objects.
+        """
+
+        a, b = [1], [1]
+        tree = sptial.RTree(minSize = 1, pageSize = 3)
+        objs = [[x] for x in xrange(10)]
+        for x in xrange(10):
+            tree.insert(sptial.Cuboid((x, 0, 0), (x+1, 1, 0)), objs[x])
+        tree.insert(sptial.Cuboid((20, 0, 0), (21, 1, 0)), a)
+        tree.insert(sptial.Cuboid((30, 0, 0), (31, 1, 0)), b)
+
+        self.assertTrue(tree.containsObject(a))
+        self.assertFalse(tree.containsObject([1]))
+
+        # found by identity even if cuboid is stale
+        self.assertTrue(tree.delete(sptial.Cuboid((0, 0, 0), (1, 1, 0)), b))
+        self.assertFalse(tree.containsObject(b))
+        self.assertTrue(tree.containsObject(a))
+        tree.checkParents()
+
+        # equal object is found by cuboid
+        self.assertTrue(tree.delete(sptial.Cuboid((20, 0, 0), (21, 1, 0)), [1]))
+        self.assertFalse(tree.containsObject(a))
+        tree.checkParents()
+
+        copy = deepcopy(tree)
+        copy.checkParents()
+        self.assertFalse(copy.containsObject(objs[5]))
+        for (cuboid, obj) in list(copy.items()):
+            self.assertTrue(copy.containsObject(obj))
+            self.assertTrue(copy.delete(cuboid, obj))
+        self.assertEquals(0, len(copy))
+        self.assertEquals(10, len(tree))
+
+
+    def testNearest(self):
+        """
+        Tests nearest objects query with and without distance function.
+        Configuration minSize=2, pageSize=4
+        """
+
+        points = dict(((x, y), (x + 0.5, y + 0.5)) \
+            for x in xrange(0, 40, 3) for y in xrange(0, 40, 3))
+        tree = sptial.RTree(minSize = 2, pageSize = 4)
+        for (x, y) in points:
+            tree.insert(sptial.Cuboid((x, y, 0), (x+1, y+1, 0)), (x, y))
+
+        def distance(o):
+            px, py = points[o]
+            return math.hypot(px - 10.2, py - 7.4)
+
+        found = list(tree.nearest(10.2, 7.4, 3, None, distance))
+        self.assertEquals([(9, 6), (9, 9), (12, 6)], [o for (d, o) in found])
+        self.assertEquals(sorted(d for (d, o) in found), [d for (d, o) in found])
+
+        # objects whose cuboids contain the point are at distance 0
+        self.assertEquals([(0.0, (9, 6))], list(tree.nearest(9.5, 6.5)))
+
+        found = list(tree.nearest(-10, -10, None, 15))
+        self.assertEquals([(0, 0)], [o for (d, o) in found])
+
+
+    def testRStar(self):
+        """
+        Tests the RTree in R*-tree mode on corridor of parallel tracks.
+        Configuration minSize=2, pageSize=5
+        """
+
+        tree = sptial.RTree(minSize = 2, pageSize = 5, mode = sptial.RTree.RSTAR)
+        entries = [(sptial.Cuboid((x, y, 0), (x+10, y, 0)), (x, y)) \
+            for x in xrange(0, 300, 10) for y in xrange(0, 8, 2)]
+        for (cuboid, obj) in entries:
+            tree.insert(cuboid, obj)
+        tree.checkParents()
+
+        self.assertEquals(120, len(tree))
+        self.assertTrue(tree.level() > 2)
+
+        l = list(tree.query(sptial.Cuboid((95, 1, 0), (105, 3, 0))))
+        self.assertEquals(2, len(l))
+        self.assertTrue((90, 2) in l)
+        self.assertTrue((100, 2) in l)
+
+        for (cuboid, obj) in entries[::2]:
+            tree.delete(cuboid, obj)
+        tree.checkParents()
+
+        self.assertEquals(60, len(tree))
+        self.assertEquals(sorted(o for (c, o) in entries[1::2]), sorted(tree))
+
+
 
 if __name__ == "__main__":
      unittest.main()
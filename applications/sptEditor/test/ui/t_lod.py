@@ -0,0 +1,74 @@
+"""
+Test module for ui.lod
+"""
+
+import unittest
+from sptmath import Vec3
+from model.tracks import Track, Switch
+from model.groups import RailGroup
+from model.scenery import Scenery
+from ui.lod import LodCache, KIND_TRACK, KIND_SWITCH
+
+
+def line(x1, y1, x2, y2):
+    return Track(p1 = Vec3(str(x1), str(y1), "0"), p2 = Vec3(str(x2), str(y2), "0"))
+
+
+class LodCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scenery = Scenery()
+        # slightly bent line of tracks in first sector
+        self.scenery.AddRailTrackings([line(0, 0, 100, 1), line(100, 1, 200, 0),
+            line(200, 0, 300, 0)])
+        self.cache = LodCache(self.scenery, 1000)
+
+
+    def testPolylines(self):
+        self.assertEquals([(KIND_TRACK, [(0.0, 0.0), (300.0, 0.0)])],
+            self.cache.GetPolylines(0.04, -10, -10, 10, 10))
+        self.assertEquals([(KIND_TRACK, [(0.0, 0.0), (100.0, 1.0), (200.0, 0.0), (300.0, 0.0)])],
+            self.cache.GetPolylines(2.0, -10, -10, 10, 10))
+        self.assertEquals([], self.cache.GetPolylines(0.04, 400, 400, 500, 500))
+
+
+    def testSwitch(self):
+        switch = Switch(pc = Vec3("1500", "0", "0"), p1 = Vec3("1600", "0", "0"),
+            p2 = Vec3("1600", "10", "0"))
+        self.scenery.AddRailTracking(switch)
+
+        self.assertEquals([(KIND_SWITCH, [(1500.0, 0.0), (1600.0, 0.0)]),
+            (KIND_SWITCH, [(1500.0, 0.0), (1600.0, 10.0)])],
+            self.cache.GetPolylines(0.04, 1400, -10, 1700, 10))
+
+        # sectors of switches are those of exported scenery
+        self.assertEquals((1, 0), self.cache.GetKey(Switch(pc = Vec3("990", "0", "0"),
+            p1 = Vec3("1100", "0", "0"))))
+
+
+    def testInvalidate(self):
+        self.cache.GetPolylines(0.04, -10, -10, 10, 10)
+
+        track = line(300, 0, 300, 500)
+        self.scenery.AddRailTracking(track)
+        self.assertEquals([(0.0, 0.0, 300.0, 1.0)], self.cache.Invalidate(track))
+        self.assertEquals([(KIND_TRACK, [(0.0, 0.0), (300.0, 0.0), (300.0, 500.0)])],
+            self.cache.GetPolylines(0.04, -10, -10, 10, 10))
+
+        # tracks of groups are aggregated with the rest of sector
+        group = RailGroup()
+        group.insert(line(1300, 0, 1400, 0))
+        self.scenery.AddRailTracking(group)
+        self.assertEquals([], self.cache.Invalidate(group))
+        self.assertEquals([(KIND_TRACK, [(1300.0, 0.0), (1400.0, 0.0)])],
+            self.cache.GetPolylines(0.04, 1000, -10, 2000, 10))
+
+        self.scenery.RemoveRailTracking(track)
+        self.cache.Invalidate(track)
+        self.assertEquals([(KIND_TRACK, [(0.0, 0.0), (300.0, 0.0)])],
+            self.cache.GetPolylines(0.04, -10, -10, 10, 10))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
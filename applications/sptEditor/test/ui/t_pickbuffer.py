@@ -0,0 +1,77 @@
+"""
+Test module for ui.pickbuffer
+"""
+
+import unittest
+from sptmath import Vec3
+from model.tracks import Track
+from ui.editor import EditorBounds
+from ui.views import TrackViewer
+from ui.pickbuffer import PickBuffer, encode
+
+
+class Image:
+    """
+    Image with pixels of the given colour in a column.
+    """
+
+    def __init__(self, x, colour):
+        self.x = x
+        self.colour = colour
+
+    def __pixel(self, x, y):
+        return self.colour if x == self.x else (0, 0, 0)
+
+    def GetRed(self, x, y):
+        return self.__pixel(x, y)[0]
+
+    def GetGreen(self, x, y):
+        return self.__pixel(x, y)[1]
+
+    def GetBlue(self, x, y):
+        return self.__pixel(x, y)[2]
+
+
+
+
+class PickBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.found = []
+        self.bounds = EditorBounds()
+        self.buffer = PickBuffer(100, 8)
+        self.buffer.Validate(self.bounds)
+        # track at origin is in view at (1100, 1080 - 1100)
+        self.track = Track(p1 = Vec3("0", "0", "0"), p2 = Vec3("0", "20", "0"))
+        self.buffer.Get((1.0, 11, 10), lambda key: (Image(0, encode(2)), [None, self.track]))
+
+
+    def find(self, point):
+        self.found.append(point)
+        return "found"
+
+
+    def testPick(self):
+        self.assertEquals(self.track, self.buffer.Pick(self.bounds, (1100, 1090), self.find))
+        self.assertEquals(None, self.buffer.Pick(self.bounds, (1103, 1090), self.find))
+        self.assertEquals([], self.found)
+
+
+    def testStale(self):
+        # tile not rendered
+        self.assertEquals("found", self.buffer.Pick(self.bounds, (1100, 1110), self.find))
+
+        # tile dropped with the element
+        self.buffer.Invalidate(self.bounds, TrackViewer(self.track).GetBox)
+        self.assertEquals("found", self.buffer.Pick(self.bounds, (1100, 1090), self.find))
+
+        # tiles dropped when view coordinates shift
+        self.buffer.Get((1.0, 11, 10), lambda key: (Image(0, encode(2)), [None, self.track]))
+        self.bounds.Update((-5000, -5000))
+        self.assertEquals("found", self.buffer.Pick(self.bounds, (1100, 1090), self.find))
+        self.assertEquals([(1100, 1110), (1100, 1090), (1100, 1090)], self.found)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
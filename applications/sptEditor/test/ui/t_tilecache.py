@@ -0,0 +1,72 @@
+"""
+Test module for ui.tilecache
+"""
+
+import unittest
+from sptmath import Vec3
+from model.tracks import Track
+from ui.editor import EditorBounds
+from ui.views import TrackViewer
+from ui.tilecache import TileCache
+
+
+class TileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rendered = []
+        self.bounds = EditorBounds()
+        self.cache = TileCache(100, 8)
+        self.cache.Validate(self.bounds)
+
+
+    def render(self, key):
+        self.rendered.append(key)
+        return key
+
+
+    def testGet(self):
+        for key in [(1.0, 0, 0), (1.0, 1, 0), (1.0, 0, 0)]:
+            self.assertEquals(key, self.cache.Get(key, self.render))
+        self.assertEquals([(1.0, 0, 0), (1.0, 1, 0)], self.rendered)
+
+        # the least recently used tiles are dropped
+        for x in xrange(2, 9):
+            self.cache.Get((1.0, x, 0), self.render)
+        self.assertEquals(8, len(self.cache))
+        self.cache.Get((1.0, 0, 0), self.render)
+        self.cache.Get((1.0, 1, 0), self.render)
+        self.assertEquals(10, len(self.rendered))
+        self.assertEquals((1.0, 1, 0), self.rendered[-1])
+
+
+    def testValidate(self):
+        self.cache.Get((1.0, 0, 0), self.render)
+        self.cache.Validate(self.bounds)
+        self.assertEquals(1, len(self.cache))
+
+        self.bounds.Update((-5000, -5000))
+        self.cache.Validate(self.bounds)
+        self.assertEquals(0, len(self.cache))
+
+
+    def testInvalidate(self):
+        cache = TileCache(100, 32)
+        cache.Validate(self.bounds)
+        # track at origin is in view at (1100, 1080 - 1100) at scale 1.0
+        # and at (2100, 2060 - 2100) at scale 2.0
+        track = Track(p1 = Vec3("0", "0", "0"), p2 = Vec3("0", "20", "0"))
+        keys = [(1.0, x, y) for x in xrange(9, 13) for y in xrange(9, 13)] \
+            + [(2.0, x, y) for x in xrange(19, 23) for y in xrange(19, 23)]
+        for key in keys:
+            cache.Get(key, self.render)
+
+        cache.Invalidate(self.bounds, TrackViewer(track).GetBox)
+
+        dropped = set((1.0, x, y) for x in (10, 11) for y in (10, 11)) \
+            | set((2.0, x, y) for x in (20, 21) for y in (20, 21))
+        self.assertEquals(set(keys) - dropped, set(cache.tiles.keys()))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,10 +6,26 @@ import unittest
 from sptmath import Vec3
 from model.tracks import *
 from ui.editor import EditorBounds, Scale
-from ui.views import TrackViewer
+from model.groups import RailGroup
+from ui.views import TrackViewer, GroupViewer, DrawContext, GeometryCache
 import wx
 
 
+class RecordingDC:
+
+    def __init__(self):
+        self.lineLists = []
+
+    def GetPen(self):
+        return None
+
+    def SetPen(self, pen):
+        pass
+
+    def DrawLineList(self, lines, pen):
+        self.lineLists.append(lines)
+
+
 class TrackViewerTest(unittest.TestCase):
     
     def testGetSnapData(self):
@@ -69,7 +85,85 @@ class TrackViewerTest(unittest.TestCase):
         self.assertTrue(tv.IsSelectionPossible(bounds, wx.Point(1096, 1090)))
         self.assertTrue(tv.IsSelectionPossible(bounds, wx.Point(1104, 1090)))
 
-    
-    
+
+
+
+class GroupViewerTest(unittest.TestCase):
+
+    def testDraw(self):
+        group = RailGroup()
+        group.insert(Track(p1 = Vec3("0", "0", "0"), p2 = Vec3("0", "20", "0")))
+        group.insert(Track(p1 = Vec3("0", "20", "0"), p2 = Vec3("0", "40", "0")))
+        group.insert(Switch(pc = Vec3("0", "40", "0"), p1 = Vec3("0", "60", "0"),
+            p2 = Vec3("5", "60", "0")))
+        bounds = EditorBounds()
+        bounds.scale = Scale(0.4)
+
+        dc = RecordingDC()
+        GroupViewer(group).Draw(DrawContext(dc, bounds))
+
+        # one call for tracks and one for switch legs
+        self.assertEquals(2, len(dc.lineLists))
+        self.assertEquals([[(500, 484, 500, 476), (500, 484, 502, 476)],
+            [(500, 492, 500, 484), (500, 500, 500, 492)]],
+            sorted(sorted(lines) for lines in dc.lineLists))
+
+
+
+
+class GeometryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.computed = []
+        self.bounds = EditorBounds()
+
+
+    def flatten(self, bounds):
+        self.computed.append(bounds.scale.get())
+        return [[(0, 0), (1, 1)]]
+
+
+    def testGet(self):
+        cache = GeometryCache(2)
+        t1 = Track(p1 = Vec3("0", "0", "0"), p2 = Vec3("0", "20", "0"))
+        t2 = Track(p1 = Vec3("0", "20", "0"), p2 = Vec3("0", "40", "0"))
+
+        cache.Get(t1, self.bounds, self.flatten)
+        cache.Get(t1, self.bounds, self.flatten)
+        self.assertEquals([1.0], self.computed)
+
+        # polylines are kept for each scale
+        self.bounds.scale = Scale(2.0)
+        cache.Get(t1, self.bounds, self.flatten)
+        self.bounds.scale = Scale(1.0)
+        cache.Get(t1, self.bounds, self.flatten)
+        self.assertEquals([1.0, 2.0], self.computed)
+
+        # the least recently used trackings are dropped
+        cache.Get(t2, self.bounds, self.flatten)
+        cache.Get(Track(), self.bounds, self.flatten)
+        self.assertEquals(2, len(cache))
+        cache.Get(t1, self.bounds, self.flatten)
+        self.assertEquals([1.0, 2.0, 1.0, 1.0, 1.0], self.computed)
+
+
+    def testInvalidate(self):
+        cache = GeometryCache()
+        group = RailGroup()
+        t1 = Track(p1 = Vec3("0", "0", "0"), p2 = Vec3("0", "20", "0"))
+        t2 = Track(p1 = Vec3("0", "20", "0"), p2 = Vec3("0", "40", "0"))
+        group.insert(t1)
+        group.insert(t2)
+        t3 = Track(p1 = Vec3("5", "0", "0"), p2 = Vec3("5", "20", "0"))
+        for t in (t1, t2, t3):
+            cache.Get(t, self.bounds, self.flatten)
+
+        cache.Invalidate(group)
+        self.assertEquals(1, len(cache))
+        cache.Invalidate(t3)
+        self.assertEquals(0, len(cache))
+
+
+
 if __name__ == "__main__":
     unittest.main()